@@ -0,0 +1,407 @@
+"""
+组 batch：动态 padding + 按长度分桶采样 + 序列打包
+
+训练样本大多只有几十个 token，按 MAX_LENGTH 统一 padding 时绝大部分计算都花在 pad 上。
+  - DynamicPaddingCollator: 只 padding 到当前 batch 内最长的样本，并统计真实/padding 后的 token 数
+  - LengthBucketSampler:    先随机打乱，再在大块（batch_size × bucket_multiplier）内按长度排序切 batch，
+                            长度相近的样本落在同一个 batch，batch 之间的顺序仍是随机的
+  - MixtureSampler:         按每条样本的采样概率组 epoch（类型比例 / className 均衡，见 sample_mix.py），
+                            可与分桶同时使用
+  - LengthGroupedTrainer:   使用 LengthBucketSampler / MixtureSampler 的 Trainer
+  - PackedDataset / PackingCollator: 把多条样本拼进一个 MAX_LENGTH 窗口（可选），
+                            每条样本的 position_ids 从 0 开始，注意力不跨样本
+"""
+
+import bisect
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from transformers import Trainer
+
+IGNORE_INDEX = -100
+
+
+class DynamicPaddingCollator:
+    """
+    把未 padding 的样本补齐到 batch 内最长长度（右侧 padding）
+
+    参数:
+        pad_token_id: input_ids 的 padding 值
+        pad_to_multiple_of: 长度向上取整到该倍数（GPU 上可设为 8）
+        max_length: 超过该长度的样本会被截断
+    """
+
+    def __init__(self, pad_token_id, pad_to_multiple_of=None, max_length=None):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.max_length = max_length
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        lengths = [len(f['input_ids']) for f in features]
+        width = max(lengths)
+        if self.max_length:
+            width = min(width, self.max_length)
+        if self.pad_to_multiple_of:
+            width = -(-width // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        batch_size = len(features)
+        input_ids = torch.full((batch_size, width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, width), dtype=torch.long)
+        labels = torch.full((batch_size, width), IGNORE_INDEX, dtype=torch.long)
+        for row, feature in enumerate(features):
+            n = min(lengths[row], width)
+            input_ids[row, :n] = torch.as_tensor(feature['input_ids'][:n])
+            attention_mask[row, :n] = 1
+            labels[row, :n] = torch.as_tensor(feature.get('labels', feature['input_ids'])[:n])
+
+        self.real_tokens += int(attention_mask.sum())
+        self.padded_tokens += batch_size * width
+        return {'input_ids': input_ids, 'attention_mask': attention_mask, 'labels': labels}
+
+    @property
+    def efficiency(self):
+        """真实 token / padding 后 token（1.0 表示没有浪费）"""
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+
+class LengthBucketSampler(Sampler):
+    """
+    按长度分桶的随机采样器（产出样本下标，由 DataLoader 按 batch_size 连续切分）
+
+    每个 epoch 的顺序只由 seed 和 epoch 决定，从 checkpoint 恢复时可以精确跳过已训练的 batch。
+    """
+
+    def __init__(self, lengths, batch_size, bucket_multiplier=50, seed=42):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = batch_size * bucket_multiplier
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def batches(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            bucket = order[start:start + self.bucket_size]
+            # 稳定排序，同长度样本保持随机顺序
+            bucket = bucket[np.argsort(-self.lengths[bucket], kind='stable')]
+            batches.extend(bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size))
+        # 最后一个 batch 可能不满，固定放在末尾，其余 batch 打乱
+        tail = batches.pop() if batches and len(batches[-1]) < self.batch_size else None
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+        if tail is not None:
+            batches.append(tail)
+        return batches
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch.tolist()
+
+
+class MixtureSampler(Sampler):
+    """
+    按采样概率流式组 epoch 的采样器（产出样本下标）
+
+    每个 epoch 抽 num_samples 个下标，样本 i 的次数为 floor/ceil(p_i × num_samples)（系统抽样，
+    总数精确，不会像独立抽样那样让小类型忽多忽少）。先随机打乱样本，再按块产出：
+    只被抽到一次的样本留在自己所在的块，被抽到多次的样本的副本均匀分散到各块，
+    因此只有过采样的副本需要额外的下标，同一样本的副本也不会挤在同一个 batch。
+
+    参数:
+        weights: 每条样本的采样权重（sample_mix.mixture_weights），会归一化
+        num_samples: 每个 epoch 的样本数，None 为训练集大小
+        lengths: 每条样本的 token 数，给出时在块内按长度分桶（同 LengthBucketSampler）
+        batch_size / bucket_multiplier: 块大小 = batch_size × bucket_multiplier
+    """
+
+    def __init__(self, weights, num_samples=None, lengths=None, batch_size=1, bucket_multiplier=50, seed=42):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or not len(weights) or weights.min() < 0 or weights.sum() <= 0:
+            raise ValueError("weights 必须是非负且和为正的一维数组")
+        self.probabilities = weights / weights.sum()
+        self.num_samples = int(num_samples or len(weights))
+        self.lengths = None if lengths is None else np.asarray(lengths)
+        self.batch_size = batch_size
+        self.chunk_size = max(batch_size * bucket_multiplier, 1)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.num_samples
+
+    def counts(self, rng, order):
+        """按 order 的顺序做系统抽样，返回每个位置被抽到的次数（总和恰好为 num_samples）"""
+        cumulative = np.cumsum(self.probabilities[order]) * self.num_samples
+        cumulative[-1] = self.num_samples
+        hits = np.floor(cumulative + rng.random()).astype(np.int64)
+        return np.diff(hits, prepend=0)
+
+    def chunks(self):
+        """逐块产出本 epoch 的下标（块内已打乱）"""
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = rng.permutation(len(self.probabilities))
+        counts = self.counts(rng, order)
+        n_chunks = -(-len(order) // self.chunk_size)
+
+        # 多次抽到的样本：副本从随机起点开始均匀分到各块（副本数不超过块数时各在不同的块）
+        multi = np.flatnonzero(counts > 1)
+        copies = np.repeat(order[multi], counts[multi])
+        starts = np.cumsum(counts[multi]) - counts[multi]
+        rank = np.arange(len(copies)) - np.repeat(starts, counts[multi])
+        offset = np.repeat(rng.integers(n_chunks, size=len(multi)), counts[multi])
+        copy_chunks = (offset + rank * n_chunks // np.repeat(counts[multi], counts[multi])) % n_chunks
+        sort = np.argsort(copy_chunks, kind='stable')
+        copies = copies[sort]
+        bounds = np.searchsorted(copy_chunks[sort], np.arange(n_chunks + 1))
+
+        for k in range(n_chunks):
+            span = slice(k * self.chunk_size, (k + 1) * self.chunk_size)
+            chunk = np.concatenate([order[span][counts[span] == 1], copies[bounds[k]:bounds[k + 1]]])
+            rng.shuffle(chunk)
+            yield chunk
+
+    def batches(self):
+        """按 batch 产出；给了 lengths 时块内按长度分桶，不满的 batch 留到下一块"""
+        rng = np.random.default_rng((self.seed + self.epoch, 1))
+        carry = np.empty(0, dtype=np.int64)
+        for chunk in self.chunks():
+            chunk = np.concatenate([carry, chunk])
+            if self.lengths is not None:
+                chunk = chunk[np.argsort(-self.lengths[chunk], kind='stable')]
+            full = len(chunk) - len(chunk) % self.batch_size
+            batches = [chunk[i:i + self.batch_size] for i in range(0, full, self.batch_size)]
+            carry = chunk[full:]
+            for i in rng.permutation(len(batches)):
+                yield batches[i]
+        if len(carry):
+            yield carry
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch.tolist()
+
+
+def padding_efficiency(lengths, batch_size, batches=None, pad_to=None, pad_to_multiple_of=None):
+    """
+    估算 padding 效率：真实 token / padding 后 token
+
+    参数:
+        lengths: 每条样本的 token 数
+        batches: 下标 batch 列表，None 为按原顺序切分
+        pad_to: 固定 padding 长度（如 MAX_LENGTH），None 为动态 padding
+        pad_to_multiple_of: 与 DynamicPaddingCollator 的同名参数一致
+    """
+    lengths = np.asarray(lengths)
+    if batches is None:
+        batches = [np.arange(i, min(i + batch_size, len(lengths))) for i in range(0, len(lengths), batch_size)]
+    real = int(lengths.sum())
+    multiple = pad_to_multiple_of or 1
+    padded = sum(len(b) * (pad_to or -(-int(lengths[b].max()) // multiple) * multiple) for b in batches)
+    return real / padded if padded else 0.0
+
+
+def report_padding(lengths, batch_size, max_length, pad_to_multiple_of=None, sampler=None, seed=42):
+    """打印三种组 batch 方式的 padding 效率"""
+    lengths = np.minimum(np.asarray(lengths), max_length)
+    shuffled = np.random.default_rng(seed).permutation(len(lengths))
+    random_batches = [shuffled[i:i + batch_size] for i in range(0, len(shuffled), batch_size)]
+    sampler = sampler or LengthBucketSampler(lengths, batch_size, seed=seed)
+
+    fixed = padding_efficiency(lengths, batch_size, random_batches, pad_to=max_length)
+    dynamic = padding_efficiency(lengths, batch_size, random_batches, pad_to_multiple_of=pad_to_multiple_of)
+    bucketed = padding_efficiency(lengths, batch_size, sampler.batches(), pad_to_multiple_of=pad_to_multiple_of)
+    print(f"  padding 效率（真实 token / 计算 token）:")
+    print(f"    固定 padding 到 {max_length}: {fixed:.1%}")
+    print(f"    动态 padding:          {dynamic:.1%}")
+    print(f"    动态 padding + 分桶:   {bucketed:.1%}（约 {bucketed / fixed:.1f}x 于固定 padding）")
+    return {'fixed': fixed, 'dynamic': dynamic, 'bucketed': bucketed}
+
+
+class LengthGroupedTrainer(Trainer):
+    """
+    训练集使用 LengthBucketSampler / MixtureSampler 的 Trainer
+
+    参数:
+        lengths: 训练集每条样本的 token 数（TokenizedDataset.lengths）
+        bucket_multiplier: 分桶大小 = batch_size × bucket_multiplier
+        sample_weights: 每条样本的采样权重（sample_mix.mixture_weights），给出时使用 MixtureSampler
+        num_samples: 使用 sample_weights 时每个 epoch 的样本数，None 为训练集大小
+    """
+
+    def __init__(self, *args, lengths=None, bucket_multiplier=50, sample_weights=None, num_samples=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lengths = lengths
+        self.bucket_multiplier = bucket_multiplier
+        self.sample_weights = sample_weights
+        self.num_samples = num_samples
+
+    def _get_train_sampler(self, *args, **kwargs):
+        if self.sample_weights is not None:
+            return MixtureSampler(
+                self.sample_weights,
+                num_samples=self.num_samples,
+                lengths=self.lengths,
+                batch_size=self.args.per_device_train_batch_size,
+                bucket_multiplier=self.bucket_multiplier,
+                seed=self.args.seed,
+            )
+        if self.lengths is None:
+            return super()._get_train_sampler(*args, **kwargs)
+        return LengthBucketSampler(
+            self.lengths,
+            self.args.per_device_train_batch_size,
+            bucket_multiplier=self.bucket_multiplier,
+            seed=self.args.seed,
+        )
+
+    def _get_collator_with_removed_columns(self, data_collator, *args, **kwargs):
+        # seq_lengths 不是模型的参数，但 PackingCollator 需要它，不能被提前删掉
+        if isinstance(data_collator, PackingCollator):
+            return data_collator
+        return super()._get_collator_with_removed_columns(data_collator, *args, **kwargs)
+
+
+# ========== 序列打包 ==========
+def pack_lengths(lengths, max_length):
+    """
+    Best-Fit Decreasing：按长度从长到短，把每条样本放进剩余空间最小且放得下的窗口
+
+    返回窗口列表，每个窗口是样本下标数组（超过 max_length 的样本单独占一个窗口，由截断处理）
+    """
+    lengths = np.minimum(np.asarray(lengths), max_length)
+    bins = []
+    free = []  # 按剩余空间排序的 (剩余空间, 窗口编号)
+    for i in np.argsort(-lengths, kind='stable').tolist():
+        n = int(lengths[i])
+        pos = bisect.bisect_left(free, (n, -1))
+        if pos < len(free):
+            room, b = free.pop(pos)
+            bins[b].append(i)
+        else:
+            room, b = max_length, len(bins)
+            bins.append([i])
+        if room - n > 0:
+            bisect.insort(free, (room - n, b))
+    return [np.asarray(b, dtype=np.int64) for b in bins]
+
+
+class PackedDataset:
+    """
+    把 TokenizedDataset 的样本打包成不超过 max_length 的窗口
+
+    __getitem__ 返回拼接后的 input_ids / labels，以及 seq_lengths（窗口内每条样本的长度），
+    每条样本第一个 token 的 label 置为 IGNORE_INDEX，避免用上一条样本的结尾去预测它。
+    """
+
+    def __init__(self, dataset, max_length):
+        self.dataset = dataset
+        self.max_length = max_length
+        self.bins = pack_lengths(dataset.lengths, max_length)
+
+    def __len__(self):
+        return len(self.bins)
+
+    @property
+    def lengths(self):
+        sample_lengths = np.minimum(self.dataset.lengths, self.max_length)
+        return np.asarray([int(sample_lengths[b].sum()) for b in self.bins])
+
+    def __getitem__(self, i):
+        input_ids, labels, seq_lengths = [], [], []
+        for j in self.bins[i].tolist():
+            sample = self.dataset[j]
+            ids = sample['input_ids'][:self.max_length]
+            input_ids.extend(ids)
+            labels.append(IGNORE_INDEX)
+            labels.extend(sample['labels'][1:len(ids)])
+            seq_lengths.append(len(ids))
+        return {'input_ids': input_ids, 'labels': labels, 'seq_lengths': seq_lengths}
+
+
+class PackingCollator:
+    """
+    打包窗口的 collator
+
+      - flash_attention_2: 整个 batch 拼成一行，只传 position_ids，由 flash-attn 按 position_ids 切分样本
+      - eager / sdpa:      padding 到 batch 内最长窗口，传 4D 块对角因果 mask（加性，0 可见 / dtype 最小值不可见）
+
+    参数:
+        pad_token_id: input_ids 的 padding 值
+        attn_implementation: model.config._attn_implementation
+        dtype: 模型计算精度（4D mask 的 dtype 必须与之一致）
+    """
+
+    def __init__(self, pad_token_id, attn_implementation='sdpa', dtype=torch.float32):
+        self.pad_token_id = pad_token_id
+        self.attn_implementation = attn_implementation
+        self.dtype = dtype
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    @staticmethod
+    def _positions(seq_lengths):
+        return [p for n in seq_lengths for p in range(n)]
+
+    def __call__(self, features):
+        if self.attn_implementation == 'flash_attention_2':
+            batch = {
+                'input_ids': torch.as_tensor([sum((f['input_ids'] for f in features), [])]),
+                'labels': torch.as_tensor([sum((f['labels'] for f in features), [])]),
+                'position_ids': torch.as_tensor([sum((self._positions(f['seq_lengths']) for f in features), [])]),
+            }
+            self.real_tokens += batch['input_ids'].shape[1]
+            self.padded_tokens += batch['input_ids'].shape[1]
+            return batch
+
+        batch_size = len(features)
+        width = max(len(f['input_ids']) for f in features)
+        input_ids = torch.full((batch_size, width), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((batch_size, width), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((batch_size, width), dtype=torch.long)
+        # 先全部不可见，再逐条样本打开下三角；padding 位置只看自己，避免整行被屏蔽
+        mask = torch.full((batch_size, 1, width, width), torch.finfo(self.dtype).min, dtype=self.dtype)
+        causal = torch.tril(torch.ones((width, width), dtype=torch.bool))
+        diagonal = torch.arange(width)
+        for row, feature in enumerate(features):
+            n = len(feature['input_ids'])
+            input_ids[row, :n] = torch.as_tensor(feature['input_ids'])
+            labels[row, :n] = torch.as_tensor(feature['labels'])
+            position_ids[row, :n] = torch.as_tensor(self._positions(feature['seq_lengths']))
+            start = 0
+            for length in feature['seq_lengths']:
+                end = start + length
+                mask[row, 0, start:end, start:end].masked_fill_(causal[:length, :length], 0)
+                start = end
+            mask[row, 0, diagonal[n:], diagonal[n:]] = 0
+            self.real_tokens += n
+        self.padded_tokens += batch_size * width
+        return {'input_ids': input_ids, 'labels': labels, 'position_ids': position_ids, 'attention_mask': mask}
+
+    @property
+    def efficiency(self):
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+
+def report_packing(lengths, packed, batch_size, gradient_accumulation_steps):
+    """打印打包前后每个 epoch 的样本/窗口数和优化步数"""
+    # 与 Trainer 的计算方式一致：batch 数整除梯度累积步数
+    steps = max(-(-len(lengths) // batch_size) // gradient_accumulation_steps, 1)
+    packed_steps = max(-(-len(packed) // batch_size) // gradient_accumulation_steps, 1)
+    fill = packed.lengths.sum() / (len(packed) * packed.max_length)
+    print(f"  序列打包: {len(lengths)} 条样本 -> {len(packed)} 个 {packed.max_length} token 窗口"
+          f"（平均填充率 {fill:.1%}，每窗口约 {len(lengths) / len(packed):.1f} 条）")
+    print(f"  每个 epoch 的优化步数: {steps} -> {packed_steps}")
+    return {'steps_per_epoch': steps, 'packed_steps_per_epoch': packed_steps, 'fill': fill}
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+多 LoRA 基准：内存占用和 A/B 对比的生成耗时
+
+对比的方式（每种在新的子进程中运行）:
+  - separate:  每个 LoRA 各加载一份基座（旧版 test_model.py 对比多个 LoRA 的方式），逐个模型生成
+  - switch:    一个基座 + 全部 LoRA，按 LoRA 分组，每组单独成批生成
+  - mixed:     一个基座 + 全部 LoRA，所有 LoRA 的请求放在同一批里生成（peft adapter_names）
+
+指标:
+  - 内存: 加载完成后进程的 RSS
+  - 生成: 每个 LoRA 对同一组提示各生成一遍（贪心，固定 token 数）的总耗时
+
+用法（CPU + 小模型）:
+  python benchmarks/bench_adapters.py --base-model /path/to/tiny-qwen \\
+      --adapters r5=./css_assistant_model r16=/tmp/lora_r16 r8=./output_model
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROMPTS = ["圆角", "文字居中", "透明背景", "创建一个圆角边框的按钮样式"]
+
+
+def rss_mb():
+    import psutil
+
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def worker(args, adapters):
+    """子进程：加载模型并测量，结果以 JSON 打印到 stdout"""
+    sys.path.insert(0, ROOT)
+    from inference import Generator, load_adapters, load_model
+
+    start = time.perf_counter()
+    if args.worker == 'separate':
+        generators = {}
+        for name, path in adapters.items():
+            model, tokenizer = load_model(args.base_model, path)
+            generators[name] = Generator(model, tokenizer)
+    else:
+        model, tokenizer = load_model(args.base_model)
+        generator = Generator(load_adapters(model, adapters), tokenizer)
+    load_seconds = time.perf_counter() - start
+    memory = rss_mb()
+
+    start = time.perf_counter()
+    if args.worker == 'separate':
+        for generator in generators.values():
+            generator.stop_ids = set()  # 固定解码长度，不因 <|im_end|> 提前停止
+            generator.generate(PROMPTS, max_new_tokens=args.tokens)
+    elif args.worker == 'switch':
+        generator.stop_ids = set()
+        for name in adapters:
+            generator.generate(PROMPTS, max_new_tokens=args.tokens, adapters=[name] * len(PROMPTS))
+    else:
+        generator.stop_ids = set()
+        names = [name for name in adapters for _ in PROMPTS]
+        generator.generate(PROMPTS * len(adapters), max_new_tokens=args.tokens, adapters=names)
+    print(json.dumps({'load_s': load_seconds, 'rss_mb': memory, 'generate_s': time.perf_counter() - start}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多 LoRA 基准")
+    parser.add_argument('--base-model', default='Qwen/Qwen2.5-1.5B-Instruct')
+    parser.add_argument('--adapters', nargs='+', required=True, metavar='NAME=PATH')
+    parser.add_argument('--tokens', type=int, default=32, help='每条提示解码的 token 数')
+    parser.add_argument('--configs', default='separate,switch,mixed')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    adapters = dict(spec.split('=', 1) for spec in args.adapters)
+
+    if args.worker:
+        worker(args, adapters)
+        return
+
+    print(f"{len(adapters)} 个 LoRA × {len(PROMPTS)} 条提示，每条解码 {args.tokens} token")
+    print(f"{'方式':<10} {'加载(s)':>8} {'RSS(MB)':>9} {'生成(s)':>8}")
+    for name in args.configs.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--worker', name, '--base-model', args.base_model,
+                   '--tokens', str(args.tokens), '--adapters', *args.adapters]
+        output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:<10} {r['load_s']:>8.2f} {r['rss_mb']:>9.0f} {r['generate_s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
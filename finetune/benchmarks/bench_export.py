@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+合并导出基准：冷启动时间和解码吞吐（tokens/sec）
+
+对比的加载方式（每次在新的子进程中运行，计入 import 时间）:
+  - adapter:      基座模型 + PeftModel.from_pretrained（旧版 test_model.py 的方式）
+  - merged:       export_model.py 导出的合并模型
+  - merged-int8:  export_model.py --int8 导出的合并模型（CPU）
+
+指标:
+  - 冷启动: 进程开始 → 第一个 token 生成（import + 加载权重 + 前缀 KV cache + 首 token）
+  - tokens/s: 单条请求贪心解码固定数量的 token（忽略 <|im_end|>）
+
+用法（CPU + 小模型）:
+  python export_model.py --base-model /path/to/tiny-qwen --adapter ./output_model --output /tmp/merged
+  python export_model.py --base-model /path/to/tiny-qwen --adapter ./output_model --output /tmp/merged-int8 --int8
+  python benchmarks/bench_export.py --base-model /path/to/tiny-qwen --adapter ./output_model \\
+      --merged /tmp/merged --merged-int8 /tmp/merged-int8
+"""
+
+import time
+
+START = time.perf_counter()
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROMPT = "创建一个圆角边框的按钮样式"
+
+
+def worker(args):
+    """子进程：加载模型并测量，结果以 JSON 打印到 stdout"""
+    sys.path.insert(0, ROOT)
+    from inference import Generator, load_model
+
+    if args.worker == 'adapter':
+        model, tokenizer = load_model(args.base_model, args.adapter)
+    else:
+        model, tokenizer = load_model(args.merged if args.worker == 'merged' else args.merged_int8)
+    generator = Generator(model, tokenizer)
+    load_seconds = time.perf_counter() - START
+    generator.generate([PROMPT], max_new_tokens=1)
+    first_token_seconds = time.perf_counter() - START
+
+    generator.stop_ids = set()  # 固定解码长度，不因 <|im_end|> 提前停止
+    start = time.perf_counter()
+    generator.generate([PROMPT], max_new_tokens=args.tokens)
+    decode_seconds = time.perf_counter() - start
+    print(json.dumps({
+        'load_s': load_seconds,
+        'first_token_s': first_token_seconds,
+        'tokens_per_s': args.tokens / decode_seconds,
+    }))
+
+
+def run_config(name, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker', name,
+        '--base-model', args.base_model, '--adapter', args.adapter,
+        '--merged', args.merged, '--merged-int8', args.merged_int8, '--tokens', str(args.tokens),
+    ]
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合并导出基准")
+    parser.add_argument('--base-model', default='Qwen/Qwen2.5-1.5B-Instruct')
+    parser.add_argument('--adapter', default='./css_assistant_model')
+    parser.add_argument('--merged', default='./css_assistant_merged')
+    parser.add_argument('--merged-int8', default='./css_assistant_merged-int8')
+    parser.add_argument('--tokens', type=int, default=64, help='测吞吐时解码的 token 数')
+    parser.add_argument('--repeat', type=int, default=3, help='每种方式运行次数（取中位数）')
+    parser.add_argument('--configs', default='adapter,merged,merged-int8')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    print(f"解码 {args.tokens} token，每种方式 {args.repeat} 次取中位数")
+    print(f"{'方式':<13} {'加载(s)':>8} {'冷启动到首token(s)':>18} {'tokens/s':>9}")
+    for name in args.configs.split(','):
+        r = run_config(name, args)
+        print(f"{name:<13} {r['load_s']:>8.2f} {r['first_token_s']:>18.2f} {r['tokens_per_s']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+类名检索快速路径基准：命中率、准确率和查询延迟
+
+从 training_data.json 随机抽样（instruction / input 作为查询，output 作为参考答案），
+用 css_index.CssIndex 回答:
+  - 命中率: 索引直接作答（不调用模型）的比例
+  - 准确率: 命中的样本中回复与参考答案一致的比例（多个候选类名时参考答案在候选中即算对）
+  - 延迟:   单次 lookup 的 p50 / p99（微秒），命中和未命中分开统计
+
+用法:
+  python benchmarks/bench_index.py
+  python benchmarks/bench_index.py --samples 5000 --seed 1
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from css_index import CssIndex  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def is_correct(match, output):
+    if match.answer == output:
+        return True
+    return len(match.class_names) > 1 and output in {
+        f"{prefix}{name}" for name in match.class_names for prefix in ('', '使用类名: ')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="类名检索快速路径基准")
+    parser.add_argument('--classes', default=os.path.join(ROOT, 'css_classes.json'))
+    parser.add_argument('--data', default=os.path.join(ROOT, 'training_data.json'))
+    parser.add_argument('--samples', type=int, default=2000, help='抽样条数（0 为全部）')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = CssIndex.from_file(args.classes)
+    print(f"索引: {len(index)} 个类，构建 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    with open(args.data, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if args.samples and args.samples < len(data):
+        data = random.Random(args.seed).sample(data, args.samples)
+
+    hit_latency, miss_latency = [], []
+    by_kind = defaultdict(lambda: [0, 0])  # kind -> [命中数, 正确数]
+    for item in data:
+        start = time.perf_counter()
+        match = index.lookup(item['instruction'], item.get('input', ''))
+        micros = (time.perf_counter() - start) * 1e6
+        if match is None:
+            miss_latency.append(micros)
+            continue
+        hit_latency.append(micros)
+        by_kind[match.kind][0] += 1
+        by_kind[match.kind][1] += is_correct(match, item['output'])
+
+    hits = sum(v[0] for v in by_kind.values())
+    correct = sum(v[1] for v in by_kind.values())
+    print(f"样本: {len(data)}，命中 {hits}（{hits / len(data):.1%}），"
+          f"命中准确率 {correct / max(hits, 1):.1%}，交给模型 {len(miss_latency)}")
+    print(f"\n{'方式':<12} {'命中':>6} {'准确率':>8}")
+    for kind, (count, ok) in sorted(by_kind.items(), key=lambda x: -x[1][0]):
+        print(f"{kind:<12} {count:>6} {ok / count:>8.1%}")
+    print(f"\n{'延迟(µs)':<12} {'p50':>8} {'p99':>8}")
+    print(f"{'命中':<12} {percentile(hit_latency, 0.5):>8.1f} {percentile(hit_latency, 0.99):>8.1f}")
+    print(f"{'未命中':<12} {percentile(miss_latency, 0.5):>8.1f} {percentile(miss_latency, 0.99):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
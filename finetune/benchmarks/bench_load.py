@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+训练数据加载基准：启动耗时和峰值内存（RSS）
+
+对比的加载方式:
+  - json+datasets: 当前训练脚本的路径，load_dataset("json")（每次使用全新缓存目录，模拟缓存失效）
+  - json:          json.load 整个 indent=2 的 JSON
+  - jsonl-shards:  dataset_store.JsonlShardReader（mmap + 偏移索引）
+  - arrow-shards:  dataset_store.load_training_dataset（Arrow 分片内存映射）
+
+每种方式在独立子进程中运行，加载后随机访问 1000 条，统计耗时和子进程峰值 RSS。
+
+用法:
+  python benchmarks/bench_load.py                       # 10k / 100k / 1M
+  python benchmarks/bench_load.py --sizes 10000,100000
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+MODES = ['json+datasets', 'json', 'jsonl-shards', 'arrow-shards']
+PROBES = 1000  # 加载后随机访问的条数
+
+
+def make_samples(source, size):
+    """循环 training_data.json 并给 instruction 加后缀，得到 size 条互不相同的样本"""
+    with open(source, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    for i in range(size):
+        item = base[i % len(base)]
+        yield {
+            'instruction': f"{item['instruction']} #{i // len(base)}",
+            'input': item['input'],
+            'output': item['output'],
+        }
+
+
+def prepare(source, size, work_dir):
+    """写出同一份数据的各种格式，返回 {mode: path}"""
+    from dataset_store import write_shards
+
+    json_path = os.path.join(work_dir, 'data.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(list(make_samples(source, size)), f, ensure_ascii=False, indent=2)
+    write_shards(make_samples(source, size), os.path.join(work_dir, 'jsonl'), 'jsonl')
+    write_shards(make_samples(source, size), os.path.join(work_dir, 'arrow'), 'arrow')
+    return {
+        'json+datasets': json_path,
+        'json': json_path,
+        'jsonl-shards': os.path.join(work_dir, 'jsonl'),
+        'arrow-shards': os.path.join(work_dir, 'arrow'),
+    }
+
+
+def worker(mode, path):
+    """子进程：加载并随机访问，打印 JSON 结果"""
+    if mode == 'json+datasets':
+        from datasets import load_dataset
+    elif mode == 'arrow-shards':
+        import datasets  # noqa: F401  导入耗时不计入加载时间
+        from dataset_store import load_training_dataset
+    else:
+        from dataset_store import JsonlShardReader
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    if mode == 'json+datasets':
+        cache_dir = tempfile.mkdtemp(prefix='bench_load_cache_')
+        data = load_dataset('json', data_files=path, split='train', cache_dir=cache_dir)
+    elif mode == 'json':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    elif mode == 'jsonl-shards':
+        data = JsonlShardReader(path)
+    else:
+        data = load_training_dataset(path)
+    load_seconds = time.perf_counter() - start
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(PROBES):
+        data[rng.randrange(len(data))]
+    probe_seconds = time.perf_counter() - start
+
+    if mode == 'json+datasets':
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'probe_us': probe_seconds / PROBES * 1e6,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'baseline_rss_mb': baseline / 1024,
+    }))
+
+
+def run_self(*argv):
+    """在子进程中运行本脚本（Linux 上 ru_maxrss 会跨 exec 继承，所以主进程必须保持很小）"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *argv],
+        check=True, capture_output=True, text=True, cwd=ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练数据加载基准")
+    parser.add_argument('--source', default=os.path.join(ROOT, 'training_data.json'))
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', nargs=2, metavar=('SIZE', 'DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+    if args.prepare:
+        print(json.dumps(prepare(args.source, int(args.prepare[0]), args.prepare[1])))
+        return
+
+    modes = args.modes.split(',')
+    print(f"{'样本数':>9} {'格式':<14} {'加载(s)':>9} {'随机读(µs)':>11} {'峰值RSS(MB)':>12} {'增量(MB)':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        work_dir = tempfile.mkdtemp(prefix='bench_load_')
+        try:
+            paths = run_self('--source', args.source, '--prepare', str(size), work_dir)
+            for mode in modes:
+                try:
+                    r = run_self('--worker', mode, paths[mode])
+                except subprocess.CalledProcessError as e:
+                    print(f"{size:>9} {mode:<14} 失败: {e.stderr.strip().splitlines()[-1]}")
+                    continue
+                print(f"{size:>9} {mode:<14} {r['load_seconds']:>9.3f} {r['probe_us']:>11.1f} "
+                      f"{r['peak_rss_mb']:>12.1f} {r['peak_rss_mb'] - r['baseline_rss_mb']:>9.1f}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+描述解析微基准：旧版多次正则扫描 vs 单次解析 + 缓存
+
+把 css_classes.json 放大 N 倍（className 加后缀保证唯一），分别统计：
+  - legacy: 旧版 generate_training_samples（6+ 次未预编译的 re 调用）
+  - parsed: 新版单次解析（冷缓存，每个 className 首次出现）
+  - cached: 新版在原始规模上重复生成（命中 className 缓存）
+
+用法:
+  python benchmarks/bench_parse.py              # 默认放大 100 倍
+  python benchmarks/bench_parse.py --scale 10
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import process_data  # noqa: E402
+
+
+# ========== 旧版实现（仅用于对比） ==========
+def legacy_extract_css_code(description):
+    match = re.search(r'\.[\w-]+.*?\{[^}]+\}', description, re.DOTALL)
+    return match.group(0) if match else None
+
+
+def legacy_generate_training_samples(item):
+    className = item['className']
+    description = item['description']
+    css_code = legacy_extract_css_code(description)
+    samples = []
+
+    clean_desc = re.sub(r'属性详情如下:.*', '', description).strip()
+    clean_desc = re.sub(r'\.[\w-]+.*?\{[^}]+\}', '', clean_desc, flags=re.DOTALL).strip()
+    if clean_desc:
+        samples.append({"instruction": clean_desc, "input": "", "output": className})
+
+    if '设置' in description:
+        setting_match = re.search(r'设置(.+?)(?:属性详情|$)', description)
+        if setting_match:
+            setting = setting_match.group(1).strip()
+            samples.append({"instruction": f"如何{setting}？", "input": "", "output": f"使用类名: {className}"})
+            samples.append({"instruction": f"我想{setting}", "input": "", "output": className})
+
+    if css_code:
+        samples.append({
+            "instruction": f"这段CSS代码对应的类名是什么？\n```css\n{css_code}\n```",
+            "input": "",
+            "output": className
+        })
+        css_properties = re.findall(r'([\w-]+):\s*([^;]+);', css_code)
+        if css_properties:
+            prop_desc = ', '.join([f"{prop}: {value}" for prop, value in css_properties])
+            samples.append({"instruction": f"生成一个包含 {prop_desc} 样式的类名", "input": "", "output": className})
+
+    explanation = clean_desc if clean_desc else description
+    samples.append({"instruction": f"类名 {className} 的作用是什么？", "input": "", "output": explanation})
+    samples.append({"instruction": f"解释一下 {className} 这个类", "input": "", "output": explanation})
+
+    keywords = []
+    if 'bg-' in className or '背景' in description:
+        keywords.append('background')
+    if 'radius' in className or '圆角' in description:
+        keywords.append('border-radius')
+    if 'before' in className or 'after' in className:
+        keywords.append('伪元素')
+    if 'transparent' in className or '透明' in description:
+        keywords.append('transparent')
+    for keyword in keywords:
+        samples.append({"instruction": f"有没有关于{keyword}的类名？", "input": "", "output": f"可以使用 {className}"})
+
+    samples.append({
+        "instruction": random.choice(process_data.CODE_QUESTIONS),
+        "input": explanation,
+        "output": f'<div className="{className}">内容</div>'
+    })
+
+    if '背景色' in description:
+        color_match = re.search(r'背景色为(.+?)(?:,|$|属性)', description)
+        if color_match:
+            samples.append({"instruction": f"{color_match.group(1).strip()}背景", "input": "", "output": className})
+    if '圆角' in description:
+        samples.append({"instruction": "圆角", "input": "", "output": className})
+    return samples
+
+
+def time_per_item(fn, items, repeat):
+    """返回最快一轮的每条耗时（微秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        process_data.parse_description.cache_clear()
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="描述解析微基准")
+    parser.add_argument('--input', default='css_classes.json')
+    parser.add_argument('--scale', type=int, default=100, help='数据放大倍数')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        raw_data = json.load(f)
+    items = [
+        {'className': f"{item['className']}-{i}", 'description': item['description']}
+        for i in range(args.scale)
+        for item in raw_data
+    ]
+
+    print(f"📊 样本规模: {len(raw_data)} 类 × {args.scale} = {len(items)} 类")
+    legacy = time_per_item(legacy_generate_training_samples, items, args.repeat)
+    parsed = time_per_item(process_data.generate_training_samples, items, args.repeat)
+
+    # 缓存命中：原始规模重复生成 scale 次，只有第一轮需要解析
+    process_data.parse_description.cache_clear()
+    start = time.perf_counter()
+    for _ in range(args.scale):
+        for item in raw_data:
+            process_data.generate_training_samples(item)
+    cached = (time.perf_counter() - start) / len(items) * 1e6
+
+    print(f"  legacy (多次 re 扫描): {legacy:7.2f} µs/类")
+    print(f"  parsed (单次解析):     {parsed:7.2f} µs/类  ({legacy / parsed:.2f}x)")
+    print(f"  cached (命中缓存):     {cached:7.2f} µs/类  ({legacy / cached:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+语义检索基准：索引构建时间、查询延迟、recall@k
+
+标注对取自 training_data.json 中回复为类名的样本（"X" / "使用类名: X" / "可以使用 X" / <div className="X">），
+查询为 instruction（代码生成场景为 input），标签为 X。
+"释义" 子集去掉与某个类描述完全相同的查询，但仍是生成模板套出的问法，与描述的字面重合很多。
+"手写" 为 PARAPHRASE_QUERIES 中人工写的自由描述（与描述几乎没有字面重合），单独报告，
+衡量的是编码器能否理解语义，而不是字面匹配。
+
+另外用合成数据（聚类分布的随机向量）对比大规模下 flat 和 IVF 的延迟和 IVF 的 recall（相对 flat）。
+
+用法:
+  python benchmarks/bench_semantic.py                               # 默认编码器（模型 hidden state 平均池化）
+  python benchmarks/bench_semantic.py --encoder hash                 # 字符 n-gram 哈希（兜底，不需要模型）
+  python benchmarks/bench_semantic.py --encoder /path/to/model --queries 500
+  python benchmarks/bench_semantic.py --synthetic 200000 --dim 256
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from semantic_index import (DEFAULT_ENCODER, VectorIndex, load_encoder, load_or_build,  # noqa: E402
+                            normalize_rows, train_ivf)
+
+K_VALUES = (1, 5, 10)
+_DIV_RE = re.compile(r'^<div className="([^"]+)">内容</div>$')
+
+# 手写的自由描述 -> 可接受的类名（描述与实际样式不一致或有等价类时列出多个）
+PARAPHRASE_QUERIES = [
+    ("文字太长显示省略号", ("at-center", "at-ellipsis-lines")),
+    ("一行放不下的字末尾变成点点点", ("at-center", "at-ellipsis-lines")),
+    ("超过两行的内容后面省略掉", ("webkit-line-clamp-2", "at-ellipsis-multi-lines")),
+    ("鼠标移上去变成小手", ("cursor-pointer",)),
+    ("文字水平居中", ("text-center",)),
+    ("很长的英文单词自动折行，别把容器撑破", ("at-word-break", "word-break-all", "word-break-word")),
+    ("让伪元素不挡住点击", ("pointer-events-none-after", "pointer-events-none-before")),
+    ("字体加粗", ("font-bold",)),
+    ("给 iPhone 底部的小黑条留出空间", ("at-pb-safe",)),
+    ("把头像裁成圆形", ("radius-50p",)),
+    ("子元素竖着排", ("flex-column",)),
+    ("内容在盒子里上下左右都居中", ("at-center", "justify-content-center", "align-items-center")),
+    ("文字不要换行", ("white-space-nowrap",)),
+    ("不让用户选中文字", ("user-select-none",)),
+    ("内容太多时竖向出现滚动条", ("overflow-y-scroll",)),
+    ("占满剩下的空间", ("flex-1",)),
+    ("宽度撑满父元素", ("w-100p",)),
+    ("高度和父元素一样高", ("h-100p",)),
+    ("内边距和边框算在宽度里面", ("border-box",)),
+    ("去掉边框", ("border-none", "border-style-none")),
+    ("背景透明", ("bg-transparent", "bg-c-transparent")),
+    ("重要提醒用的红色字", ("c-ed4343",)),
+    ("次要信息的浅灰色小字", ("c-999999",)),
+    ("正文用的黑色字", ("c-333333",)),
+    ("独占一行显示", ("block",)),
+    ("用弹性布局排版", ("flex",)),
+    ("图标和文字垂直方向对齐中线", ("vertical-middle",)),
+    ("绝对定位后往左上挪自身一半来居中", ("transform-translate-n50p-n50p",)),
+    ("放到其他元素下面一层", ("z-index-n1",)),
+    ("变成半透明", ("opacity-0d5",)),
+    ("子元素一行放不下时自动换到下一行", ("flex-wrap",)),
+]
+
+
+def label_of(output, class_names):
+    for prefix in ('使用类名: ', '可以使用 '):
+        if output.startswith(prefix):
+            output = output[len(prefix):]
+    match = _DIV_RE.match(output)
+    if match:
+        output = match.group(1)
+    return output if output in class_names else None
+
+
+def labeled_pairs(data_path, class_names, descriptions):
+    with open(data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    pairs = []
+    for item in data:
+        label = label_of(item['output'], class_names)
+        if label is None:
+            continue
+        query = item['input'] or item['instruction']
+        pairs.append((query, label, query.strip() not in descriptions))
+    return pairs
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def recall(results, labels, k):
+    """labels 的元素为类名或可接受的类名元组"""
+    hits = 0
+    for row, label in zip(results, labels):
+        accepted = (label,) if isinstance(label, str) else label
+        hits += any(r.class_name in accepted for r in row[:k])
+    return hits / max(len(labels), 1)
+
+
+def bench_catalog(args):
+    encoder = load_encoder(args.encoder)
+    cache_root = tempfile.mkdtemp(prefix='semantic_bench_')
+    try:
+        for index_type in args.index_types.split(','):
+            start = time.perf_counter()
+            index = load_or_build(args.classes, encoder, cache_root, index_type)
+            build = time.perf_counter() - start
+
+            pairs = labeled_pairs(args.data, set(index.class_names), set(index.descriptions))
+            if args.queries and args.queries < len(pairs):
+                pairs = random.Random(args.seed).sample(pairs, args.queries)
+            latencies, results = [], []
+            for query, _, _ in pairs:
+                start = time.perf_counter()
+                results.append(index.search(query, max(K_VALUES)))
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            labels = [label for _, label, _ in pairs]
+            free = [i for i, (_, _, paraphrase) in enumerate(pairs) if paraphrase]
+            written = [(query, label) for query, label in PARAPHRASE_QUERIES
+                       if any(name in index.class_names for name in label)]
+            written_results = index.search_batch([query for query, _ in written], max(K_VALUES))
+            print(f"\n[{encoder.name} / {index.vectors.kind}] {len(index)} 个类，构建 {build:.2f}s，"
+                  f"查询 p50 {percentile(latencies, 0.5):.2f}ms / p99 {percentile(latencies, 0.99):.2f}ms（含编码）")
+            print(f"  {'子集':<8} {'样本':>6} " + ' '.join(f"{'R@' + str(k):>7}" for k in K_VALUES))
+            for name, rows in (('全部', range(len(pairs))), ('释义', free)):
+                sub_results = [results[i] for i in rows]
+                sub_labels = [labels[i] for i in rows]
+                print(f"  {name:<8} {len(sub_labels):>6} "
+                      + ' '.join(f"{recall(sub_results, sub_labels, k):>7.1%}" for k in K_VALUES))
+            written_labels = [label for _, label in written]
+            print(f"  {'手写':<8} {len(written):>6} "
+                  + ' '.join(f"{recall(written_results, written_labels, k):>7.1%}" for k in K_VALUES))
+    finally:
+        shutil.rmtree(cache_root, ignore_errors=True)
+
+
+def bench_synthetic(args):
+    """聚类分布的随机向量：flat 与 IVF 的构建/查询耗时，IVF 相对 flat 的 recall@10"""
+    rng = np.random.default_rng(args.seed)
+    centers = normalize_rows(rng.standard_normal((args.synthetic // 1000, args.dim)))
+    noise = lambda n: rng.standard_normal((n, args.dim)) / np.sqrt(args.dim)  # noqa: E731
+    vectors = normalize_rows(centers[rng.integers(len(centers), size=args.synthetic)] + noise(args.synthetic))
+    queries = normalize_rows(vectors[rng.integers(args.synthetic, size=200)] + 0.5 * noise(200))
+
+    flat = VectorIndex(vectors)
+    start = time.perf_counter()
+    nlist = int(4 * np.sqrt(args.synthetic))
+    ivf = VectorIndex(vectors, *train_ivf(vectors, nlist))
+    build = time.perf_counter() - start
+    print(f"\n[合成数据] {args.synthetic} 个向量，维度 {args.dim}，IVF {nlist} 个桶（训练 {build:.1f}s）")
+    print(f"  {'索引':<12} {'p50(ms)':>8} {'p99(ms)':>8} {'R@10':>7}")
+
+    exact = flat.search(queries, 10)[1]
+    for name, index in [('flat', flat)] + [(f'ivf-{p}', ivf) for p in (4, 8, 16, 32)]:
+        if name.startswith('ivf'):
+            index.nprobe = int(name.split('-')[1])
+        latencies, found = [], []
+        for row in range(len(queries)):
+            start = time.perf_counter()
+            found.append(index.search(queries[row:row + 1], 10)[1][0])
+            latencies.append((time.perf_counter() - start) * 1000)
+        hit = np.mean([len(set(f) & set(e)) / 10 for f, e in zip(found, exact)])
+        print(f"  {name:<12} {percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} {hit:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语义检索基准")
+    parser.add_argument('--classes', default=os.path.join(ROOT, 'css_classes.json'))
+    parser.add_argument('--data', default=os.path.join(ROOT, 'training_data.json'))
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help='hash 为字符 n-gram 哈希兜底')
+    parser.add_argument('--index-types', default='flat,ivf')
+    parser.add_argument('--queries', type=int, default=2000, help='抽样查询数（0 为全部）')
+    parser.add_argument('--synthetic', type=int, default=200_000, help='合成数据规模（0 跳过）')
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    bench_catalog(args)
+    if args.synthetic:
+        bench_synthetic(args)
+
+
+if __name__ == "__main__":
+    main()
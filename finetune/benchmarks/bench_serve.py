@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+推理服务基准：p50 / p99 延迟和吞吐（requests/sec）
+
+对比的服务配置（每种在独立的 serve.py 子进程中运行）:
+  - single:         每次一个请求，不复用前缀 KV cache（等价于旧版 test_model.py 的逐条生成）
+  - prefix-cache:   每次一个请求，复用系统提示前缀的 KV cache
+  - batched:        动态组 batch + 前缀 KV cache
+  - cached:         batched + 生成结果缓存（--distinct 控制提示的重复程度）
+
+提示取自 training_data.json 的 instruction，并发客户端持续发送请求。
+除 cached 外都关闭生成结果缓存，只测模型路径。
+
+用法（CPU + 小模型）:
+  python benchmarks/bench_serve.py --base-model /path/to/tiny-qwen --adapter none
+  python benchmarks/bench_serve.py --requests 400 --concurrency 16 --max-new-tokens 32
+  python benchmarks/bench_serve.py --configs batched,cached --distinct 50   # 400 个请求只有 50 个不同的提示
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CONFIGS = {
+    'single': ['--max-batch-size', '1', '--no-prefix-cache', '--cache-size', '0'],
+    'prefix-cache': ['--max-batch-size', '1', '--cache-size', '0'],
+    'batched': ['--max-batch-size', '8', '--cache-size', '0'],
+    'cached': ['--max-batch-size', '8'],
+}
+WARMUP = 4
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def wait_ready(url, process, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("serve.py 启动失败")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("serve.py 启动超时")
+
+
+def load_prompts(path, count, distinct=0):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    prompts = list(dict.fromkeys(item['instruction'] for item in data))
+    if distinct:
+        prompts = prompts[:distinct]
+    return [prompts[i % len(prompts)] for i in range(count)]
+
+
+def run_config(name, args, prompts):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    command = [
+        sys.executable, os.path.join(ROOT, 'serve.py'),
+        '--base-model', args.base_model, '--adapter', args.adapter, '--merged', args.merged,
+        '--port', str(port), '--no-index', *CONFIGS[name],  # 只测模型路径
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url, process)
+        payload = {'max_new_tokens': args.max_new_tokens, 'temperature': 0}
+        for i in range(WARMUP):
+            post(f"{url}/generate", dict(payload, prompt=f"预热 {i}"))
+
+        def one(prompt):
+            start = time.perf_counter()
+            result = post(f"{url}/generate", dict(payload, prompt=prompt))
+            return time.perf_counter() - start, result['batch_size'], result['source'] == 'cache'
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(one, prompts))
+        wall = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies = sorted(r[0] for r in results)
+    return {
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        'rps': len(prompts) / wall,
+        'avg_batch': sum(r[1] for r in results) / len(results),
+        'cache_hit': sum(r[2] for r in results) / len(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理服务基准")
+    parser.add_argument('--base-model', default='Qwen/Qwen2.5-1.5B-Instruct')
+    parser.add_argument('--adapter', default='none')
+    parser.add_argument('--merged', default='none', help='export_model.py 导出的合并模型目录')
+    parser.add_argument('--data', default=os.path.join(ROOT, 'training_data.json'))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--distinct', type=int, default=0, help='只用 N 个不同的提示循环发送（0 为尽量不重复）')
+    parser.add_argument('--configs', default='single,prefix-cache,batched')
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.data, args.requests, args.distinct)
+    print(f"{args.requests} 个请求，并发 {args.concurrency}，max_new_tokens={args.max_new_tokens}")
+    print(f"{'配置':<14} {'p50(ms)':>9} {'p99(ms)':>9} {'req/s':>8} {'平均batch':>9} {'缓存命中':>8}")
+    for name in args.configs.split(','):
+        r = run_config(name, args, prompts)
+        print(f"{name:<14} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['rps']:>8.1f} {r['avg_batch']:>9.2f}"
+              f" {r['cache_hit']:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+对比两种 label 模式（LABEL_MODE = "all" / "assistant"）的收敛速度
+
+两次训练的 loss 定义不同（all 模式的 loss 含 system/user 部分，模板固定、很容易预测），
+不能直接比较 trainer_state.json 里的 loss。这里对每个 checkpoint 用同一份评估集、
+只在 assistant 回复上统计 loss 和 token 准确率，并给出达到目标准确率所需的步数。
+
+准备两次训练（只改 LABEL_MODE 和 OUTPUT_DIR，并按步保存 checkpoint 以获得更密的曲线）:
+  LABEL_MODE = "all"        OUTPUT_DIR = "./run_label_all"
+  LABEL_MODE = "assistant"  OUTPUT_DIR = "./run_label_assistant"
+
+用法:
+  python benchmarks/compare_label_modes.py \\
+      --run all=./run_label_all --run assistant=./run_label_assistant \\
+      --base-model Qwen/Qwen2.5-1.5B-Instruct --target-accuracy 0.9
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def list_checkpoints(run_dir):
+    """按步数排序的 (step, path)"""
+    found = []
+    for path in glob.glob(os.path.join(run_dir, 'checkpoint-*')):
+        match = re.search(r'checkpoint-(\d+)$', path)
+        if match:
+            found.append((int(match.group(1)), path))
+    return sorted(found)
+
+
+def training_losses(run_dir, checkpoints):
+    """最后一个 checkpoint 的 trainer_state.json 中记录的训练 loss"""
+    candidates = [os.path.join(path, 'trainer_state.json') for _, path in reversed(checkpoints)]
+    candidates.append(os.path.join(run_dir, 'trainer_state.json'))
+    for state_path in candidates:
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)['log_history']
+            return [(entry['step'], entry['loss']) for entry in history if 'loss' in entry]
+    return []
+
+
+def evaluate(model, dataset, indices, collator, batch_size):
+    """只在 assistant 回复上统计 loss 和 token 准确率"""
+    import torch
+    import torch.nn.functional as F
+
+    model.eval()
+    total_loss, correct, count = 0.0, 0, 0
+    with torch.no_grad():
+        for start in range(0, len(indices), batch_size):
+            batch = collator([dataset[i] for i in indices[start:start + batch_size]])
+            batch = {k: v.to(model.device) for k, v in batch.items()}
+            logits = model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask']).logits
+            logits, targets = logits[:, :-1].float(), batch['labels'][:, 1:]
+            mask = targets != -100
+            total_loss += F.cross_entropy(logits[mask], targets[mask], reduction='sum').item()
+            correct += (logits.argmax(-1)[mask] == targets[mask]).sum().item()
+            count += mask.sum().item()
+    return total_loss / max(count, 1), correct / max(count, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 label 模式的收敛速度")
+    parser.add_argument('--run', action='append', required=True, metavar='NAME=DIR',
+                        help='训练输出目录（可多次指定）')
+    parser.add_argument('--base-model', default='Qwen/Qwen2.5-1.5B-Instruct')
+    parser.add_argument('--data', default=os.path.join(ROOT, 'training_data.json'))
+    parser.add_argument('--template', default='simple')
+    parser.add_argument('--max-length', type=int, default=512)
+    parser.add_argument('--eval-samples', type=int, default=200, help='评估样本数（从训练数据中等间隔抽取）')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--target-accuracy', type=float, default=0.9, help='assistant token 准确率目标')
+    args = parser.parse_args()
+
+    import torch
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from batching import DynamicPaddingCollator
+    from token_cache import load_or_build
+
+    tokenizer = AutoTokenizer.from_pretrained(args.base_model, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # 评估集统一使用 assistant 模式的 label，与训练时的 label 模式无关
+    dataset = load_or_build(args.data, tokenizer, args.template, args.max_length,
+                            cache_root=os.path.join(tempfile.gettempdir(), 'compare_label_modes_cache'),
+                            label_mode='assistant')
+    step = max(len(dataset) // args.eval_samples, 1)
+    indices = list(range(0, len(dataset), step))[:args.eval_samples]
+    collator = DynamicPaddingCollator(tokenizer.pad_token_id, max_length=args.max_length)
+
+    dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    base = AutoModelForCausalLM.from_pretrained(args.base_model, torch_dtype=dtype, trust_remote_code=True)
+    base.to('cuda' if torch.cuda.is_available() else 'cpu')
+
+    summary = {}
+    for spec in args.run:
+        name, run_dir = spec.split('=', 1)
+        checkpoints = list_checkpoints(run_dir)
+        if not checkpoints:
+            print(f"⚠️  {run_dir} 下没有 checkpoint-*，跳过")
+            continue
+
+        print(f"\n📈 {name} ({run_dir})")
+        losses = training_losses(run_dir, checkpoints)
+        if losses:
+            print("  训练 loss（按该模式自身的定义）: " + ", ".join(f"{s}:{l:.3f}" for s, l in losses))
+        print(f"  {'step':>6} {'assistant loss':>15} {'token 准确率':>12}")
+        reached = None
+        for ckpt_step, path in checkpoints:
+            model = PeftModel.from_pretrained(base, path)
+            loss, accuracy = evaluate(model, dataset, indices, collator, args.batch_size)
+            base = model.unload()  # 去掉 LoRA 层，恢复基座模型
+            print(f"  {ckpt_step:>6} {loss:>15.4f} {accuracy:>12.1%}")
+            if reached is None and accuracy >= args.target_accuracy:
+                reached = ckpt_step
+        summary[name] = reached
+
+    print(f"\n🎯 达到 assistant token 准确率 {args.target_accuracy:.0%} 所需步数:")
+    for name, reached in summary.items():
+        print(f"  {name:<12} {reached if reached is not None else '未达到'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Qwen 对话格式
+
+训练、预分词缓存和推理共用同一份模板，避免各脚本各自拼字符串导致不一致。
+"""
+
+IM_START = "<|im_start|>"
+IM_END = "<|im_end|>"
+ASSISTANT_PREFIX = f"{IM_START}assistant\n"  # assistant 回复的起始标记
+
+# simple_train.py / test_model.py 使用的系统提示
+SIMPLE_SYSTEM_PROMPT = "你是一个专业的 CSS 助手。"
+# finetune_css.py 使用的系统提示
+CSS_ASSISTANT_SYSTEM_PROMPT = "你是一个专业的CSS类名助手，帮助开发者快速查找和使用Tailwind风格的CSS类名。你的回答应该简洁、准确。"
+
+# 模板名 -> (系统提示, 是否把 input 拼到 user 消息中)
+TEMPLATES = {
+    'simple': (SIMPLE_SYSTEM_PROMPT, True),
+    'css_assistant': (CSS_ASSISTANT_SYSTEM_PROMPT, False),
+}
+
+
+def format_prompt(instruction, input_text='', template='simple'):
+    """推理用：拼出到 assistant 起始标记为止的提示"""
+    system, use_input = TEMPLATES[template]
+    user = f"{instruction}\n{input_text}" if use_input and input_text else instruction
+    return f"{IM_START}system\n{system}{IM_END}\n{IM_START}user\n{user}{IM_END}\n{ASSISTANT_PREFIX}"
+
+
+def format_sample(sample, template='simple'):
+    """训练用：拼出包含 assistant 回复的完整对话"""
+    prompt = format_prompt(sample['instruction'], sample.get('input', ''), template)
+    return f"{prompt}{sample['output']}{IM_END}"
+
+
+def template_signature(template):
+    """模板内容的字符串表示，用于缓存键"""
+    system, use_input = TEMPLATES[template]
+    return f"{template}|{system}|{use_input}|{format_sample({'instruction': '', 'output': ''}, template)}"
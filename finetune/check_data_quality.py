@@ -1,82 +1,448 @@
+#!/usr/bin/env python3
+"""
+训练数据质量检查 - 单遍流式版本
+
+只读一遍数据（.json / .jsonl / dataset_store 分片目录，流式读取，不整体 json.load），同时统计:
+  - 完整性: 样本数、空问题、空答案
+  - 长度: 问题 / 答案字符数（最短、最长、平均、P50/P90/P99）
+  - 重复: 重复问题、完全重复的样本（问题 + 答案）、同一问题对应多个不同答案
+  - 类别: 类名 / 类名解释 / 拒答（负样本）/ 其他（与 evaluate.py 的划分一致），代码生成样本
+  - 类名覆盖: css_classes.json 中有多少类出现在样本里，每个类的样本数
+  - token 长度: 用真实分词器按训练模板分词，直方图 + 超过 cutoff_len 被截断的样本数
+    （以及截断后没有 assistant 回复、不计入 loss 的样本数）
+
+内存: 长度按值计数（只与最大长度有关）；重复检查每条样本保留两个 8 字节哈希，
+另有固定 16MB 的位图，用于留下重复问题的原文。
+
+用法:
+  python check_data_quality.py                                      # training_data.json
+  python check_data_quality.py training_data_shards --cutoff-len 1024
+  python check_data_quality.py big.jsonl --json report.json          # 同时写出 JSON 报告（- 为 stdout）
+  python check_data_quality.py --tokenizer none                      # 不加载分词器，跳过 token 统计
+"""
+
+import argparse
 import json
+import sys
+import time
+from array import array
 from collections import Counter
 
-with open("training_data.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
-
-print("=" * 60)
-print("🔍 数据质量检查报告")
-print("=" * 60)
-
-# 1. 基本统计
-print(f"\n📊 基本统计:")
-print(f"  总样本数: {len(data)}")
-
-# 2. 长度分析
-inst_lengths = [len(item["instruction"]) for item in data]
-out_lengths = [len(item["output"]) for item in data]
-
-print(f"\n📏 长度分析:")
-print(
-    f"  问题长度 - 最短: {min(inst_lengths)}, 最长: {max(inst_lengths)}, 平均: {sum(inst_lengths)/len(inst_lengths):.1f}"
-)
-print(
-    f"  答案长度 - 最短: {min(out_lengths)}, 最长: {max(out_lengths)}, 平均: {sum(out_lengths)/len(out_lengths):.1f}"
-)
-
-# 3. 空值检查
-empty_inst = sum(1 for item in data if not item["instruction"].strip())
-empty_out = sum(1 for item in data if not item["output"].strip())
-
-print(f"\n✓ 完整性检查:")
-print(f"  空问题: {empty_inst}")
-print(f"  空答案: {empty_out}")
-
-# 4. 重复检查
-inst_counter = Counter(item["instruction"] for item in data)
-duplicates = sum(1 for count in inst_counter.values() if count > 1)
-
-print(f"\n🔄 重复性检查:")
-print(f"  重复问题数: {duplicates}")
-if duplicates > 0:
-    print(f"  最常见的问题:")
-    for inst, count in inst_counter.most_common(3):
-        if count > 1:
-            print(f"    '{inst[:50]}...' 出现 {count} 次")
-
-# 5. 类名覆盖率
-classnames_in_output = set()
-for item in data:
-    # 提取输出中的类名
-    import re
-
-    matches = re.findall(r"\b[\w-]+\b", item["output"])
-    classnames_in_output.update(matches)
-
-print(f"\n📦 类名覆盖:")
-print(f"  输出中包含的唯一类名数: {len(classnames_in_output)}")
-
-# 6. 负样本比例
-negative_count = sum(
-    1 for item in data if "抱歉" in item["output"] or "只能回答" in item["output"]
-)
-negative_ratio = (negative_count / len(data)) * 100
-
-print(f"\n⚖️ 样本平衡:")
-print(f"  负样本数: {negative_count} ({negative_ratio:.1f}%)")
-print(f"  建议负样本比例: 5-10%")
-
-if negative_ratio < 5:
-    print(f"  ⚠️ 警告: 负样本过少，建议增加")
-elif negative_ratio > 15:
-    print(f"  ⚠️ 警告: 负样本过多，可能影响正常功能")
-else:
-    print(f"  ✅ 负样本比例合理")
-
-# 7. 输出格式检查
-code_samples = sum(
-    1 for item in data if "<div" in item["output"] or "className" in item["output"]
-)
-print(f"\n💻 代码生成样本: {code_samples} ({(code_samples/len(data)*100):.1f}%)")
-
-print("\n" + "=" * 60)
+import numpy as np
+
+DEFAULT_DATA_FILE = "training_data.json"
+DEFAULT_CLASSES_FILE = "css_classes.json"
+DEFAULT_TOKENIZER = "Qwen/Qwen2.5-1.5B-Instruct"
+DEFAULT_TEMPLATE = "simple"
+DEFAULT_CUTOFF_LEN = 512  # 与 train_config.yaml 的 cutoff_len / 训练脚本的 MAX_LENGTH 一致
+BATCH_SIZE = 1000  # 每批分词 / 汇总的样本数
+TOKEN_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096)  # token 长度直方图的上界
+NEGATIVE_MARKERS = ('抱歉', '只能回答')  # 不在内置拒答集合中的负样本按关键词识别
+NEGATIVE_RATIO_RANGE = (5.0, 15.0)  # 负样本比例（%）的合理范围，建议 5-10%
+SEEN_BITS = 1 << 27  # 重复问题位图（16MB）
+NUM_TOP_DUPLICATES = 3
+MEMO_SIZE = 100_000  # 按文本缓存 token 数 / 类别 / 类名的条数上限（超过后清空），重复的问题和回复只处理一次
+MAX_DUPLICATE_TEXTS = 10000  # 最多保留多少个重复问题的原文
+NUM_UNCOVERED_EXAMPLES = 10
+
+
+class LengthCounter:
+    """按长度值计数（numpy 数组下标为长度），分位数精确，内存与样本数无关"""
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, lengths):
+        if not len(lengths):
+            return
+        counts = np.bincount(np.asarray(lengths, dtype=np.int64))
+        if len(counts) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(counts) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(counts)] += counts
+
+    def summary(self):
+        total = int(self.counts.sum())
+        if not total:
+            return {'count': 0}
+        present = np.flatnonzero(self.counts)
+        cumulative = np.cumsum(self.counts)
+
+        def percentile(q):
+            return int(np.searchsorted(cumulative, q * total))
+
+        return {
+            'count': total,
+            'min': int(present[0]),
+            'max': int(present[-1]),
+            'mean': float((np.arange(len(self.counts)) * self.counts).sum() / total),
+            'p50': percentile(0.5),
+            'p90': percentile(0.9),
+            'p99': percentile(0.99),
+        }
+
+    def histogram(self, buckets):
+        """[{'max': 上界, 'count': 数量}, ...]，最后一项 max 为 None（超过最大上界）"""
+        cumulative = np.cumsum(self.counts)
+        total = int(cumulative[-1]) if len(cumulative) else 0
+        rows, previous = [], 0
+        for bound in buckets:
+            upto = int(cumulative[min(bound, len(cumulative) - 1)]) if total else 0
+            rows.append({'max': bound, 'count': upto - previous})
+            previous = upto
+        rows.append({'max': None, 'count': total - previous})
+        return rows
+
+    def above(self, limit):
+        return int(self.counts[limit + 1:].sum())
+
+
+class QualityAnalyzer:
+    """逐批累计所有指标，report() 汇总"""
+
+    def __init__(self, class_names=(), tokenizer=None, template=DEFAULT_TEMPLATE, cutoff_len=DEFAULT_CUTOFF_LEN):
+        from process_data import NEGATIVE_OUTPUT, NEGATIVE_SAMPLES
+
+        self.class_names = set(class_names)
+        self.refusal_outputs = {item['output'] for item in NEGATIVE_SAMPLES} | {NEGATIVE_OUTPUT}
+        self.tokenizer = tokenizer
+        self.template = template
+        self.cutoff_len = cutoff_len
+
+        self.num_samples = 0
+        self.empty_instruction = 0
+        self.empty_output = 0
+        self.code_samples = 0
+        self.categories = Counter()
+        self.class_counts = Counter()
+        self.instruction_lengths = LengthCounter()
+        self.output_lengths = LengthCounter()
+        self.token_lengths = LengthCounter()
+        self.prompt_token_lengths = LengthCounter()
+        self.no_answer = 0  # 截断后没有 assistant 回复
+        if tokenizer is not None:
+            from chat_format import TEMPLATES, format_prompt, format_sample
+
+            self._use_input = TEMPLATES[template][1]
+            self._prompt_overhead = len(tokenizer(format_prompt('', '', template))['input_ids'])
+            self._answer_overhead = len(tokenizer(format_sample({'instruction': '', 'output': ''}, template))
+                                        ['input_ids']) - self._prompt_overhead
+            self._token_memo = {}
+
+        self._instruction_hashes = array('q')
+        self._sample_hashes = array('q')
+        self._seen = bytearray(SEEN_BITS // 8)
+        self._duplicate_texts = {}
+        self._instruction_info = {}  # 问题文本 -> _instruction_features
+        self._output_info = {}  # 回复文本 -> _output_features
+
+    def add_batch(self, batch):
+        instruction_lengths, output_lengths, sample_classes = [], [], []
+        seen = self._seen
+        if len(self._instruction_info) + len(self._output_info) > MEMO_SIZE:
+            self._instruction_info.clear()
+            self._output_info.clear()
+        instruction_info, output_info = self._instruction_info, self._output_info
+        for item in batch:
+            instruction = item.get('instruction') or ''
+            output = item.get('output') or ''
+            instruction_lengths.append(len(instruction))
+            output_lengths.append(len(output))
+            info = instruction_info.get(instruction)
+            if info is None:
+                info = instruction_info[instruction] = self._instruction_features(instruction)
+            key, instruction_category, names = info
+            info = output_info.get(output)
+            if info is None:
+                info = output_info[output] = self._output_features(output)
+            answer, category, found, is_code = info
+
+            if not key:
+                self.empty_instruction += 1
+            if not answer:
+                self.empty_output += 1
+            self.categories[category or instruction_category] += 1
+            if is_code:
+                self.code_samples += 1
+            if names or found:
+                sample_classes.extend(names | found if names and found else names or found)
+
+            # 重复: 位图两个位都已置位 → 很可能见过，留下原文（数量以最后的精确统计为准）
+            h = hash(key)
+            self._instruction_hashes.append(h)
+            self._sample_hashes.append(hash((key, answer)))
+            a, b = h & (SEEN_BITS - 1), (h >> 27) & (SEEN_BITS - 1)
+            if seen[a >> 3] >> (a & 7) & 1 and seen[b >> 3] >> (b & 7) & 1:
+                if len(self._duplicate_texts) < MAX_DUPLICATE_TEXTS:
+                    self._duplicate_texts.setdefault(h, key)
+            else:
+                seen[a >> 3] |= 1 << (a & 7)
+                seen[b >> 3] |= 1 << (b & 7)
+
+        self.num_samples += len(batch)
+        self.class_counts.update(sample_classes)
+        self.instruction_lengths.add(instruction_lengths)
+        self.output_lengths.add(output_lengths)
+        if self.tokenizer is not None:
+            self._add_tokens(batch)
+
+    # sample_category 先只看回复（拒答 / 类名），再只看问题（类名解释），两部分分别按文本缓存
+    def _instruction_features(self, instruction):
+        """(去掉首尾空白的问题, 类别 explanation / other, 出现的类名)"""
+        from evaluate import sample_category
+
+        category, _ = sample_category({'instruction': instruction, 'output': ''}, self.class_names, ())
+        return instruction.strip(), category, self._find_classes(instruction)
+
+    def _output_features(self, output):
+        """(去掉首尾空白的回复, 类别 refusal / class_name，由问题决定时为 None, 出现的类名, 是否代码生成)"""
+        from evaluate import sample_category
+
+        category, _ = sample_category({'instruction': '', 'output': output}, self.class_names, self.refusal_outputs)
+        if category == 'other':
+            category = 'refusal' if any(marker in output for marker in NEGATIVE_MARKERS) else None
+        return output.strip(), category, self._find_classes(output), '<div' in output or 'className' in output
+
+    def _find_classes(self, text):
+        from evaluate import _TOKEN_RE
+
+        if not self.class_names:
+            return frozenset()
+        return frozenset(token for token in _TOKEN_RE.findall(text) if token in self.class_names)
+
+    def _token_lengths(self, texts):
+        """批量取 token 数：只分词备忘表里没有的文本，不生成 offsets 等用不到的字段"""
+        memo = self._token_memo
+        if len(memo) + len(texts) > MEMO_SIZE:
+            memo.clear()
+        missing = list({text for text in texts if text not in memo})
+        if missing:
+            backend = getattr(self.tokenizer, 'backend_tokenizer', None)
+            if backend is None:  # 慢速分词器
+                encoded = self.tokenizer(missing, add_special_tokens=False)['input_ids']
+                memo.update(zip(missing, map(len, encoded)))
+            else:
+                encode = getattr(backend, 'encode_batch_fast', backend.encode_batch)
+                memo.update((text, len(e.ids)) for text, e in zip(missing, encode(missing, add_special_tokens=False)))
+        return np.fromiter((memo[text] for text in texts), dtype=np.int64, count=len(texts))
+
+    def _add_tokens(self, batch):
+        """
+        与 token_cache.build_cache 相同的模板，不截断，统计完整长度
+
+        整段长度 = 模板固定部分 + user 消息 + 回复：模板的特殊 token 和换行不与相邻文本合并，
+        分开分词与整段分词结果一致（Qwen 分词器上逐条核对过），系统提示不必每条重复分词
+        """
+        users = [f"{item.get('instruction') or ''}\n{item['input']}" if self._use_input and item.get('input')
+                 else item.get('instruction') or '' for item in batch]
+        prompt_lengths = self._prompt_overhead + self._token_lengths(users)
+        lengths = prompt_lengths + self._answer_overhead + self._token_lengths(
+            [item.get('output') or '' for item in batch])
+        self.token_lengths.add(lengths)
+        self.prompt_token_lengths.add(prompt_lengths)
+        self.no_answer += int((prompt_lengths >= self.cutoff_len).sum())
+
+    def _duplicates(self):
+        instructions = np.frombuffer(self._instruction_hashes, dtype=np.int64)
+        samples = np.frombuffer(self._sample_hashes, dtype=np.int64)
+        unique, counts = np.unique(instructions, return_counts=True)
+        unique_samples, first = np.unique(samples, return_index=True)
+        # 同一问题的不同答案：去重后的样本里问题哈希出现多次
+        _, answers = np.unique(instructions[first], return_counts=True)
+        top = []
+        for i in np.argsort(-counts, kind='stable')[:NUM_TOP_DUPLICATES]:
+            if counts[i] > 1:
+                top.append({'instruction': self._duplicate_texts.get(int(unique[i])), 'count': int(counts[i])})
+        return {
+            'duplicate_instructions': int((counts > 1).sum()),
+            'duplicate_samples': int(len(samples) - len(unique_samples)),
+            'conflicting_instructions': int((answers > 1).sum()),
+            'top': top,
+        }
+
+    def report(self):
+        negatives = self.categories['refusal']
+        report = {
+            'num_samples': self.num_samples,
+            'completeness': {'empty_instruction': self.empty_instruction, 'empty_output': self.empty_output},
+            'lengths': {'instruction': self.instruction_lengths.summary(),
+                        'output': self.output_lengths.summary()},
+            'duplicates': self._duplicates(),
+            'categories': {name: self.categories[name] for name in ('class_name', 'explanation', 'refusal', 'other')},
+            'negatives': {'count': negatives,
+                          'ratio': negatives / self.num_samples * 100 if self.num_samples else 0.0},
+            'code_samples': self.code_samples,
+        }
+        if self.class_names:
+            per_class = LengthCounter()
+            per_class.add([self.class_counts[name] for name in self.class_names])
+            uncovered = sorted(name for name in self.class_names if not self.class_counts[name])
+            report['class_coverage'] = {
+                'total': len(self.class_names),
+                'covered': len(self.class_names) - len(uncovered),
+                'uncovered_examples': uncovered[:NUM_UNCOVERED_EXAMPLES],
+                'samples_per_class': per_class.summary(),
+            }
+        if self.tokenizer is not None:
+            report['tokens'] = {
+                'tokenizer': getattr(self.tokenizer, 'name_or_path', ''),
+                'template': self.template,
+                'cutoff_len': self.cutoff_len,
+                'total': self.token_lengths.summary(),
+                'prompt': self.prompt_token_lengths.summary(),
+                'histogram': self.token_lengths.histogram(TOKEN_BUCKETS),
+                'truncated': self.token_lengths.above(self.cutoff_len),
+                'no_answer_after_truncation': self.no_answer,
+            }
+        return report
+
+
+def analyze(samples, class_names=(), tokenizer=None, template=DEFAULT_TEMPLATE, cutoff_len=DEFAULT_CUTOFF_LEN,
+            batch_size=BATCH_SIZE):
+    """单遍统计任意可迭代的样本，返回报告字典"""
+    analyzer = QualityAnalyzer(class_names, tokenizer, template, cutoff_len)
+    batch = []
+    for item in samples:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            analyzer.add_batch(batch)
+            batch = []
+    if batch:
+        analyzer.add_batch(batch)
+    return analyzer.report()
+
+
+def load_tokenizer(name):
+    """加载失败时提示并跳过 token 统计（例如离线环境没有下载过分词器）"""
+    if not name or name.lower() == 'none':
+        return None
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+    except Exception as e:
+        print(f"⚠️  分词器 {name} 加载失败，跳过 token 统计: {e}", file=sys.stderr)
+        return None
+
+
+def format_lengths(stats):
+    if not stats.get('count'):
+        return "-"
+    return (f"最短: {stats['min']}, 最长: {stats['max']}, 平均: {stats['mean']:.1f}, "
+            f"P50/P90/P99: {stats['p50']}/{stats['p90']}/{stats['p99']}")
+
+
+def print_report(report, out=sys.stdout):
+    def show(text=''):
+        print(text, file=out)
+
+    total = report['num_samples'] or 1
+    show("=" * 60)
+    show("🔍 数据质量检查报告")
+    show("=" * 60)
+
+    show(f"\n📊 基本统计:")
+    show(f"  总样本数: {report['num_samples']}（{report['source']}，{report['seconds']:.2f}s）")
+
+    show(f"\n📏 长度分析（字符）:")
+    show(f"  问题长度 - {format_lengths(report['lengths']['instruction'])}")
+    show(f"  答案长度 - {format_lengths(report['lengths']['output'])}")
+
+    show(f"\n✓ 完整性检查:")
+    show(f"  空问题: {report['completeness']['empty_instruction']}")
+    show(f"  空答案: {report['completeness']['empty_output']}")
+
+    duplicates = report['duplicates']
+    show(f"\n🔄 重复性检查:")
+    show(f"  重复问题数: {duplicates['duplicate_instructions']}")
+    show(f"  完全重复的样本: {duplicates['duplicate_samples']}")
+    show(f"  同一问题有多个不同答案: {duplicates['conflicting_instructions']}")
+    if duplicates['top']:
+        show(f"  最常见的问题:")
+        for row in duplicates['top']:
+            text = row['instruction'][:50] if row['instruction'] is not None else '（原文未保留）'
+            show(f"    '{text}...' 出现 {row['count']} 次")
+
+    show(f"\n🗂️ 样本类别:")
+    for name, label in (('class_name', '类名'), ('explanation', '类名解释'), ('refusal', '拒答'), ('other', '其他')):
+        count = report['categories'][name]
+        show(f"  {label}: {count} ({count / total * 100:.1f}%)")
+
+    coverage = report.get('class_coverage')
+    if coverage:
+        show(f"\n📦 类名覆盖:")
+        show(f"  覆盖 {coverage['covered']}/{coverage['total']} 个类"
+             f"（{coverage['covered'] / coverage['total'] * 100:.1f}%）")
+        show(f"  每个类的样本数 - {format_lengths(coverage['samples_per_class'])}")
+        if coverage['uncovered_examples']:
+            show(f"  未覆盖: {', '.join(coverage['uncovered_examples'])}"
+                 f"{' ...' if coverage['total'] - coverage['covered'] > len(coverage['uncovered_examples']) else ''}")
+
+    ratio = report['negatives']['ratio']
+    show(f"\n⚖️ 样本平衡:")
+    show(f"  负样本数: {report['negatives']['count']} ({ratio:.1f}%)")
+    show(f"  建议负样本比例: 5-10%")
+    if ratio < NEGATIVE_RATIO_RANGE[0]:
+        show(f"  ⚠️ 警告: 负样本过少，建议增加")
+    elif ratio > NEGATIVE_RATIO_RANGE[1]:
+        show(f"  ⚠️ 警告: 负样本过多，可能影响正常功能")
+    else:
+        show(f"  ✅ 负样本比例合理")
+
+    show(f"\n💻 代码生成样本: {report['code_samples']} ({report['code_samples'] / total * 100:.1f}%)")
+
+    tokens = report.get('tokens')
+    if tokens:
+        show(f"\n🔢 token 长度（{tokens['tokenizer']}，模板 {tokens['template']}）:")
+        show(f"  整段对话 - {format_lengths(tokens['total'])}")
+        show(f"  提示部分 - {format_lengths(tokens['prompt'])}")
+        peak = max(row['count'] for row in tokens['histogram']) or 1
+        lower = 0
+        for row in tokens['histogram']:
+            label = f"{lower + 1}-{row['max']}" if row['max'] is not None else f">{lower}"
+            lower = row['max'] if row['max'] is not None else lower
+            if row['count']:
+                show(f"  {label:>10} {'█' * max(1, round(row['count'] / peak * 30))} {row['count']}")
+        show(f"  超过 cutoff_len={tokens['cutoff_len']} 被截断: {tokens['truncated']} "
+             f"({tokens['truncated'] / total * 100:.2f}%)")
+        if tokens['no_answer_after_truncation']:
+            show(f"  ⚠️ 截断后没有 assistant 回复（不计入 loss）: {tokens['no_answer_after_truncation']}")
+
+    show("\n" + "=" * 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="训练数据质量检查（单遍流式）")
+    parser.add_argument('data', nargs='?', default=DEFAULT_DATA_FILE, help='训练数据（.json / .jsonl / 分片目录）')
+    parser.add_argument('--classes', default=DEFAULT_CLASSES_FILE, help='CSS 类定义，用于类名覆盖率（none 为跳过）')
+    parser.add_argument('--tokenizer', default=DEFAULT_TOKENIZER, help='分词器（模型名或目录，none 为跳过 token 统计）')
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE, help='chat_format 模板名')
+    parser.add_argument('--cutoff-len', type=int, default=DEFAULT_CUTOFF_LEN, help='训练时的截断长度')
+    parser.add_argument('--json', default=None, metavar='PATH', help='写出 JSON 报告（- 为 stdout，此时文字报告写到 stderr）')
+    args = parser.parse_args(argv)
+
+    from dataset_store import iter_samples
+
+    class_names = ()
+    if args.classes and args.classes.lower() != 'none':
+        from data_engine import iter_records
+
+        class_names = [item['className'] for item in iter_records(args.classes)]
+    tokenizer = load_tokenizer(args.tokenizer)
+
+    start = time.perf_counter()
+    report = analyze(iter_samples(args.data), class_names, tokenizer, args.template, args.cutoff_len)
+    report = {'source': args.data, 'seconds': time.perf_counter() - start, **report}
+
+    print_report(report, out=sys.stderr if args.json == '-' else sys.stdout)
+    if args.json == '-':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✓ JSON 报告已写入 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+约束解码："描述 → 类名" 类问题只允许生成 css_classes.json 中的类名
+
+  - 所有类名分词后建成 token 前缀树，每一步只保留当前节点的子 token（logits 其余位置置 -inf）
+  - 走到完整类名的节点时允许 <|im_end|>；没有更长的类名可走时直接结束，不再多做一次前向
+  - 生成结果一定是已有的类名，解码步数等于类名的 token 数（通常 2~6 步）
+
+用法:
+  python constrained.py --adapter ./css_assistant_model "圆角 4px" "文字居中"
+
+Python 接口:
+  constraint = ClassNameConstraint.from_file(tokenizer)
+  generator.generate(prompts, max_new_tokens=constraint.max_length + 1, allowed_tokens=constraint)
+  inference.generate_class_name(generator, constraint, "圆角 4px")
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from chat_format import IM_END
+from css_index import DEFAULT_CLASSES_FILE
+
+
+class TrieNode:
+    __slots__ = ('children', 'value', 'allowed')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None  # 在此结束的序列对应的值（类名）
+        self.allowed = None  # 下一步允许的 token（首次访问时计算）
+
+
+class TokenTrie:
+    """token 序列前缀树"""
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.max_length = 0
+        self.size = 0
+
+    def add(self, token_ids, value):
+        node = self.root
+        for token in token_ids:
+            node = node.children.setdefault(token, TrieNode())
+        if node.value is None:
+            self.size += 1
+        node.value = value
+        self.max_length = max(self.max_length, len(token_ids))
+
+    def walk(self, token_ids):
+        """沿 token_ids 向下走，返回所到节点（不在树中返回 None）"""
+        node = self.root
+        for token in token_ids:
+            node = node.children.get(token)
+            if node is None:
+                return None
+        return node
+
+
+class ClassNameConstraint:
+    """
+    Generator.generate 的 allowed_tokens 回调: (row, 已生成的 token) -> 下一步允许的 token 列表
+
+    只剩停止符可选时 generate 直接结束该行
+    """
+
+    def __init__(self, tokenizer, class_names):
+        self.tokenizer = tokenizer
+        self.stop_id = tokenizer.convert_tokens_to_ids(IM_END)
+        self.trie = TokenTrie()
+        for name in class_names:
+            self.trie.add(tokenizer(name, add_special_tokens=False)['input_ids'], name)
+
+    @classmethod
+    def from_file(cls, tokenizer, path=DEFAULT_CLASSES_FILE):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(tokenizer, [item['className'] for item in json.load(f)])
+
+    @property
+    def max_length(self):
+        return self.trie.max_length
+
+    def __len__(self):
+        return self.trie.size
+
+    def __call__(self, row, token_ids):
+        node = self.trie.walk(token_ids)
+        if node is None:
+            return [self.stop_id]
+        if node.allowed is None:
+            node.allowed = list(node.children) + ([self.stop_id] if node.value is not None else [])
+        return node.allowed
+
+    def class_name(self, token_ids):
+        """生成的 token 对应的类名（未生成完整类名时返回 None）"""
+        node = self.trie.walk(token_ids)
+        return node.value if node is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="约束解码：描述 → 类名")
+    parser.add_argument('prompts', nargs='+')
+    parser.add_argument('--classes', default=DEFAULT_CLASSES_FILE)
+    parser.add_argument('--base-model')
+    parser.add_argument('--adapter')
+    parser.add_argument('--merged')
+    parser.add_argument('--template', default='simple')
+    args = parser.parse_args(argv)
+
+    from inference import (DEFAULT_ADAPTER_PATH, DEFAULT_BASE_MODEL, DEFAULT_MERGED_PATH, Generator,
+                           generate_class_name, load_model, resolve_model)
+
+    model_path, adapter = resolve_model(args.base_model or DEFAULT_BASE_MODEL, args.adapter or DEFAULT_ADAPTER_PATH,
+                                        args.merged or DEFAULT_MERGED_PATH)
+    model, tokenizer = load_model(model_path, adapter)
+    generator = Generator(model, tokenizer, template=args.template)
+    start = time.perf_counter()
+    constraint = ClassNameConstraint.from_file(tokenizer, args.classes)
+    print(f"✓ 类名前缀树: {len(constraint)} 个类，最长 {constraint.max_length} token"
+          f"（{(time.perf_counter() - start) * 1000:.0f}ms）")
+    for prompt in args.prompts:
+        name, seconds = generate_class_name(generator, constraint, prompt)
+        print(f"{prompt} → {name}（{seconds * 1000:.0f}ms）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
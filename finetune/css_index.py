@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+CSS 类名检索索引：查表类问题不经过模型，直接从 css_classes.json 回答
+
+基于 css_classes.json 在进程内建索引（约 1500 个类，构建 < 0.1s），按顺序尝试:
+  - 精确类名:   "类名 X 的作用是什么？" / "解释一下 X 这个类" / 直接输入类名
+  - 描述原文:   描述 / "如何{设置…}？" / "我想{设置…}" / "{颜色}背景" / 代码生成场景（input 为描述）
+  - 属性集合:   CSS 代码块、"生成一个包含 a: b, c: d 样式的类名"、"width: 20px"（规范化后按集合匹配）
+  - 关键词:     "圆角" 这类短查询，描述中包含它的类不多时直接列出
+  - 模糊匹配:   描述的字符 n-gram BM25，最高分足够高且查询大部分 n-gram 都在描述中时作答
+                （分数接近的几个类一起列出）
+
+置信度不足时返回 None，由调用方交给模型生成（inference.generate_css）
+
+用法:
+  python css_index.py "类名 at-center 的作用是什么？"
+  python css_index.py "圆角"
+"""
+
+import json
+import math
+import re
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from process_data import CODE_QUESTIONS, parse_description
+
+DEFAULT_CLASSES_FILE = "css_classes.json"
+
+NGRAM_SIZES = (2, 3)  # BM25 使用的字符 n-gram
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_BM25_SCORE = 8.0  # 最高分低于该值视为没找到
+MIN_BM25_MARGIN = 1.3  # 最高分至少是第二名的多少倍
+MIN_BM25_COVERAGE = 0.8  # 查询的 n-gram 至少有这么多出现在最高分的描述里
+SHORT_QUERY_CHARS = 8  # 不超过该长度的查询按关键词匹配
+MAX_CANDIDATES = 8  # 关键词/多个类同时命中时最多列出的类名数
+
+Match = namedtuple('Match', [
+    'answer',       # 回复文本（格式与训练数据一致）
+    'class_names',  # 命中的类名（多个时按相关度排序）
+    'kind',         # class_name / summary / setting / bg_color / properties / keyword / bm25
+    'score',        # 精确匹配为 1.0，BM25 为原始分数
+])
+
+_EXPLAIN_RES = [
+    re.compile(r'^类名\s*(\S+?)\s*的作用是什么[？?]?$'),
+    re.compile(r'^解释一下\s*(\S+?)\s*这个类$'),
+]
+_HOW_RE = re.compile(r'^如何(.+?)[？?]$')
+_WANT_RE = re.compile(r'^我想(.+)$')
+_BG_RE = re.compile(r'^(.+?)背景$')
+# 值里可能有括号（rgba(0, 0, 0, 0.5)），括号内的逗号不作为分隔符；值遇到中文结束（"…: 0 样式的类名"）
+_QUERY_PROPERTY_RE = re.compile(r'([a-zA-Z-]+)\s*:\s*((?:\([^)]*\)|[^;,{}()\n\u4e00-\u9fff])+)')
+_PSEUDO_RE = re.compile(r'::?(before|after)\b')
+
+
+# ========== 1. 规范化 ==========
+def normalize_text(text):
+    return ' '.join(text.lower().split())
+
+
+def normalize_properties(pairs):
+    """属性集合：属性名和值小写、合并空白，与顺序无关"""
+    return frozenset((name.strip().lower(), normalize_text(value).rstrip(';').strip()) for name, value in pairs)
+
+
+def pseudo_element(text):
+    """选择器中的伪元素（before / after），用于区分属性相同的类"""
+    match = _PSEUDO_RE.search(text or '')
+    return match.group(1) if match else None
+
+
+def parse_properties(text):
+    """从查询中取出 (属性, 值) 列表；有 { 时只看 { 之后的部分，选择器不当作属性"""
+    _, brace, body = text.rpartition('{')
+    pairs = _QUERY_PROPERTY_RE.findall(body if brace else text)
+    return [(name, value) for name, value in pairs if value.strip()]
+
+
+def char_ngrams(text):
+    text = normalize_text(text)
+    grams = []
+    for n in NGRAM_SIZES:
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+# ========== 2. BM25 ==========
+class BM25Index:
+    """字符 n-gram 的 BM25 倒排索引"""
+
+    def __init__(self, texts):
+        self.postings = defaultdict(list)  # n-gram -> [(doc, tf)]
+        self.doc_grams = []
+        lengths = []
+        for doc, text in enumerate(texts):
+            grams = Counter(char_ngrams(text))
+            self.doc_grams.append(frozenset(grams))
+            lengths.append(sum(grams.values()))
+            for gram, tf in grams.items():
+                self.postings[gram].append((doc, tf))
+        self.num_docs = len(lengths)
+        avg_length = sum(lengths) / max(self.num_docs, 1)
+        # 长度归一化项只和文档有关，预先算好
+        self.norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / max(avg_length, 1)) for length in lengths]
+        self.idf = {
+            gram: math.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for gram, docs in self.postings.items()
+        }
+
+    def search(self, query, top_k=2):
+        """返回 [(doc, score)]，按分数从高到低"""
+        scores = defaultdict(float)
+        for gram, qtf in Counter(char_ngrams(query)).items():
+            idf = self.idf.get(gram)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[gram]:
+                scores[doc] += qtf * idf * tf * (BM25_K1 + 1) / (tf + self.norms[doc])
+        return sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+
+    def coverage(self, query, doc):
+        """查询中出现在该文档里的 n-gram 比例"""
+        grams = set(char_ngrams(query))
+        return len(grams & self.doc_grams[doc]) / len(grams) if grams else 0.0
+
+
+# ========== 3. 类名索引 ==========
+class CssIndex:
+    """
+    css_classes.json 的内存索引
+
+    用法:
+        index = CssIndex.from_file("css_classes.json")
+        match = index.lookup("类名 at-center 的作用是什么？")
+        if match is None:
+            ...  # 交给模型生成
+    """
+
+    def __init__(self, items):
+        self.records = {}
+        self.class_names = []
+        self.by_summary = defaultdict(list)
+        self.by_setting = defaultdict(list)
+        self.by_bg_color = defaultdict(list)
+        self.by_properties = defaultdict(list)  # (属性集合, 伪元素) -> 类名
+        for item in items:
+            record = parse_description(item['className'], item['description'])
+            name = record.class_name
+            if name in self.records:
+                continue
+            self.records[name] = record
+            self.class_names.append(name)
+            if record.summary:
+                self.by_summary[normalize_text(record.summary)].append(name)
+            if record.setting:
+                self.by_setting[normalize_text(record.setting)].append(name)
+            if record.bg_color:
+                self.by_bg_color[normalize_text(record.bg_color)].append(name)
+            # 大部分类没有 CSS 代码块，属性写在描述里（"设置样式width: 20px;"）
+            properties = record.properties or parse_properties(record.summary)
+            if properties:
+                key = (normalize_properties(properties), pseudo_element(record.selector))
+                self.by_properties[key].append(name)
+        self.bm25 = BM25Index([self.records[name].summary or name for name in self.class_names])
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_CLASSES_FILE):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.class_names)
+
+    def explanation(self, name):
+        record = self.records[name]
+        return record.summary or name
+
+    # ----- 各种查找方式，返回候选类名列表 -----
+    def _find_properties(self, text):
+        pairs = parse_properties(text)
+        if not pairs:
+            return []
+        properties = normalize_properties(pairs)
+        pseudo = pseudo_element(text)
+        names = self.by_properties.get((properties, pseudo))
+        if names is None and pseudo is None:
+            # 没写伪元素：before / after 两个版本都算候选
+            names = (self.by_properties.get((properties, 'before'), [])
+                     + self.by_properties.get((properties, 'after'), []))
+        return names or []
+
+    def _find_keyword(self, text):
+        if len(text) > SHORT_QUERY_CHARS:
+            return []
+        names = [name for name in self.class_names if text in self.records[name].summary]
+        return names if len(names) <= MAX_CANDIDATES else []
+
+    def _find_bm25(self, text):
+        """
+        最高分足够高、且查询的大部分 n-gram 都出现在描述里才作答；
+        和最高分接近（MIN_BM25_MARGIN 以内）的都作为候选，候选太多视为不确定
+        """
+        hits = self.bm25.search(text, top_k=MAX_CANDIDATES + 1)
+        if not hits or hits[0][1] < MIN_BM25_SCORE:
+            return [], 0.0
+        close = [doc for doc, score in hits if score * MIN_BM25_MARGIN >= hits[0][1]]
+        if len(close) > MAX_CANDIDATES or any(self.bm25.coverage(text, doc) < MIN_BM25_COVERAGE for doc in close):
+            return [], hits[0][1]
+        return [self.class_names[doc] for doc in close], hits[0][1]
+
+    def find_class(self, text):
+        """描述/设置/属性/关键词/BM25 依次查找，返回 (类名列表, kind, score)"""
+        key = normalize_text(text)
+        for kind, table in (('summary', self.by_summary), ('setting', self.by_setting)):
+            if key in table:
+                return table[key], kind, 1.0
+        names = self._find_properties(text)
+        if names:
+            return names, 'properties', 1.0
+        names = self._find_keyword(text)
+        if names:
+            return names, 'keyword', 1.0
+        names, score = self._find_bm25(text)
+        return names, 'bm25', score
+
+    # ----- 对外接口 -----
+    def lookup(self, prompt, input_text=''):
+        """
+        按训练数据里的提问方式查找，返回 Match；置信度不足时返回 None
+
+        参数:
+            prompt: 用户提问（对应训练数据的 instruction）
+            input_text: 补充输入（对应 input，代码生成场景为类的描述）
+        """
+        prompt = prompt.strip()
+        input_text = input_text.strip()
+
+        # 代码生成场景：根据 input 里的描述找类名
+        if input_text:
+            if prompt not in CODE_QUESTIONS:
+                return None
+            names, kind, score = self.find_class(input_text)
+            if len(names) != 1:
+                return None
+            return Match(f'<div className="{names[0]}">内容</div>', names, kind, score)
+
+        # 类名 -> 解释
+        for pattern in _EXPLAIN_RES:
+            match = pattern.match(prompt)
+            if match and match.group(1) in self.records:
+                name = match.group(1)
+                return Match(self.explanation(name), [name], 'class_name', 1.0)
+        if prompt in self.records:
+            return Match(self.explanation(prompt), [prompt], 'class_name', 1.0)
+
+        # "如何{设置…}？" 的回复带 "使用类名:" 前缀，其余直接回复类名
+        match = _HOW_RE.match(prompt)
+        if match and normalize_text(match.group(1)) in self.by_setting:
+            return self._class_match(self.by_setting[normalize_text(match.group(1))], 'setting', prefix='使用类名: ')
+        match = _WANT_RE.match(prompt)
+        if match and normalize_text(match.group(1)) in self.by_setting:
+            return self._class_match(self.by_setting[normalize_text(match.group(1))], 'setting')
+        match = _BG_RE.match(prompt)
+        if match and normalize_text(match.group(1)) in self.by_bg_color:
+            return self._class_match(self.by_bg_color[normalize_text(match.group(1))], 'bg_color')
+
+        names, kind, score = self.find_class(prompt)
+        if not names:
+            return None
+        return self._class_match(names, kind, score=score)
+
+    @staticmethod
+    def _class_match(names, kind, prefix='', score=1.0):
+        if len(names) == 1:
+            return Match(f"{prefix}{names[0]}", names, kind, score)
+        names = names[:MAX_CANDIDATES]
+        return Match(f"可选类名: {', '.join(names)}", names, kind, score)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(__doc__)
+        return 1
+    start = time.perf_counter()
+    index = CssIndex.from_file()
+    print(f"✓ 索引构建完成: {len(index)} 个类（{(time.perf_counter() - start) * 1000:.1f}ms）")
+    for query in argv:
+        start = time.perf_counter()
+        match = index.lookup(query)
+        micros = (time.perf_counter() - start) * 1e6
+        if match is None:
+            print(f"\n❓ {query}\n   未命中（{micros:.0f}µs），交给模型生成")
+        else:
+            print(f"\n🔎 {query}\n   {match.answer}\n   （{match.kind}，score={match.score:.2f}，{micros:.0f}µs）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
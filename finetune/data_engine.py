@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+训练样本生成引擎 - 流式 + 多进程版本
+
+与 process_data.py 的区别：
+  - 流式读取 css_classes.json（JSON 数组或 JSONL），不一次性 json.load
+  - 按 chunk 把 generate_training_samples 分发到进程池，窗口有上限，内存不随类数增长
+  - 边生成边去重边写出 JSONL，不在内存中累积全部样本
+
+用法:
+  python data_engine.py                                   # css_classes.json -> training_data.jsonl
+  python data_engine.py --input big.jsonl --workers 8 --chunk-size 512
+  python data_engine.py --no-static                       # 不追加系统/负样本/组合样本
+  python data_engine.py --seed 42                         # 每个类独立派生种子，输出可复现
+  python data_engine.py --output training_data_shards --shard-format arrow   # 直接写分片
+  python data_engine.py --negatives 50000 --negative-bank topic=banks/topics.txt \
+      --negative-templates banks/templates.txt          # 负样本从问题库 × 模板中抽样（negative_gen.py）
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from process_data import (
+    build_static_samples,
+    class_rng,
+    dedup_key,
+    generate_training_samples,
+    iter_static_samples,
+    sample_id,
+)
+
+READ_BLOCK_SIZE = 1 << 16  # 流式读取的块大小（64KB）
+DEFAULT_CHUNK_SIZE = 256  # 每个进程任务处理的类数
+
+
+# ========== 流式读取 ==========
+def iter_json_array(path, block_size=READ_BLOCK_SIZE):
+    """逐个产出顶层 JSON 数组中的元素，内存只保留当前块"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read(block_size)
+        eof = not buf
+        pos = 0
+
+        def fill():
+            nonlocal buf, pos, eof
+            block = f.read(block_size)
+            if not block:
+                eof = True
+            buf = buf[pos:] + block
+            pos = 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        skip_ws()
+        if pos >= len(buf) or buf[pos] != '[':
+            raise ValueError(f"{path} 不是 JSON 数组")
+        pos += 1
+
+        while True:
+            skip_ws()
+            if pos >= len(buf):
+                raise ValueError(f"{path} JSON 数组未正常结束")
+            if buf[pos] == ']':
+                return
+            if buf[pos] == ',':
+                pos += 1
+                skip_ws()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill()
+                    continue
+                # 数字可能被块边界截断（如 "3" + ".5"），必须看到分隔符才算结束
+                if not eof and (end == len(buf) or buf[end] not in ' \t\r\n,]'):
+                    fill()
+                    continue
+                break
+            pos = end
+            yield item
+
+
+def iter_jsonl(path):
+    """逐行产出 JSONL 文件中的对象，跳过空行"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_records(path):
+    """根据扩展名选择 JSONL 或 JSON 数组的流式读取"""
+    if path.endswith('.jsonl'):
+        return iter_jsonl(path)
+    return iter_json_array(path)
+
+
+def iter_chunks(iterable, size):
+    """把可迭代对象切成长度为 size 的列表"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ========== 并行生成 ==========
+def generate_chunk(items, seed=None):
+    """进程池任务：为一批类生成样本（seed 不为 None 时每个类使用独立的种子）"""
+    samples = []
+    for item in items:
+        rng = random if seed is None else class_rng(item['className'], seed)
+        samples.extend(generate_training_samples(item, rng))
+    return samples
+
+
+def generate_samples(items, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, seed=None):
+    """
+    按输入顺序产出所有类的训练样本
+
+    参数:
+        items: css 类的可迭代对象（可以是流）
+        workers: 进程数，None 为 CPU 核数，1 为当前进程串行
+        chunk_size: 每个任务处理的类数
+        seed: 随机种子，None 为不可复现的全局随机
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = iter_chunks(items, chunk_size)
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from generate_chunk(chunk, seed)
+        return
+
+    # 在途任务数有上限，避免把整个输入一次性提交给进程池
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(generate_chunk, chunk, seed))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class SampleDeduper:
+    """
+    流式去重：只保存 (instruction, output) 的 8 字节摘要，而不是样本本身
+    """
+
+    def __init__(self):
+        self.seen = set()
+
+    def add(self, item):
+        """首次出现返回 True；重复或空样本返回 False"""
+        key = dedup_key(item)
+        if key is None:
+            return False
+        digest = hashlib.blake2b(
+            f"{key[0]}\x00{key[1]}".encode('utf-8'), digest_size=8
+        ).digest()
+        if digest in self.seen:
+            return False
+        self.seen.add(digest)
+        return True
+
+
+def iter_unique(samples, deduper=None):
+    """过滤掉重复样本"""
+    deduper = deduper or SampleDeduper()
+    for item in samples:
+        if deduper.add(item):
+            yield item
+
+
+def write_jsonl(samples, path):
+    """
+    流式写出 JSONL（先写临时文件再替换），返回写出的条数
+
+    只写文本列，样本的 type / template / class_name 写到 <path>.tags 目录（dataset_store 元数据）
+    """
+    from dataset_store import COLUMNS, TagWriter, tags_dir
+
+    tags = TagWriter(tags_dir(path))
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for item in samples:
+            f.write(json.dumps({c: item.get(c, '') for c in COLUMNS}, ensure_ascii=False))
+            f.write('\n')
+            tags.write(item)
+            count += 1
+    os.replace(tmp_path, path)
+    tags.close(path)
+    return count
+
+
+def run(input_path, output_path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+        include_static=True, seed=None, shard_format=None, shard_size=None, near_deduper=None,
+        negatives=None):
+    """
+    完整流水线：读取 -> 并行生成 -> 去重 -> 写出 JSONL（或 dataset_store 分片目录）
+
+    near_deduper 为 near_dedup.NearDeduper 时在精确去重之后再做近似去重；
+    negatives 为 negative_gen.NegativeSampler 时按它生成负样本（与正样本在同一个流里写出，不展开组合）
+    """
+    stats = {'classes': 0, 'generated': 0}
+
+    def counted_items():
+        for item in iter_records(input_path):
+            stats['classes'] += 1
+            yield item
+
+    def all_samples():
+        for sample in generate_samples(counted_items(), workers, chunk_size, seed):
+            stats['generated'] += 1
+            yield sample
+        if include_static:
+            for sample in iter_static_samples(negatives):
+                stats['generated'] += 1
+                yield sample
+
+    start = time.perf_counter()
+    samples = iter_unique(all_samples())
+    if near_deduper is not None:
+        from near_dedup import iter_near_unique
+        samples = iter_near_unique(samples, near_deduper)
+    if shard_format:
+        from dataset_store import DEFAULT_SHARD_SIZE, write_shards
+        index = write_shards(samples, output_path, shard_format, shard_size or DEFAULT_SHARD_SIZE)
+        stats['written'] = index['num_samples']
+    else:
+        stats['written'] = write_jsonl(samples, output_path)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+# ========== 增量构建 ==========
+MANIFEST_VERSION = 1
+STATIC_KEY = '__static__'  # 清单中固定样本（系统/负样本/组合）的键
+
+
+def content_hash(item):
+    """css 类条目的内容哈希"""
+    payload = json.dumps(item, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+
+def load_manifest(path):
+    """读取清单，不存在或版本不符时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_existing_dataset(path):
+    """读取上次生成的数据（JSON 文件或分片目录，连同元数据），返回 {sample_id: sample}"""
+    from dataset_store import iter_samples
+    return {sample_id(item): item for item in iter_samples(path, with_tags=True)}
+
+
+def build_dataset(items, seed, manifest=None, existing=None, negatives=None):
+    """
+    生成（或增量拼接）完整训练集
+
+    参数:
+        items: css 类条目
+        seed: 随机种子；清单中的 seed 不同时全部重新生成
+        manifest: 上次的清单，None 为全量生成
+        existing: 上次的数据 {sample_id: sample}
+        negatives: negative_gen.NegativeSampler，None 为全部默认组合
+
+    返回:
+        (按样本 ID 排序的去重样本列表, 新清单, 统计)
+
+    输出按样本 ID 排序：顺序与处理顺序无关，改动一个类只影响它自己的样本行。
+    """
+    existing = existing or {}
+    old_classes = {}
+    if manifest is not None and manifest.get('seed') == seed:
+        old_classes = manifest['classes']
+
+    pool = {}
+    classes = {}
+    stats = Counter()
+
+    def add_samples(samples):
+        ids = []
+        for item in samples:
+            sid = sample_id(item)
+            if sid is None:
+                continue
+            pool.setdefault(sid, item)
+            if sid not in ids:
+                ids.append(sid)
+        return ids
+
+    for item in items:
+        name = item['className']
+        digest = content_hash(item)
+        old = old_classes.get(name)
+        # 上次的数据没有元数据（旧版本生成）时重新生成，保证每条样本都带 type / template
+        if old and old['hash'] == digest and all(existing.get(sid, {}).get('type') for sid in old['samples']):
+            ids = old['samples']
+            for sid in ids:
+                pool.setdefault(sid, existing[sid])
+            stats['reused'] += 1
+        else:
+            ids = add_samples(generate_training_samples(item, class_rng(name, seed)))
+            stats['changed' if old else 'added'] += 1
+        classes[name] = {'hash': digest, 'samples': ids}
+
+    stats['removed'] = sum(1 for name in old_classes if name not in classes and name != STATIC_KEY)
+
+    # 固定样本生成成本很低，每次都重新生成
+    static_samples = build_static_samples(negatives)
+    classes[STATIC_KEY] = {
+        'hash': content_hash(static_samples),
+        'samples': add_samples(static_samples),
+    }
+    stats['negatives'] = sum(1 for item in static_samples if item['type'] == 'negative')
+
+    new_manifest = {'version': MANIFEST_VERSION, 'seed': seed, 'classes': classes}
+    return [pool[sid] for sid in sorted(pool)], new_manifest, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流式 + 多进程生成训练样本（JSONL）")
+    parser.add_argument('--input', default='css_classes.json', help='CSS 类定义（.json 数组或 .jsonl）')
+    parser.add_argument('--output', default='training_data.jsonl', help='输出 JSONL 路径（分片时为目录）')
+    parser.add_argument('--shard-format', choices=['arrow', 'jsonl'], default=None,
+                        help='写成 dataset_store 分片目录而不是单个 JSONL')
+    parser.add_argument('--shard-size', type=int, default=None, help='每个分片的样本数')
+    parser.add_argument('--workers', type=int, default=None, help='进程数（默认 CPU 核数，1 为串行）')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每个任务处理的类数')
+    parser.add_argument('--no-static', action='store_true', help='不追加系统/负样本/组合样本')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子（每个类独立派生，输出可复现）')
+    parser.add_argument('--near-dedup', type=float, default=None, metavar='THRESHOLD',
+                        help='近似去重的相似度阈值（near_dedup.py，默认不做）')
+    parser.add_argument('--max-per-cluster', type=int, default=None, help='近似去重时每簇保留的样本数')
+    parser.add_argument('--negatives', type=int, default=None,
+                        help='问题库 × 模板组合出的负样本条数（按 --seed 抽样，默认全部组合）')
+    parser.add_argument('--negative-bank', action='append', default=[], metavar='NAME=PATH',
+                        help='负样本问题库（可重复，见 negative_gen.py）')
+    parser.add_argument('--negative-templates', default=None, help='负样本提问模板文件')
+    args = parser.parse_args(argv)
+
+    from negative_gen import build_sampler
+    negatives = build_sampler(args.negatives, args.seed, args.negative_bank, args.negative_templates)
+
+    near_deduper = None
+    if args.near_dedup is not None:
+        from near_dedup import DEFAULT_MAX_PER_CLUSTER, NearDeduper
+        near_deduper = NearDeduper(args.near_dedup, args.max_per_cluster or DEFAULT_MAX_PER_CLUSTER)
+
+    print(f"🚀 生成训练样本: {args.input} -> {args.output}")
+    stats = run(
+        args.input,
+        args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        include_static=not args.no_static,
+        seed=args.seed,
+        shard_format=args.shard_format,
+        shard_size=args.shard_size,
+        near_deduper=near_deduper,
+        negatives=negatives,
+    )
+    print(f"📊 CSS 类: {stats['classes']} 个")
+    if not args.no_static:
+        print(f"📊 负样本组合: {len(negatives.space):,} 个，使用 {len(negatives):,} 条（另有手写负样本）")
+    print(f"✅ 生成样本: {stats['generated']} 条，去重后写出: {stats['written']} 条")
+    if near_deduper is not None:
+        from near_dedup import print_report
+        print_report(near_deduper.report())
+    print(f"⏱️  耗时: {stats['seconds']:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+训练数据分片存储
+
+格式:
+  - arrow: Arrow IPC stream 分片，datasets.Dataset.from_file 直接内存映射，
+           不需要 JSON 解析，也不会在 ~/.cache/huggingface 重建缓存
+  - jsonl: JSONL 分片 + 行偏移索引（.idx，uint64 小端），按需 mmap 读取单条
+
+目录结构:
+  <dir>/index.json               格式、列名、每个分片的样本数
+  <dir>/data/shard-00000.arrow   分片（单独放在 data/ 下，LLaMA-Factory 可直接把它当数据目录）
+  <dir>/tags/                    样本元数据（可选，见下）
+
+样本元数据:
+  生成器给每条样本标注 type（样本类型）、template（模板 ID）、class_name（来源类名），
+  按列字典编码存在 tags/ 下：每列一个 <列名>.bin（每条样本一个类别下标，-1 为缺失），
+  类别表在 tags/index.json。.json / .jsonl 单文件数据的元数据放在 <文件名>.tags 目录
+  （training_data.json -> training_data.json.tags，与 training_data.jsonl 的互不覆盖）。
+  报告、采样、评估按下标过滤，不需要重新扫描文本；训练用的文本列不变。
+
+用法:
+  python dataset_store.py training_data.json training_data_shards --format arrow
+  python dataset_store.py training_data.jsonl training_data_shards --format jsonl --shard-size 50000
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+
+INDEX_FILE = 'index.json'
+DATA_DIR = 'data'
+INDEX_VERSION = 1
+DEFAULT_SHARD_SIZE = 100_000  # 每个分片的样本数
+ARROW_BATCH_SIZE = 10_000  # 每个 RecordBatch 的样本数
+COLUMNS = ['instruction', 'input', 'output']
+FORMATS = ('arrow', 'jsonl')
+TAGS_DIR = 'tags'
+TAGS_VERSION = 1
+TAG_COLUMNS = ('type', 'template', 'class_name')  # 元数据列
+# 类别下标写出时的类型：按类别数取能放下的最窄类型（array 类型码, 上限）
+TAG_DTYPES = (('b', 1 << 7), ('h', 1 << 15), ('i', 1 << 31))
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise ImportError("arrow 格式需要 pyarrow，请先运行: pip install pyarrow")
+    return pyarrow
+
+
+# ========== 写入 ==========
+def tags_dir(path):
+    """样本元数据目录：分片目录下的 tags/，单文件数据为 <完整文件名>.tags（保留扩展名，.json / .jsonl 不冲突）"""
+    if os.path.isdir(path):
+        return os.path.join(path, TAGS_DIR)
+    return f"{path}.tags"
+
+
+class TagWriter:
+    """
+    流式收集样本元数据，按列字典编码写出（内存中只保留下标和类别表）
+
+    收集时下标一律为 int32，close() 时按每列最终的类别数收窄到 int8 / int16 / int32，
+    模板或类名再多也不会在写到一半时溢出
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.codes = {column: array('i') for column in TAG_COLUMNS}
+        self.categories = {column: {} for column in TAG_COLUMNS}
+        self.num_tagged = 0
+
+    def write(self, sample):
+        tagged = False
+        for column, codes in self.codes.items():
+            value = sample.get(column)
+            if value is None or value == '':
+                codes.append(-1)
+            else:
+                categories = self.categories[column]
+                codes.append(categories.setdefault(value, len(categories)))
+                tagged = True
+        self.num_tagged += tagged
+
+    def close(self, data_path=None):
+        """
+        写出元数据目录并返回其索引；没有任何样本带元数据时只删除旧目录，返回 None
+
+        data_path: 对应的单文件数据，记录其大小，数据被改写后元数据自动失效
+        """
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+        if not self.num_tagged:
+            return None
+        dtypes = {}
+        for column, categories in self.categories.items():
+            fits = [typecode for typecode, limit in TAG_DTYPES if len(categories) < limit]
+            if not fits:
+                raise ValueError(f"元数据列 {column} 的类别数 {len(categories):,} 超出 int32 下标范围")
+            dtypes[column] = fits[0]
+        tmp_dir = f"{self.out_dir.rstrip(os.sep)}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        columns = {}
+        for column, codes in self.codes.items():
+            with open(os.path.join(tmp_dir, f"{column}.bin"), 'wb') as f:
+                if dtypes[column] != codes.typecode:
+                    codes = array(dtypes[column], codes)
+                if sys.byteorder != 'little':
+                    codes = array(codes.typecode, codes)
+                    codes.byteswap()
+                codes.tofile(f)
+            columns[column] = {'dtype': codes.typecode, 'categories': list(self.categories[column])}
+        index = {'version': TAGS_VERSION, 'num_samples': len(self.codes['type']), 'columns': columns}
+        if data_path is not None:
+            index['data_size'] = os.path.getsize(data_path)
+        with open(os.path.join(tmp_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_dir, self.out_dir)
+        return index
+
+
+class ShardWriter:
+    """
+    流式写出分片，内存中最多保留一个 RecordBatch
+
+    用法:
+        with ShardWriter('training_data_shards', fmt='arrow') as writer:
+            for sample in samples:
+                writer.write(sample)
+    """
+
+    def __init__(self, out_dir, fmt='arrow', shard_size=DEFAULT_SHARD_SIZE, columns=COLUMNS):
+        if fmt not in FORMATS:
+            raise ValueError(f"未知格式: {fmt}（可选: {', '.join(FORMATS)}）")
+        if fmt == 'arrow':
+            self.pa = _require_pyarrow()
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.columns = list(columns)
+        self.shards = []
+        self._file = None
+        self._writer = None
+        self._offsets = None
+        self._batch = None
+        self._count = 0
+        self.index = None
+
+        # 先写到临时目录，完成后整体替换，避免读到半成品
+        self._tmp_dir = f"{out_dir.rstrip(os.sep)}.tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(os.path.join(self._tmp_dir, DATA_DIR))
+        self._tags = TagWriter(os.path.join(self._tmp_dir, TAGS_DIR))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            if self.index is None:
+                self.close()
+        else:
+            self._close_shard()
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def write(self, sample):
+        if self._file is None:
+            self._open_shard()
+        if self.fmt == 'arrow':
+            for column in self.columns:
+                self._batch[column].append(sample.get(column, ''))
+            if len(self._batch[self.columns[0]]) >= ARROW_BATCH_SIZE:
+                self._flush_batch()
+        else:
+            line = json.dumps({c: sample.get(c, '') for c in self.columns}, ensure_ascii=False)
+            self._file.write(line.encode('utf-8'))
+            self._file.write(b'\n')
+            self._offsets.append(self._file.tell())
+        self._tags.write(sample)
+        self._count += 1
+        if self._count >= self.shard_size:
+            self._close_shard()
+
+    def close(self):
+        """写完最后一个分片、元数据和 index.json，替换目标目录，返回索引"""
+        self._close_shard()
+        self._tags.close()
+        index = {
+            'version': INDEX_VERSION,
+            'format': self.fmt,
+            'columns': self.columns,
+            'num_samples': sum(shard['num_samples'] for shard in self.shards),
+            'shards': self.shards,
+        }
+        with open(os.path.join(self._tmp_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+        os.replace(self._tmp_dir, self.out_dir)
+        self.index = index
+        return index
+
+    def _shard_path(self, ext):
+        return os.path.join(DATA_DIR, f"shard-{len(self.shards):05d}.{ext}")
+
+    def _open_shard(self):
+        self._count = 0
+        if self.fmt == 'arrow':
+            path = self._shard_path('arrow')
+            schema = self.pa.schema([(c, self.pa.string()) for c in self.columns])
+            self._file = self.pa.OSFile(os.path.join(self._tmp_dir, path), 'wb')
+            self._writer = self.pa.ipc.new_stream(self._file, schema)
+            self._batch = {c: [] for c in self.columns}
+        else:
+            path = self._shard_path('jsonl')
+            self._file = open(os.path.join(self._tmp_dir, path), 'wb')
+            self._offsets = array('Q', [0])
+        self._path = path
+
+    def _flush_batch(self):
+        if self._batch[self.columns[0]]:
+            arrays = [self.pa.array(self._batch[c], type=self.pa.string()) for c in self.columns]
+            self._writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, names=self.columns))
+            self._batch = {c: [] for c in self.columns}
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+        shard = {'path': self._path, 'num_samples': self._count}
+        if self.fmt == 'arrow':
+            self._flush_batch()
+            self._writer.close()
+            self._file.close()
+        else:
+            self._file.close()
+            idx_path = os.path.splitext(self._path)[0] + '.idx'
+            with open(os.path.join(self._tmp_dir, idx_path), 'wb') as f:
+                if sys.byteorder != 'little':
+                    self._offsets.byteswap()
+                self._offsets.tofile(f)
+            shard['index'] = idx_path
+        self.shards.append(shard)
+        self._file = None
+        self._writer = None
+        self._offsets = None
+
+
+def write_shards(samples, out_dir, fmt='arrow', shard_size=DEFAULT_SHARD_SIZE):
+    """把样本流写成分片目录，返回索引"""
+    with ShardWriter(out_dir, fmt=fmt, shard_size=shard_size) as writer:
+        for sample in samples:
+            writer.write(sample)
+    return writer.index
+
+
+def write_json(samples, path):
+    """
+    把样本流写成 JSON 数组（与 json.dump(..., indent=2) 的输出一致，只含 COLUMNS），
+    元数据写到 <path>.tags 目录，返回写出的条数
+    """
+    tags = TagWriter(tags_dir(path))
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for sample in samples:
+            text = json.dumps({c: sample.get(c, '') for c in COLUMNS}, ensure_ascii=False, indent=2)
+            f.write(',\n  ' if count else '[\n  ')
+            f.write(text.replace('\n', '\n  '))
+            tags.write(sample)
+            count += 1
+        f.write('\n]' if count else '[]')
+    os.replace(tmp_path, path)
+    tags.close(path)
+    return count
+
+
+# ========== 读取 ==========
+def read_index(path):
+    with open(os.path.join(path, INDEX_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_shard_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+
+class JsonlShardReader:
+    """
+    按下标随机读取 JSONL 分片：mmap 数据和偏移索引，只解析被访问的那一行
+    """
+
+    def __init__(self, path):
+        self.index = read_index(path)
+        if self.index['format'] != 'jsonl':
+            raise ValueError(f"{path} 不是 jsonl 分片目录")
+        self._data = []
+        self._offsets = []
+        self._starts = []
+        total = 0
+        for shard in self.index['shards']:
+            self._starts.append(total)
+            total += shard['num_samples']
+            self._data.append(self._mmap(os.path.join(path, shard['path'])))
+            self._offsets.append(memoryview(self._mmap(os.path.join(path, shard['index']))).cast('Q'))
+        self._len = total
+
+    @staticmethod
+    def _mmap(path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        shard = bisect.bisect_right(self._starts, i) - 1
+        row = i - self._starts[shard]
+        offsets = self._offsets[shard]
+        return json.loads(self._data[shard][offsets[row]:offsets[row + 1]])
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self[i]
+
+
+def load_training_dataset(path):
+    """
+    训练脚本统一的数据加载入口，返回 datasets.Dataset
+
+      - arrow 分片目录: 内存映射，启动时不解析 JSON、不重建缓存
+      - jsonl 分片目录 / .json / .jsonl 文件: 走 load_dataset("json")
+    """
+    from datasets import concatenate_datasets, load_dataset, Dataset
+
+    if not is_shard_dir(path):
+        return load_dataset("json", data_files=path, split="train")
+
+    index = read_index(path)
+    shard_paths = [os.path.join(path, shard['path']) for shard in index['shards']]
+    if index['format'] == 'arrow':
+        shards = [Dataset.from_file(p) for p in shard_paths]
+        return shards[0] if len(shards) == 1 else concatenate_datasets(shards)
+    return load_dataset("json", data_files=shard_paths, split="train")
+
+
+def read_tags(path):
+    """
+    读取样本元数据，返回 {列名: (类别下标 array, 类别列表)}
+
+    没有元数据、版本不符或与数据对不上（数据被改写过）时返回 None
+    """
+    directory = tags_dir(path)
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('version') != TAGS_VERSION:
+        return None
+    if is_shard_dir(path):
+        if read_index(path)['num_samples'] != index['num_samples']:
+            return None
+    elif index.get('data_size') != os.path.getsize(path):
+        return None
+
+    tags = {}
+    for column, info in index['columns'].items():
+        codes = array(info['dtype'])
+        with open(os.path.join(directory, f"{column}.bin"), 'rb') as f:
+            codes.frombytes(f.read())
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        if len(codes) != index['num_samples']:
+            return None
+        tags[column] = (codes, info['categories'])
+    return tags
+
+
+def iter_samples(path, with_tags=False):
+    """
+    流式读取任意格式的训练数据（.json / .jsonl / 分片目录）
+
+    with_tags: 有元数据时把 type / template / class_name 填回样本（缺失为 None）
+    """
+    tags = read_tags(path) if with_tags else None
+    if tags is None:
+        yield from _iter_text(path)
+        return
+    for i, sample in enumerate(_iter_text(path)):
+        for column, (codes, categories) in tags.items():
+            code = codes[i]
+            sample[column] = categories[code] if code >= 0 else None
+        yield sample
+
+
+def _iter_text(path):
+    if is_shard_dir(path):
+        index = read_index(path)
+        if index['format'] == 'jsonl':
+            yield from JsonlShardReader(path)
+            return
+        pa = _require_pyarrow()
+        for shard in index['shards']:
+            with pa.memory_map(os.path.join(path, shard['path'])) as source:
+                for batch in pa.ipc.open_stream(source):
+                    yield from batch.to_pylist()
+        return
+
+    from data_engine import iter_records
+    yield from iter_records(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把训练数据转换为分片存储")
+    parser.add_argument('input', help='输入（.json / .jsonl / 分片目录）')
+    parser.add_argument('output', help='输出分片目录')
+    parser.add_argument('--format', choices=FORMATS, default='arrow')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='每个分片的样本数')
+    args = parser.parse_args(argv)
+
+    index = write_shards(iter_samples(args.input, with_tags=True), args.output, args.format, args.shard_size)
+    print(f"✅ 已写出 {index['num_samples']} 条样本，{len(index['shards'])} 个 {args.format} 分片 -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
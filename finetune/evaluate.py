@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+离线评估：按 className 划出评估集，批量贪心生成，统计准确率并写出 JSON 报告
+
+评估集:
+  - 按 className 的哈希划出 --eval-fraction 的类，这些类的所有样本（类名问答、解释、代码生成）都进入评估集；
+    负样本和其他样本按样本 ID 的哈希划分。划分只由 seed 决定，训练前用 --write-split 写出 train.json，
+    训练时 data_file 指向它，评估集上的类就是模型没见过的类
+指标:
+  - class_name:  回复中的类名与参考答案一致（"X" / "使用类名: X" / "可以使用 X" / <div className="X">）
+  - refusal:     负样本（与 CSS 无关的问题）回复为拒答
+  - explanation: "类名 X 的作用是什么？" 等解释类样本，回复与参考答案的字符 bigram F1
+  - --constrained: class_name 类样本用约束解码（constrained.py，只能生成已有类名），invalid 为回复中没有合法类名的比例
+  - 吞吐:        样本/s、生成 tokens/s（按类别分组、组内按长度排序后批量生成，前缀 KV cache 复用）
+
+用法:
+  python evaluate.py --write-split data_split                 # 写出 data_split/train.json、eval.json
+  python evaluate.py --adapter ./css_assistant_model          # 评估一个 LoRA 目录
+  python evaluate.py --merged ./css_assistant_merged          # 评估合并模型
+  python evaluate.py --run-dir ./output_model                 # 评估每个 checkpoint-*（基座只加载一次，已评估的跳过）
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+
+DEFAULT_DATA_FILE = "training_data.json"
+DEFAULT_CLASSES_FILE = "css_classes.json"
+DEFAULT_REPORT = "eval_report.json"
+REPORT_NAME = "eval_report.json"  # --run-dir 时每个 checkpoint 目录下的报告
+DEFAULT_EVAL_FRACTION = 0.05
+DEFAULT_SEED = 42
+DEFAULT_BATCH_SIZE = 16
+CATEGORIES = ('class_name', 'refusal', 'explanation', 'other')
+# 各类别的生成长度上限（遇到 <|im_end|> 提前停止）
+MAX_NEW_TOKENS = {'class_name': 48, 'refusal': 64, 'explanation': 128, 'other': 128}
+REFUSAL_MARKERS = ('只能', '专注于', '无法', '抱歉', '不涉及', '不能回答')
+# 样本类型（process_data.SAMPLE_TYPES）-> 评估类别，未列出的类型都是 class_name
+TYPE_CATEGORIES = {'negative': 'refusal', 'explanation': 'explanation', 'system': 'other', 'combination': 'other'}
+NUM_FAILURE_EXAMPLES = 20  # 报告中保留的错误样例数
+
+_ANSWER_PREFIXES = ('使用类名: ', '可以使用 ')
+_DIV_RE = re.compile(r'<div className="([^"]+)">')
+_EXPLAIN_RE = re.compile(r'^(?:类名\s*(\S+?)\s*的作用是什么[？?]?|解释一下\s*(\S+?)\s*这个类)$')
+_TOKEN_RE = re.compile(r'[\w-]+')
+
+
+# ========== 1. 划分 ==========
+def in_eval_split(key, fraction, seed):
+    """按 key 的哈希决定是否进入评估集（与处理顺序无关）"""
+    digest = hashlib.blake2b(f"{seed}:{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < fraction
+
+
+def extract_class(text, class_names):
+    """从回复中取出类名：先按训练数据的回复格式解析，再退回到第一个出现的类名"""
+    text = text.strip()
+    match = _DIV_RE.search(text)
+    if match:
+        text = match.group(1)
+    for prefix in _ANSWER_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):].strip()
+    if text in class_names:
+        return text
+    return next((token for token in _TOKEN_RE.findall(text) if token in class_names), None)
+
+
+def sample_category(item, class_names, refusal_outputs):
+    """
+    返回 (类别, 所属类名)；负样本和其他样本的类名为 None
+
+    样本带生成时标注的 type / class_name（dataset_store 元数据）时直接按类型映射，否则按回复格式推断
+    """
+    if item.get('type'):
+        category = TYPE_CATEGORIES.get(item['type'], 'class_name')
+        return category, item.get('class_name') if category in ('class_name', 'explanation') else None
+    if item['output'] in refusal_outputs:
+        return 'refusal', None
+    name = extract_class(item['output'], class_names)
+    if name is not None and item['output'].strip() in {
+        name, f'<div className="{name}">内容</div>', *(f"{prefix}{name}" for prefix in _ANSWER_PREFIXES)
+    }:
+        return 'class_name', name
+    match = _EXPLAIN_RE.match(item['instruction'].strip())
+    if match and (match.group(1) or match.group(2)) in class_names:
+        return 'explanation', match.group(1) or match.group(2)
+    return 'other', None
+
+
+def split_samples(samples, class_names, fraction=DEFAULT_EVAL_FRACTION, seed=DEFAULT_SEED):
+    """返回 (train, eval)；eval 中的样本带 category / class_name 字段"""
+    from process_data import NEGATIVE_OUTPUT, NEGATIVE_SAMPLES, sample_id
+
+    refusal_outputs = {item['output'] for item in NEGATIVE_SAMPLES} | {NEGATIVE_OUTPUT}
+    train, eval_items = [], []
+    for item in samples:
+        category, name = sample_category(item, class_names, refusal_outputs)
+        key = f"class:{name}" if name is not None else f"sample:{sample_id(item)}"
+        if in_eval_split(key, fraction, seed):
+            eval_items.append(dict(item, category=category, class_name=name))
+        else:
+            train.append(item)
+    return train, eval_items
+
+
+# ========== 2. 评分 ==========
+def is_refusal(text):
+    return any(marker in text for marker in REFUSAL_MARKERS)
+
+
+def bigram_f1(prediction, reference):
+    """字符 bigram 的 F1（中文描述没有分词，按字符比较）"""
+    pred = Counter(prediction[i:i + 2] for i in range(len(prediction) - 1))
+    ref = Counter(reference[i:i + 2] for i in range(len(reference) - 1))
+    overlap = sum((pred & ref).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(pred.values())
+    recall = overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def score(item, prediction, class_names):
+    """单条样本的得分（0~1）"""
+    if item['category'] == 'class_name':
+        return float(extract_class(prediction, class_names) == item['class_name'])
+    if item['category'] == 'refusal':
+        return float(is_refusal(prediction))
+    if item['category'] == 'explanation':
+        return bigram_f1(prediction.strip(), item['output'].strip())
+    return float(prediction.strip() == item['output'].strip())
+
+
+# ========== 3. 批量生成 ==========
+def generate_predictions(generator, items, batch_size=DEFAULT_BATCH_SIZE, constraint=None):
+    """按类别分组、组内按提示长度排序后批量贪心生成，返回 (predictions, 生成 token 数)"""
+    order = sorted(range(len(items)), key=lambda i: (items[i]['category'], len(items[i]['instruction'])
+                                                     + len(items[i].get('input', ''))))
+    predictions = [None] * len(items)
+    num_tokens = [0]
+
+    def count(row, token):
+        num_tokens[0] += 1
+
+    for category in CATEGORIES:
+        rows = [i for i in order if items[i]['category'] == category]
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            prompts = [
+                (items[i]['instruction'], items[i]['input']) if items[i].get('input') else items[i]['instruction']
+                for i in batch
+            ]
+            if category == 'class_name' and constraint is not None:
+                outputs = generator.generate(prompts, max_new_tokens=constraint.max_length + 1, on_token=count,
+                                             allowed_tokens=constraint)
+            else:
+                outputs = generator.generate(prompts, max_new_tokens=MAX_NEW_TOKENS[category], on_token=count)
+            for i, output in zip(batch, outputs):
+                predictions[i] = output
+    return predictions, num_tokens[0]
+
+
+def evaluate(generator, items, class_names, batch_size=DEFAULT_BATCH_SIZE, constraint=None):
+    """生成并打分，返回报告（dict）"""
+    start = time.perf_counter()
+    predictions, num_tokens = generate_predictions(generator, items, batch_size, constraint)
+    seconds = time.perf_counter() - start
+
+    scores = defaultdict(list)
+    type_scores = defaultdict(list)
+    failures = []
+    invalid = 0
+    for item, prediction in zip(items, predictions):
+        value = score(item, prediction, class_names)
+        scores[item['category']].append(value)
+        if item.get('type'):
+            type_scores[item['type']].append(value)
+        if item['category'] == 'class_name' and extract_class(prediction, class_names) is None:
+            invalid += 1
+        if value < 0.5 and len(failures) < NUM_FAILURE_EXAMPLES:
+            failures.append({'category': item['category'], 'instruction': item['instruction'],
+                             'input': item.get('input', ''), 'expected': item['output'], 'prediction': prediction})
+
+    metric_names = {'class_name': 'accuracy', 'refusal': 'accuracy', 'explanation': 'f1', 'other': 'exact_match'}
+    metrics = {
+        category: {'count': len(scores[category]), metric_names[category]: sum(scores[category]) / len(scores[category])}
+        for category in CATEGORIES if scores[category]
+    }
+    if 'class_name' in metrics:
+        metrics['class_name']['invalid'] = invalid / metrics['class_name']['count']
+    return {
+        'num_samples': len(items),
+        'constrained': constraint is not None,
+        'metrics': metrics,
+        # 按生成时标注的样本类型分组的平均得分（数据带元数据时）
+        'by_type': {name: {'count': len(values), 'score': sum(values) / len(values)}
+                    for name, values in sorted(type_scores.items())},
+        'throughput': {
+            'seconds': seconds,
+            'samples_per_s': len(items) / seconds if seconds else 0.0,
+            'generated_tokens': num_tokens,
+            'tokens_per_s': num_tokens / seconds if seconds else 0.0,
+            'batch_size': batch_size,
+        },
+        'failures': failures,
+    }
+
+
+# ========== 4. 命令行 ==========
+def list_checkpoints(run_dir):
+    found = []
+    for path in glob.glob(os.path.join(run_dir, 'checkpoint-*')):
+        match = re.search(r'checkpoint-(\d+)$', path)
+        if match:
+            found.append((int(match.group(1)), path))
+    return sorted(found)
+
+
+def print_report(report, title):
+    metrics = report['metrics']
+    parts = [f"{category} {next(v for k, v in m.items() if k != 'count'):.1%}（{m['count']}）"
+             for category, m in metrics.items()]
+    if 'class_name' in metrics:
+        parts.append(f"非法类名 {metrics['class_name']['invalid']:.1%}")
+    throughput = report['throughput']
+    print(f"📊 {title}: {'，'.join(parts)}")
+    if report.get('by_type'):
+        by_type = [f"{name} {m['score']:.1%}（{m['count']}）" for name, m in report['by_type'].items()]
+        print(f"   按样本类型: {'，'.join(by_type)}")
+    print(f"   {throughput['seconds']:.1f}s，{throughput['samples_per_s']:.1f} 样本/s，"
+          f"{throughput['tokens_per_s']:.0f} tokens/s")
+
+
+def write_json(payload, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSS 助手离线评估")
+    parser.add_argument('--data', default=DEFAULT_DATA_FILE, help='训练数据（.json / .jsonl / 分片目录）')
+    parser.add_argument('--classes', default=DEFAULT_CLASSES_FILE)
+    parser.add_argument('--eval-fraction', type=float, default=DEFAULT_EVAL_FRACTION, help='划入评估集的类比例')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--write-split', metavar='DIR', help='只写出 train.json / eval.json，不评估')
+    parser.add_argument('--base-model', default=None, help='基座模型（默认 inference.DEFAULT_BASE_MODEL）')
+    parser.add_argument('--adapter', help='LoRA 权重目录')
+    parser.add_argument('--merged', help='export_model.py 导出的合并模型目录')
+    parser.add_argument('--run-dir', help='评估该目录下的每个 checkpoint-*')
+    parser.add_argument('--redo', action='store_true', help='--run-dir 时重新评估已有报告的 checkpoint')
+    parser.add_argument('--template', default='simple')
+    parser.add_argument('--constrained', action='store_true', help='class_name 类样本用约束解码（只能生成已有类名）')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-samples', type=int, help='随机抽取 N 条评估（快速检查）')
+    parser.add_argument('--report', default=DEFAULT_REPORT, help='JSON 报告路径')
+    args = parser.parse_args(argv)
+
+    from dataset_store import iter_samples, write_json as write_samples
+
+    with open(args.classes, 'r', encoding='utf-8') as f:
+        class_names = {item['className'] for item in json.load(f)}
+    samples = iter_samples(args.data, with_tags=True)
+    train, eval_items = split_samples(samples, class_names, args.eval_fraction, args.seed)
+    counts = Counter(item['category'] for item in eval_items)
+    print(f"✓ 评估集: {len(eval_items)} 条（{', '.join(f'{k} {v}' for k, v in sorted(counts.items()))}），"
+          f"训练集 {len(train)} 条")
+
+    if args.write_split:
+        os.makedirs(args.write_split, exist_ok=True)
+        # 只写文本列，样本类型等元数据写到 train.json.tags / eval.json.tags，训练时仍可按类型混合
+        write_samples(train, os.path.join(args.write_split, 'train.json'))
+        write_samples(eval_items, os.path.join(args.write_split, 'eval.json'))
+        print(f"✓ 已写出: {args.write_split}/train.json、eval.json（训练时 data_file 指向 train.json）")
+        return 0
+    if args.max_samples and args.max_samples < len(eval_items):
+        eval_items = random.Random(args.seed).sample(eval_items, args.max_samples)
+
+    from inference import DEFAULT_BASE_MODEL, Generator, load_model
+
+    args.base_model = args.base_model or DEFAULT_BASE_MODEL
+
+    def make_constraint(tokenizer):
+        if not args.constrained:
+            return None
+        from constrained import ClassNameConstraint
+
+        return ClassNameConstraint(tokenizer, sorted(class_names))
+
+    split_info = {'eval_fraction': args.eval_fraction, 'seed': args.seed, 'data': args.data}
+    if not args.run_dir:
+        model, tokenizer = load_model(args.merged or args.base_model, None if args.merged else args.adapter)
+        report = evaluate(Generator(model, tokenizer, args.template), eval_items, class_names, args.batch_size,
+                          make_constraint(tokenizer))
+        report.update(model=args.merged or args.base_model, adapter=args.adapter, split=split_info)
+        print_report(report, args.merged or args.adapter or args.base_model)
+        write_json(report, args.report)
+        print(f"✓ 报告: {args.report}")
+        return 0
+
+    # 多个 checkpoint：基座只加载一次，逐个切换 LoRA 权重
+    from peft import PeftModel
+
+    checkpoints = [(step, path) for step, path in list_checkpoints(args.run_dir)
+                   if args.redo or not os.path.exists(os.path.join(path, REPORT_NAME))]
+    if not checkpoints:
+        print(f"没有需要评估的 checkpoint: {args.run_dir}")
+        return 0
+    base, tokenizer = load_model(args.base_model)
+    constraint = make_constraint(tokenizer)
+    model, previous = None, None
+    for step, path in checkpoints:
+        name = f"step{step}"
+        if model is None:
+            model = PeftModel.from_pretrained(base, path, adapter_name=name)
+        else:
+            model.load_adapter(path, adapter_name=name)
+            model.set_adapter(name)
+            model.delete_adapter(previous)
+        model.eval()
+        previous = name
+        report = evaluate(Generator(model, tokenizer, args.template), eval_items, class_names, args.batch_size,
+                          constraint)
+        report.update(model=args.base_model, adapter=path, step=step, split=split_info)
+        write_json(report, os.path.join(path, REPORT_NAME))
+        print_report(report, os.path.basename(path))
+
+    summary = []
+    for step, path in list_checkpoints(args.run_dir):
+        report_path = os.path.join(path, REPORT_NAME)
+        if os.path.exists(report_path):
+            with open(report_path, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+            summary.append({'step': step, 'metrics': report['metrics'], 'throughput': report['throughput']})
+    write_json({'run_dir': args.run_dir, 'split': split_info, 'checkpoints': summary}, args.report)
+    print(f"✓ 汇总报告: {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
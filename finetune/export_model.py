@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+导出合并模型：把 LoRA 权重合并进基座模型，保存为 safetensors
+
+  - 合并后推理不再需要 peft，也没有 LoRA 旁路的额外矩阵乘，启动只读一份权重
+  - --int8：线性层按输出通道对称量化为 int8（权重 + 每通道 scale），只用于 CPU 推理，
+            加载时直接构造动态量化线性层（int8 矩阵乘），体积约为 fp16 的一半
+  - 导出目录带 export_info.json，inference.load_model 据此识别，test_model.py / serve.py 优先加载
+
+用法:
+  python export_model.py                                   # css_assistant_model → css_assistant_merged
+  python export_model.py --int8                            # → css_assistant_merged-int8
+  python export_model.py --adapter ./output_model --output ./merged --dtype bfloat16
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import torch
+
+from inference import DEFAULT_ADAPTER_PATH, DEFAULT_BASE_MODEL, DEFAULT_MERGED_PATH, EXPORT_INFO_FILE, INT8_WEIGHTS_FILE
+
+DTYPES = {'float16': torch.float16, 'bfloat16': torch.bfloat16, 'float32': torch.float32}
+SKIP_QUANTIZE = ('lm_head',)  # 输出层对量化误差敏感，保持浮点
+
+
+# ========== 1. 合并 ==========
+def merge_adapter(base_model, adapter_path):
+    """float32 下合并（避免 fp16 累加误差），返回 (model, tokenizer)"""
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=torch.float32, trust_remote_code=True)
+    model = PeftModel.from_pretrained(model, adapter_path).merge_and_unload()
+    # 训练时保存过分词器就用 adapter 目录里的，否则用基座的
+    tokenizer_source = adapter_path if os.path.exists(os.path.join(adapter_path, 'tokenizer_config.json')) else base_model
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_source, trust_remote_code=True)
+    return model, tokenizer
+
+
+# ========== 2. int8 量化 ==========
+def quantize_weight(weight):
+    """按输出通道对称量化：weight ≈ qweight * scale[:, None]"""
+    weight = weight.float()
+    scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+    qweight = torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8)
+    return qweight, scale
+
+
+def int8_state_dict(model, dtype):
+    """线性层权重换成 int8 + scale，其余张量转为 dtype；共享的张量（tied embedding）只保存一份"""
+    linear_weights = {
+        f"{name}.weight" for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and name.split('.')[-1] not in SKIP_QUANTIZE
+    }
+    state, seen = {}, set()
+    for name, tensor in model.state_dict().items():
+        if tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        if name in linear_weights:
+            state[name], state[f"{name}_scale"] = quantize_weight(tensor)
+        else:
+            state[name] = tensor.to(dtype).contiguous()
+    return state, sorted(name[:-len('.weight')] for name in linear_weights)
+
+
+# ========== 3. 保存 ==========
+def export(base_model, adapter_path, output_dir, dtype='float16', int8=False):
+    from safetensors.torch import save_file
+
+    start = time.perf_counter()
+    model, tokenizer = merge_adapter(base_model, adapter_path)
+    print(f"✓ 合并完成（{time.perf_counter() - start:.1f}s）")
+
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    info = {
+        'base_model': base_model,
+        'adapter': os.path.abspath(adapter_path),
+        'dtype': dtype,
+        'quantization': 'int8' if int8 else None,
+    }
+    if int8:
+        state, quantized = int8_state_dict(model, DTYPES[dtype])
+        save_file(state, os.path.join(output_dir, INT8_WEIGHTS_FILE), metadata={'format': 'pt'})
+        model.config.save_pretrained(output_dir)
+        model.generation_config.save_pretrained(output_dir)
+        info['quantized_modules'] = quantized
+        print(f"✓ int8 量化: {len(quantized)} 个线性层")
+    else:
+        model.to(DTYPES[dtype]).save_pretrained(output_dir, safe_serialization=True)
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, EXPORT_INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+    size = sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir))
+    print(f"✓ 已导出: {output_dir}（{size / 1024 ** 2:.1f} MB）")
+    return output_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合并 LoRA 权重并导出 safetensors")
+    parser.add_argument('--base-model', default=DEFAULT_BASE_MODEL)
+    parser.add_argument('--adapter', default=DEFAULT_ADAPTER_PATH, help='LoRA 权重目录')
+    parser.add_argument('--output', help=f'输出目录（默认 {DEFAULT_MERGED_PATH}，--int8 时加 -int8 后缀）')
+    parser.add_argument('--dtype', choices=DTYPES, default='float16', help='保存的浮点精度（int8 时指未量化的张量）')
+    parser.add_argument('--int8', action='store_true', help='线性层量化为 int8（仅 CPU 推理）')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.adapter):
+        print(f"❌ LoRA 权重目录不存在: {args.adapter}")
+        return 1
+    output = args.output or (f"{DEFAULT_MERGED_PATH}-int8" if args.int8 else DEFAULT_MERGED_PATH)
+    print(f"📦 {args.base_model} + {args.adapter} → {output}")
+    export(args.base_model, args.adapter, output, args.dtype, args.int8)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
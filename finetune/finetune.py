@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+统一训练入口：读取 train_config.yaml，选择 Transformers + PEFT 或 LLaMA-Factory 后端
+
+  - 一份配置：LLaMA-Factory 的参数名为准，另加几个引擎参数（backend / data_file / chat_template ...）
+  - 一份数据：两个后端都先经过 token_cache 预分词（同一份缓存），
+              LLaMA-Factory 通过 tokenized_path 直接加载，不再自己分词
+  - 按需导入：只导入选中的后端，--dry-run / --help 不导入 torch
+
+用法:
+  python finetune.py                                   # train_config.yaml，backend 由配置决定
+  python finetune.py --backend llamafactory
+  python finetune.py --set learning_rate=1e-4 --set num_train_epochs=1
+  python finetune.py --resume none                     # 忽略已有 checkpoint
+  python finetune.py --dry-run                         # 只打印合并后的配置
+"""
+
+import argparse
+import os
+import sys
+import time
+
+START_TIME = time.perf_counter()  # 用于统计启动到第一个优化步的耗时
+
+import yaml
+
+DEFAULT_CONFIG = "train_config.yaml"
+BACKENDS = ('transformers', 'llamafactory')
+
+# 引擎自己的参数（传给 LLaMA-Factory 前去掉）及默认值
+ENGINE_DEFAULTS = {
+    'backend': 'transformers',
+    'data_file': 'training_data.json',  # .json / .jsonl / dataset_store 分片目录
+    'chat_template': 'simple',  # chat_format.TEMPLATES
+    'label_mode': 'assistant',  # assistant / all
+    'token_cache_dir': '.token_cache',
+    'group_by_length': True,  # 仅 transformers 后端
+    'packing': False,  # 仅 transformers 后端
+    'mix_ratios': {},  # 样本类型占每个 epoch 的比例，如 {negative: 0.08}（仅 transformers 后端，打包时不生效）
+    'class_balance': 0.0,  # 同一类型内按 className 均衡的强度 0 ~ 1（仅 transformers 后端）
+    'llamafactory_dir': 'LLaMA-Factory',  # 未 pip 安装 llamafactory 时从该目录的 src/ 导入
+    'metrics_port': 8790,  # 训练状态接口端口（null 为不启动），指标写入 output_dir/training_metrics.jsonl
+}
+
+# lora_target: all 对应的 Qwen 线性层
+ALL_LORA_TARGETS = ['q_proj', 'k_proj', 'v_proj', 'o_proj', 'gate_proj', 'up_proj', 'down_proj']
+
+
+# ========== 1. 配置 ==========
+def parse_override(text):
+    """--set key=value，value 按 YAML 解析（数字/布尔值自动转换）"""
+    key, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"--set 需要 key=value 格式: {text}")
+    return key.strip(), yaml.safe_load(value)
+
+
+def load_config(path, overrides=(), backend=None):
+    """读取 YAML 配置，补全引擎默认值并应用命令行覆盖"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    for key, value in ENGINE_DEFAULTS.items():
+        config.setdefault(key, value)
+    for key, value in overrides:
+        config[key] = value
+    if backend:
+        config['backend'] = backend
+    if config['backend'] not in BACKENDS:
+        raise ValueError(f"未知后端: {config['backend']}（可选: {', '.join(BACKENDS)}）")
+    if config.get('finetuning_type', 'lora') != 'lora':
+        raise ValueError("目前只支持 finetuning_type: lora")
+    return config
+
+
+# ========== 2. 数据（两个后端共用） ==========
+def prepare_dataset(config, tokenizer):
+    from token_cache import load_or_build
+
+    return load_or_build(
+        config['data_file'],
+        tokenizer,
+        template=config['chat_template'],
+        max_length=config.get('cutoff_len', 512),
+        cache_root=config['token_cache_dir'],
+        label_mode=config['label_mode'],
+        limit=config.get('max_samples'),
+    )
+
+
+def sample_weights(config, dataset):
+    """按 mix_ratios / class_balance 计算每条样本的采样权重，未配置时返回 None"""
+    from sample_mix import load_tags, mix_report, mixture_weights, print_mix
+
+    if not (config['mix_ratios'] or config['class_balance']):
+        return None
+    types, classes, _ = load_tags(config['data_file'], limit=len(dataset))
+    weights = mixture_weights(types, classes, config['mix_ratios'], config['class_balance'])
+    print(f"  训练样本混合（className 均衡 {config['class_balance']}）:")
+    print_mix(mix_report(types, classes, weights))
+    return weights
+
+
+def load_tokenizer(config):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(
+        config['model_name_or_path'], trust_remote_code=config.get('trust_remote_code', True)
+    )
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+# ========== 3. Transformers + PEFT 后端 ==========
+def training_arguments(config):
+    """配置中 TrainingArguments 认识的键"""
+    import dataclasses
+
+    from transformers import TrainingArguments
+
+    names = {field.name for field in dataclasses.fields(TrainingArguments)}
+    kwargs = {key: value for key, value in config.items() if key in names}
+    kwargs.setdefault('report_to', 'none')
+    return TrainingArguments(**kwargs)
+
+
+def run_transformers(config, resume):
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from transformers import AutoModelForCausalLM
+
+    from batching import (
+        DynamicPaddingCollator,
+        LengthGroupedTrainer,
+        PackedDataset,
+        PackingCollator,
+        report_packing,
+        report_padding,
+    )
+    from train_callbacks import ResumeCallback, resolve_checkpoint
+    from training_metrics import METRICS_FILE_NAME, TrainingMetricsCallback
+
+    max_length = config.get('cutoff_len', 512)
+    batch_size = config.get('per_device_train_batch_size', 8)
+    checkpoint = resolve_checkpoint(resume, config['output_dir'])
+
+    print("\n[1/4] 加载分词器和训练数据...")
+    tokenizer = load_tokenizer(config)
+    dataset = prepare_dataset(config, tokenizer)
+
+    print("\n[2/4] 加载模型并配置 LoRA...")
+    if config.get('bf16'):
+        dtype = torch.bfloat16
+    elif config.get('fp16'):
+        dtype = torch.float16
+    else:
+        dtype = torch.float32
+    model = AutoModelForCausalLM.from_pretrained(
+        config['model_name_or_path'],
+        torch_dtype=dtype,
+        device_map="auto",
+        trust_remote_code=config.get('trust_remote_code', True),
+    )
+    target = config.get('lora_target', 'all')
+    target_modules = ALL_LORA_TARGETS if target == 'all' else [t.strip() for t in str(target).split(',')]
+    model = get_peft_model(model, LoraConfig(
+        r=config.get('lora_rank', 8),
+        lora_alpha=config.get('lora_alpha', 16),
+        lora_dropout=config.get('lora_dropout', 0.05),
+        target_modules=target_modules,
+        bias="none",
+        task_type="CAUSAL_LM",
+    ))
+    model.print_trainable_parameters()
+
+    print("\n[3/4] 组 batch...")
+    gradient_accumulation_steps = config.get('gradient_accumulation_steps', 1)
+    if config['packing']:
+        train_dataset = PackedDataset(dataset, max_length)
+        report_packing(dataset.lengths, train_dataset, batch_size, gradient_accumulation_steps)
+        data_collator = PackingCollator(tokenizer.pad_token_id, model.config._attn_implementation, model.dtype)
+    else:
+        train_dataset = dataset
+        report_padding(dataset.lengths, batch_size, max_length)
+        data_collator = DynamicPaddingCollator(tokenizer.pad_token_id, max_length=max_length)
+    weights = None if config['packing'] else sample_weights(config, dataset)
+
+    print("\n[4/4] 开始训练...")
+    if checkpoint:
+        print(f"  从 checkpoint 恢复: {checkpoint}")
+    resume_callback = ResumeCallback(START_TIME)
+    metrics_callback = TrainingMetricsCallback(os.path.join(config['output_dir'], METRICS_FILE_NAME),
+                                               config['metrics_port'], data_collator)
+    trainer = LengthGroupedTrainer(
+        model=model,
+        args=training_arguments(config),
+        train_dataset=train_dataset,
+        data_collator=data_collator,
+        lengths=dataset.lengths if config['group_by_length'] and not config['packing'] else None,
+        sample_weights=weights,
+        callbacks=[resume_callback, metrics_callback],
+    )
+    train_result = trainer.train(resume_from_checkpoint=checkpoint)
+    runtime = train_result.metrics["train_runtime"]
+    print(f"  优化步数: {trainer.state.global_step}，实际 padding 效率: {data_collator.efficiency:.1%}，"
+          f"有效吞吐: {data_collator.real_tokens / runtime:.0f} tokens/s")
+
+    if resume_callback.interrupted:
+        print(f"\n⏸️  训练已暂停，checkpoint 保存在: {config['output_dir']}/checkpoint-{trainer.state.global_step}")
+        return
+    model.save_pretrained(config['output_dir'])
+    tokenizer.save_pretrained(config['output_dir'])
+
+
+# ========== 4. LLaMA-Factory 后端 ==========
+def llamafactory_args(config, tokenized_path=None):
+    """去掉引擎参数；有预分词结果时通过 tokenized_path 传给 LLaMA-Factory"""
+    args = {key: value for key, value in config.items() if key not in ENGINE_DEFAULTS}
+    if tokenized_path:
+        args['tokenized_path'] = tokenized_path
+        args.pop('overwrite_cache', None)
+    return args
+
+
+def run_llamafactory(config, resume):
+    from token_cache import export_hf_dataset
+    from train_callbacks import resolve_checkpoint
+    from training_metrics import METRICS_FILE_NAME, TrainingMetricsCallback
+
+    print("\n[1/2] 预分词（与 transformers 后端共用缓存）...")
+    tokenizer = load_tokenizer(config)
+    tokenized_path = export_hf_dataset(prepare_dataset(config, tokenizer))
+    print(f"✓ tokenized_path: {tokenized_path}")
+
+    args = llamafactory_args(config, tokenized_path)
+    checkpoint = resolve_checkpoint(resume, config['output_dir'])
+    if checkpoint:
+        args['resume_from_checkpoint'] = checkpoint
+        args['overwrite_output_dir'] = False
+
+    src_dir = os.path.join(config['llamafactory_dir'], 'src')
+    if os.path.isdir(src_dir):
+        sys.path.insert(0, os.path.abspath(src_dir))
+    try:
+        from llamafactory.train.tuner import run_exp
+    except ImportError:
+        raise ImportError("未找到 LLaMA-Factory：pip install llamafactory，或把 llamafactory_dir 指向源码目录")
+
+    print("\n[2/2] 开始训练（LLaMA-Factory）...")
+    # LLaMA-Factory 自己组 batch，token 数按 attention_mask 统计
+    run_exp(args, callbacks=[TrainingMetricsCallback(os.path.join(config['output_dir'], METRICS_FILE_NAME),
+                                                     config['metrics_port'])])
+
+
+# ========== 5. 命令行 ==========
+def print_summary(config):
+    print("=" * 60)
+    print(f"🚀 CSS 助手微调（后端: {config['backend']}）")
+    print("=" * 60)
+    print(f"📦 基座模型: {config['model_name_or_path']}")
+    print(f"📊 训练数据: {config['data_file']}（模板 {config['chat_template']}，label {config['label_mode']}）")
+    print(f"🔧 LoRA: rank={config.get('lora_rank')}，target={config.get('lora_target')}")
+    print(f"📈 batch: {config.get('per_device_train_batch_size')} × {config.get('gradient_accumulation_steps', 1)}，"
+          f"lr={config.get('learning_rate')}，epochs={config.get('num_train_epochs')}")
+    print(f"💾 输出目录: {config['output_dir']}")
+    print("=" * 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSS 助手统一训练入口")
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='YAML 配置文件')
+    parser.add_argument('--backend', choices=BACKENDS, help='覆盖配置中的 backend')
+    parser.add_argument('--set', dest='overrides', action='append', type=parse_override, default=[],
+                        metavar='KEY=VALUE', help='覆盖配置项（可多次指定）')
+    parser.add_argument('--resume', default='auto',
+                        help='auto: 从 output_dir 下最新的 checkpoint 继续；none: 从头训练；或指定 checkpoint 路径')
+    parser.add_argument('--dry-run', action='store_true', help='只打印合并后的配置')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config, args.overrides, args.backend)
+    if args.dry_run:
+        print(yaml.safe_dump(config, allow_unicode=True, sort_keys=False), end='')
+        return 0
+
+    print_summary(config)
+    if config['backend'] == 'llamafactory':
+        run_llamafactory(config, args.resume)
+    else:
+        run_transformers(config, args.resume)
+    print(f"\n✅ 完成！输出目录: {config['output_dir']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,17 +2,30 @@ from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
     TrainingArguments,
-    Trainer,
-    DataCollatorForLanguageModeling,
 )
 from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
-from datasets import load_dataset
+from batching import (
+    DynamicPaddingCollator,
+    LengthGroupedTrainer,
+    PackedDataset,
+    PackingCollator,
+    report_packing,
+    report_padding,
+)
+from token_cache import load_or_build
 import torch
 
 # ========== 配置参数 ==========
 MODEL_NAME = "Qwen/Qwen2-1.5B-Instruct"  # 推荐使用Qwen系列
 OUTPUT_DIR = "./css_assistant_model"
+DATA_FILE = "training_data.json"  # 训练数据（.json / .jsonl / dataset_store 分片目录）
 MAX_LENGTH = 512  # CSS相关问答通常不需要太长
+CACHE_DIR = ".token_cache"  # 预分词缓存目录
+LABEL_MODE = "assistant"  # 只在 assistant 回复上计算 loss；"all" 为整段对话（含 system/user）
+BATCH_SIZE = 4
+GRADIENT_ACCUMULATION_STEPS = 4
+GROUP_BY_LENGTH = True  # 按长度分桶组 batch，减少 padding
+PACKING = False  # 序列打包：多条样本拼进一个 MAX_LENGTH 窗口，注意力不跨样本（开启后不再分桶）
 
 print("🚀 开始微调CSS类名助手...")
 
@@ -47,52 +60,29 @@ model = get_peft_model(model, lora_config)
 print("📊 可训练参数:")
 model.print_trainable_parameters()
 
-# ========== 加载数据 ==========
+# ========== 加载数据 + 预处理 ==========
+# 对话模板见 chat_format.py（css_assistant），分词结果缓存到 CACHE_DIR，下次启动直接复用
 print("\n📂 加载训练数据...")
-dataset = load_dataset("json", data_files="training_data.json", split="train")
-
-print(f"✅ 加载了 {len(dataset)} 条训练数据")
-
-
-# ========== 数据预处理 ==========
-def format_prompt(example):
-    """格式化为对话格式"""
-    prompt = f"""<|im_start|>system
-你是一个专业的CSS类名助手，帮助开发者快速查找和使用Tailwind风格的CSS类名。你的回答应该简洁、准确。<|im_end|>
-<|im_start|>user
-{example['instruction']}<|im_end|>
-<|im_start|>assistant
-{example['output']}<|im_end|>"""
-    return {"text": prompt}
-
-
-print("\n🔄 预处理数据...")
-dataset = dataset.map(format_prompt, remove_columns=dataset.column_names)
-
-
-def tokenize_function(examples):
-    result = tokenizer(
-        examples["text"],
-        padding="max_length",
-        truncation=True,
-        max_length=MAX_LENGTH,
-        return_tensors=None,
-    )
-    result["labels"] = result["input_ids"].copy()
-    return result
-
-
-tokenized_dataset = dataset.map(
-    tokenize_function, batched=True, remove_columns=["text"]
+tokenized_dataset = load_or_build(
+    DATA_FILE, tokenizer, template="css_assistant", max_length=MAX_LENGTH, cache_root=CACHE_DIR,
+    label_mode=LABEL_MODE,
 )
 
+print(f"✅ 加载了 {len(tokenized_dataset)} 条训练数据")
+if PACKING:
+    train_dataset = PackedDataset(tokenized_dataset, MAX_LENGTH)
+    report_packing(tokenized_dataset.lengths, train_dataset, BATCH_SIZE, GRADIENT_ACCUMULATION_STEPS)
+else:
+    train_dataset = tokenized_dataset
+    report_padding(tokenized_dataset.lengths, BATCH_SIZE, MAX_LENGTH, pad_to_multiple_of=8)
+
 # ========== 训练配置 ==========
 print("\n⚙️ 配置训练参数...")
 training_args = TrainingArguments(
     output_dir=OUTPUT_DIR,
     num_train_epochs=5,  # CSS数据较少，多训练几轮
-    per_device_train_batch_size=4,
-    gradient_accumulation_steps=4,
+    per_device_train_batch_size=BATCH_SIZE,
+    gradient_accumulation_steps=GRADIENT_ACCUMULATION_STEPS,
     learning_rate=2e-4,
     lr_scheduler_type="cosine",
     warmup_steps=100,
@@ -105,17 +95,27 @@ training_args = TrainingArguments(
 )
 
 # ========== 开始训练 ==========
-trainer = Trainer(
+if PACKING:
+    # 打包窗口：按模型的注意力实现传 position_ids 或 4D 块对角 mask
+    data_collator = PackingCollator(tokenizer.pad_token_id, model.config._attn_implementation, model.dtype)
+else:
+    # 动态 padding：只补齐到 batch 内最长样本；分桶采样让同一 batch 的样本长度相近
+    data_collator = DynamicPaddingCollator(tokenizer.pad_token_id, pad_to_multiple_of=8, max_length=MAX_LENGTH)
+trainer = LengthGroupedTrainer(
     model=model,
     args=training_args,
-    train_dataset=tokenized_dataset,
+    train_dataset=train_dataset,
     tokenizer=tokenizer,
-    data_collator=DataCollatorForLanguageModeling(tokenizer, mlm=False),
+    data_collator=data_collator,
+    lengths=tokenized_dataset.lengths if GROUP_BY_LENGTH and not PACKING else None,
 )
 
 print("\n🎯 开始训练...")
 print("=" * 60)
-trainer.train()
+train_result = trainer.train()
+runtime = train_result.metrics["train_runtime"]
+print(f"📊 优化步数: {trainer.state.global_step}，实际 padding 效率: {data_collator.efficiency:.1%}，"
+      f"有效吞吐: {data_collator.real_tokens / runtime:.0f} tokens/s")
 
 # ========== 保存模型 ==========
 print("\n💾 保存模型...")
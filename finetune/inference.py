@@ -0,0 +1,416 @@
+"""
+CSS 助手推理：模型加载 + 批量生成（test_model.py / serve.py 共用）
+
+  - 系统提示前缀（system + user 起始标记）只做一次前向，KV cache 在所有请求间复用
+  - 一批请求一起解码：每条请求的 user 部分左侧补齐，接在共享前缀之后
+  - 只解码新生成的 token，遇到 <|im_end|> 即停止
+  - 一个基座上可加载多个 LoRA（load_adapters），同一批请求可以各用各的 LoRA，前缀 KV cache 按 LoRA 分别计算
+  - 可直接加载 export_model.py 导出的合并模型（含 int8 版本），不经过 peft
+  - stream_css 逐 token 输出（交互模式），并统计首 token 延迟和 tokens/s
+  - search_css 按描述语义检索类名（semantic_index，默认用模型 hidden state 平均池化编码），不经过生成
+  - generate_css 可选生成结果缓存（response_cache.py），重复的问题不再生成
+  - generate_class_name 约束解码（constrained.py），只能生成 css_classes.json 中的类名
+"""
+
+import json
+import os
+import time
+import warnings
+
+import torch
+from transformers import DynamicCache
+
+from chat_format import ASSISTANT_PREFIX, IM_END, IM_START, TEMPLATES
+
+DEFAULT_BASE_MODEL = "Qwen/Qwen2.5-1.5B-Instruct"
+DEFAULT_ADAPTER_PATH = "./css_assistant_model"
+DEFAULT_MERGED_PATH = "./css_assistant_merged"  # export_model.py 的默认输出目录
+EXPORT_INFO_FILE = "export_info.json"
+INT8_WEIGHTS_FILE = "model_int8.safetensors"  # 不叫 model.safetensors，避免被 from_pretrained 误读
+DEFAULT_MAX_NEW_TOKENS = 256
+BASE_ADAPTER = "__base__"  # peft 约定的名称：该行不加 LoRA，只用基座模型
+
+
+def read_export_info(path):
+    """export_model.py 导出的合并模型目录返回导出信息，否则返回 None"""
+    info_path = os.path.join(path, EXPORT_INFO_FILE)
+    if not os.path.isfile(info_path):
+        return None
+    with open(info_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def resolve_model(base_model=DEFAULT_BASE_MODEL, adapter_path=DEFAULT_ADAPTER_PATH, merged_path=DEFAULT_MERGED_PATH):
+    """
+    选择要加载的模型，返回 (model_path, adapter_path)
+
+    优先使用合并模型目录；否则基座 + LoRA（LoRA 目录不存在时只用基座）。传 'none' 跳过对应项
+    """
+    if merged_path and merged_path != 'none' and read_export_info(merged_path):
+        return merged_path, None
+    if adapter_path and adapter_path != 'none' and os.path.isdir(adapter_path):
+        return base_model, adapter_path
+    return base_model, None
+
+
+def load_int8_model(path, info):
+    """加载 int8 合并模型：量化线性层直接构造为动态量化 Linear（CPU int8 矩阵乘），其余张量转 float32"""
+    from accelerate import init_empty_weights
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoModelForCausalLM
+    from transformers.modeling_utils import no_init_weights
+
+    with warnings.catch_warnings():  # torch.ao 量化接口的弃用提示，不影响使用
+        warnings.simplefilter('ignore')
+        from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+    config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+    # 空壳模型：不分配内存也不做随机初始化，权重全部来自文件
+    with no_init_weights(), init_empty_weights():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32, trust_remote_code=True)
+    state = load_file(os.path.join(path, INT8_WEIGHTS_FILE))
+    quantized = {name: (state.pop(f"{name}.weight"), state.pop(f"{name}.weight_scale"), state.pop(f"{name}.bias", None))
+                 for name in info['quantized_modules']}
+    # 先加载浮点张量（量化层不支持 load_state_dict），再替换线性层
+    model.load_state_dict({name: t.float() for name, t in state.items()}, strict=False, assign=True)
+    model.tie_weights()
+
+    for name, (qweight, scale, bias) in quantized.items():
+        parent_name, _, child = name.rpartition('.')
+        parent = model.get_submodule(parent_name)
+        linear = getattr(parent, child)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            # 文件里已经是 int8 + scale，直接组装成量化张量，不再重新量化
+            weight = torch._make_per_channel_quantized_tensor(
+                qweight, scale.double(), torch.zeros_like(scale, dtype=torch.long), 0
+            )
+        # 先用 1x1 构造（构造函数会为全零权重做一次 prepack），再换成真实权重
+        qlinear = DynamicQuantizedLinear(1, 1, bias_=bias is not None, dtype=torch.qint8)
+        qlinear.in_features, qlinear.out_features = linear.in_features, linear.out_features
+        qlinear.set_weight_bias(weight, None if bias is None else bias.float())
+        setattr(parent, child, qlinear)
+
+    missing = [name for name, p in model.named_parameters() if p.is_meta]
+    if missing:
+        raise ValueError(f"int8 权重文件缺少张量: {', '.join(missing[:5])}")
+    return model
+
+
+def load_model(base_model=DEFAULT_BASE_MODEL, adapter_path=None, dtype=None, device_map="auto"):
+    """
+    加载基座模型（+ LoRA 权重），返回 (model, tokenizer)
+
+    参数:
+        base_model: 基座模型名称或路径，也可以是 export_model.py 导出的合并模型目录
+        adapter_path: LoRA 权重目录，None 为只用基座模型（合并模型不能再加 LoRA）
+        dtype: 默认 GPU/MPS 上 float16，CPU 上 float32（int8 模型只在 CPU 上运行，忽略该参数）
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    info = read_export_info(base_model) if os.path.isdir(base_model) else None
+    if info and adapter_path:
+        raise ValueError(f"{base_model} 是合并模型，已包含 LoRA 权重，不能再加载 {adapter_path}")
+
+    if info and info.get('quantization') == 'int8':
+        model = load_int8_model(base_model, info)
+    else:
+        if dtype is None:
+            dtype = torch.float16 if torch.cuda.is_available() or torch.backends.mps.is_available() else torch.float32
+        model = AutoModelForCausalLM.from_pretrained(
+            base_model, device_map=device_map, torch_dtype=dtype, trust_remote_code=True
+        )
+    tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
+    if adapter_path:
+        from peft import PeftModel
+
+        model = PeftModel.from_pretrained(model, adapter_path)
+    model.eval()
+    return model, tokenizer
+
+
+def load_adapters(model, adapters):
+    """
+    在同一个基座模型上加载多个 LoRA，返回 PeftModel
+
+    参数:
+        model: load_model 加载的基座模型（或已加载 LoRA 的 PeftModel，继续往上加）
+        adapters: {名称: LoRA 目录}；生成时用 Generator.generate(..., adapters=[名称, ...]) 逐条指定
+    """
+    from peft import PeftModel
+
+    for name, path in adapters.items():
+        if isinstance(model, PeftModel):
+            model.load_adapter(path, adapter_name=name)
+        else:
+            model = PeftModel.from_pretrained(model, path, adapter_name=name)
+    model.eval()
+    return model
+
+
+def sample_next(logits, temperature=0.0, top_p=1.0):
+    """从最后一个位置的 logits 采样下一个 token（temperature=0 为贪心）"""
+    if temperature <= 0:
+        return logits.argmax(-1)
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    if top_p < 1.0:
+        sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+        # 去掉累计概率超过 top_p 的部分（至少保留概率最高的一个）
+        drop = sorted_probs.cumsum(-1) - sorted_probs > top_p
+        sorted_probs = sorted_probs.masked_fill(drop, 0)
+        probs = torch.zeros_like(probs).scatter_(-1, sorted_idx, sorted_probs)
+    return torch.multinomial(probs, 1).squeeze(-1)
+
+
+def restrict_logits(logits, allowed):
+    """allowed[row] 为该行允许的 token 列表（None 不限制），其余位置置 -inf"""
+    mask = torch.full_like(logits, float('-inf'))
+    for row, ids in enumerate(allowed):
+        if ids is None:
+            mask[row] = 0
+        else:
+            mask[row, ids] = 0
+    return logits + mask
+
+
+class Generator:
+    """
+    带系统提示前缀 KV cache 的批量生成器
+
+    用法:
+        generator = Generator(model, tokenizer)
+        generator.generate(["圆角", "居中"], max_new_tokens=64)
+    """
+
+    def __init__(self, model, tokenizer, template='simple', prefix_cache=True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.template = template
+        self.system, self.use_input = TEMPLATES[template]
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.stop_ids = {tokenizer.convert_tokens_to_ids(IM_END)}
+        if tokenizer.eos_token_id is not None:
+            self.stop_ids.add(tokenizer.eos_token_id)
+
+        # 所有请求共享的前缀：system 消息 + user 起始标记
+        prefix = f"{IM_START}system\n{self.system}{IM_END}\n{IM_START}user\n"
+        self.prefix_ids = self._encode(prefix)
+        self.prefix_cache = self._build_prefix_cache() if prefix_cache else None
+        self.adapter_prefix_caches = {}  # LoRA 名称 -> 该 LoRA 下的前缀 KV cache（按需计算）
+
+    def _encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)['input_ids']
+
+    @property
+    def device(self):
+        return self.model.device
+
+    @torch.no_grad()
+    def _build_prefix_cache(self, adapter=None):
+        input_ids = torch.tensor([self.prefix_ids], device=self.device)
+        extra = {'adapter_names': [adapter]} if adapter is not None else {}
+        past = self.model(input_ids=input_ids, use_cache=True, **extra).past_key_values
+        return past.to_legacy_cache() if hasattr(past, 'to_legacy_cache') else past
+
+    def adapter_prefix_cache(self, adapter):
+        """LoRA 会改变前缀的 K/V，每个 LoRA 单独计算一次"""
+        if adapter not in self.adapter_prefix_caches:
+            self.adapter_prefix_caches[adapter] = self._build_prefix_cache(adapter)
+        return self.adapter_prefix_caches[adapter]
+
+    def forget_adapter(self, adapter):
+        """LoRA 重新加载或删除后调用，丢弃其前缀 KV cache"""
+        self.adapter_prefix_caches.pop(adapter, None)
+
+    def _expanded_prefix_cache(self, batch_size, adapters=None):
+        if adapters is None or len(set(adapters)) == 1:
+            cache = self.prefix_cache if adapters is None else self.adapter_prefix_cache(adapters[0])
+            legacy = tuple(tuple(t.expand(batch_size, -1, -1, -1).contiguous() for t in layer) for layer in cache)
+        else:
+            # 各行使用不同的 LoRA：按行拼接各自的前缀 KV cache
+            caches = [self.adapter_prefix_cache(adapter) for adapter in adapters]
+            legacy = tuple(
+                tuple(torch.cat([cache[layer][i] for cache in caches]) for i in range(len(caches[0][layer])))
+                for layer in range(len(caches[0]))
+            )
+        return DynamicCache.from_legacy_cache(legacy)
+
+    def suffix_ids(self, prompt, input_text=''):
+        """user 内容 + assistant 起始标记（前缀之后的部分）"""
+        user = f"{prompt}\n{input_text}" if self.use_input and input_text else prompt
+        return self._encode(f"{user}{IM_END}\n{ASSISTANT_PREFIX}")
+
+    @torch.no_grad()
+    def generate(self, prompts, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, temperature=0.0, top_p=1.0,
+                 on_token=None, allowed_tokens=None, adapters=None):
+        """
+        批量生成，返回每条提示的回复文本（只含新生成的部分）
+
+        参数:
+            prompts: 提示列表（str 或 (instruction, input) 元组）
+            on_token: 可选回调 on_token(row, token_id)，每生成一个 token 调用一次
+            allowed_tokens: 可选约束 allowed_tokens(row, 已生成的 token) -> 下一步允许的 token 列表（None 不限制），
+                只剩停止符可选的行直接结束（见 constrained.py）
+            adapters: 可选，每条提示使用的 LoRA 名称（load_adapters 加载的名称，BASE_ADAPTER 为只用基座），
+                None 为当前激活的 LoRA；不同 LoRA 的请求可以在同一批里解码。按行指定时 peft 在前向期间
+                给 LoRA 层挂 hook，调用方要保证同一模型上没有并发的其他前向（serve.py 用 BatchScheduler.lock）
+        """
+        suffixes = [self.suffix_ids(*p) if isinstance(p, tuple) else self.suffix_ids(p) for p in prompts]
+        batch_size = len(suffixes)
+        width = max(len(s) for s in suffixes)
+
+        extra = {}
+        if adapters is not None:
+            adapters = list(adapters)
+            extra['adapter_names'] = adapters
+        if self.prefix_cache is not None:
+            past = self._expanded_prefix_cache(batch_size, adapters)
+            prefix_len = len(self.prefix_ids)
+        else:
+            # 不复用前缀：前缀和 user 部分一起前向
+            suffixes = [self.prefix_ids + s for s in suffixes]
+            width += len(self.prefix_ids)
+            past = DynamicCache()
+            prefix_len = 0
+
+        # [前缀][左侧 padding][user 部分]，padding 位置 attention_mask 为 0
+        input_ids = torch.full((batch_size, width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, prefix_len + width), dtype=torch.long)
+        attention_mask[:, :prefix_len] = 1
+        for row, ids in enumerate(suffixes):
+            input_ids[row, width - len(ids):] = torch.tensor(ids)
+            attention_mask[row, prefix_len + width - len(ids):] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, prefix_len:]
+
+        generated = [[] for _ in range(batch_size)]
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=self.device)
+        stop_ids = torch.tensor(sorted(self.stop_ids), device=self.device)
+        for _ in range(max_new_tokens):
+            allowed = None
+            if allowed_tokens is not None:
+                allowed = [None if done else allowed_tokens(row, generated[row])
+                           for row, done in enumerate(finished.tolist())]
+                for row, ids in enumerate(allowed):
+                    if ids is not None and self.stop_ids.issuperset(ids):
+                        finished[row] = True
+                if finished.all():
+                    break
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past,
+                use_cache=True,
+                **extra,
+            )
+            past = outputs.past_key_values
+            logits = outputs.logits[:, -1]
+            if allowed is not None:
+                logits = restrict_logits(logits, allowed)
+            next_tokens = sample_next(logits, temperature, top_p)
+            next_tokens = torch.where(finished, torch.full_like(next_tokens, self.pad_token_id), next_tokens)
+
+            done = finished.tolist()
+            for row, token in enumerate(next_tokens.tolist()):
+                if not done[row] and token not in self.stop_ids:
+                    generated[row].append(token)
+                    if on_token:
+                        on_token(row, token)
+            finished |= torch.isin(next_tokens, stop_ids)
+            if finished.all():
+                break
+
+            input_ids = next_tokens[:, None]
+            position_ids = position_ids[:, -1:] + 1
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((batch_size, 1))], dim=-1)
+
+        return [self.tokenizer.decode(ids, skip_special_tokens=True).strip() for ids in generated]
+
+
+class TokenStreamer:
+    """
+    on_token 回调：把单条请求生成的 token 增量解码后交给 write 输出
+
+    byte-level BPE 会把一个汉字拆成多个 token，解码结果以 \ufffd 结尾时先不输出，等字节凑齐
+    """
+
+    def __init__(self, tokenizer, write=None):
+        self.tokenizer = tokenizer
+        self.write = write or (lambda text: print(text, end='', flush=True))
+        self.ids = []
+        self.printed = 0  # 已输出的字符数
+        self.start = time.perf_counter()
+        self.first_token_time = None
+        self.last_token_time = None
+
+    def __call__(self, row, token):
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        self.last_token_time = now
+        self.ids.append(token)
+        # 与 generate 的返回值一致，去掉开头的空白
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True).lstrip()
+        if text.endswith('\ufffd') or len(text) <= self.printed:
+            return
+        self.write(text[self.printed:])
+        self.printed = len(text)
+
+    def stats(self):
+        """首 token 延迟、生成 token 数、解码速度（首 token 之后）"""
+        num_tokens = len(self.ids)
+        first = self.first_token_time - self.start if self.first_token_time else None
+        decode = self.last_token_time - self.first_token_time if num_tokens > 1 else 0.0
+        return {
+            'first_token_s': first,
+            'tokens': num_tokens,
+            'tokens_per_s': (num_tokens - 1) / decode if decode > 0 else 0.0,
+        }
+
+
+def generate_css(generator, prompt, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, temperature=0.7, top_p=0.9, cache=None):
+    """单条生成，返回 (回复, 耗时秒)；传入 cache（response_cache.ResponseCache）时先查缓存"""
+    start = time.perf_counter()
+    key = None
+    if cache is not None:
+        key = cache.key(prompt, '', max_new_tokens, temperature, top_p)
+        result = cache.get(key, temperature)
+        if result is not None:
+            return result, time.perf_counter() - start
+    result = generator.generate([prompt], max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p)[0]
+    seconds = time.perf_counter() - start
+    if cache is not None:
+        cache.put(key, result, seconds, temperature)
+    return result, seconds
+
+
+def generate_class_name(generator, constraint, prompt, temperature=0.0):
+    """约束解码生成类名（constrained.ClassNameConstraint），返回 (类名, 耗时秒)"""
+    start = time.perf_counter()
+    result = generator.generate([prompt], max_new_tokens=constraint.max_length + 1, temperature=temperature,
+                                allowed_tokens=constraint)[0]
+    return result, time.perf_counter() - start
+
+
+def stream_css(generator, prompt, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, temperature=0.7, top_p=0.9, write=None):
+    """单条流式生成：token 边生成边输出，遇到 <|im_end|> 或 max_new_tokens 停止，返回 (回复, 统计)"""
+    streamer = TokenStreamer(generator.tokenizer, write)
+    result = generator.generate([prompt], max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+                                on_token=streamer)[0]
+    stats = streamer.stats()
+    stats['seconds'] = time.perf_counter() - streamer.start
+    return result, stats
+
+
+def search_css(semantic_index, query, k=5):
+    """
+    语义检索类名，返回 ([SearchResult(class_name, description, score)], 耗时秒)
+
+    semantic_index: semantic_index.load_or_build() 的结果；默认编码器为模型 hidden state 平均池化
+        （已加载模型时传 TransformerEncoder(model, tokenizer, name)），hash 编码器只作为没有模型时的兜底
+    """
+    start = time.perf_counter()
+    results = semantic_index.search(query, k)
+    return results, time.perf_counter() - start
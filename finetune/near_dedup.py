@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+近似去重：MinHash 签名 + LSH 分桶，找出只差几个字的同一问题的不同问法
+
+process_data.py / data_engine.py 只去掉 (instruction, output) 完全相同的样本，但
+  - 负样本: 80 个基础问题 × 10 种提问模板（"X" / "请问X" / "学习X" / "X怎么做" ...）
+  - 每个类的问答模板、代码生成问题
+会产生大量几乎一样的提问，每个 epoch 多跑很多步却不带来新信息。
+
+  - 提问（instruction + input，按 response_cache.normalize_prompt 归一化）切成字符 n-gram，
+    计算 num_perm 维 MinHash 签名；签名分成 bands 段（LSH），任意一段相同即为候选，不做两两比较
+  - 只有回复完全相同的样本才进同一个桶：问法相近但答案不同（如 mt-10 / mt-12 的描述）
+    正是模型需要区分的，不算重复
+  - 候选用签名估计 Jaccard 相似度，≥ threshold 归入同一簇；每簇最多保留 max_per_cluster 条（按出现顺序）
+  - 流式：保持输入顺序；内存 ≈ 每条保留的样本一份签名（num_perm × 4 字节）+ bands 个桶项
+
+用法:
+  python near_dedup.py training_data.json training_data.dedup.json --threshold 0.5 --max-per-cluster 3
+  python near_dedup.py training_data.json                    # 只打印报告（簇、能省多少训练步），不写文件
+  python near_dedup.py training_data.json --json near_dedup_report.json
+  python data_engine.py --near-dedup 0.5                     # 生成时直接近似去重
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from response_cache import normalize_prompt
+
+DEFAULT_THRESHOLD = 0.5  # 估计的 Jaccard 相似度阈值（只在回复相同的样本之间比较，可以放低）
+DEFAULT_NUM_PERM = 64  # MinHash 签名维数
+DEFAULT_NGRAM = 2  # 字符 n-gram（提问多为十几个汉字，"X" 和 "请问X" 用 2-gram 才够像）
+DEFAULT_MAX_PER_CLUSTER = 3  # 每簇保留的样本数（保留几种问法，去掉其余的）
+DEFAULT_SEED = 1
+SIGNATURE_BATCH_SIZE = 1024  # 每批一起计算签名的样本数
+NUM_EXAMPLE_CLUSTERS = 5  # 报告中展示的最大簇
+NUM_EXAMPLES_PER_CLUSTER = 4
+
+_FNV_PRIME = 0x100000001B3
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def prompt_text(item):
+    """参与相似度计算的提问文本"""
+    instruction = item.get('instruction') or ''
+    return f"{instruction}\n{item['input']}" if item.get('input') else instruction
+
+
+def ngram_hashes(texts, ngram=DEFAULT_NGRAM):
+    """
+    一批文本所有字符 n-gram 的 32 位哈希，返回 (哈希, 每条文本第一个 n-gram 的下标)
+
+    文本先按 normalize_prompt 归一化，短于 n 的补齐到 n；重复的 n-gram 不影响最小值，不必去重
+    """
+    texts = [normalize_prompt(text).ljust(ngram, '\x00') for text in texts]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    counts = lengths - ngram + 1
+    firsts = np.cumsum(counts) - counts
+    # 第 i 条文本的第 j 个 n-gram 从拼接后的第 (文本起点 + j) 个字符开始
+    starts = np.repeat(np.cumsum(lengths) - lengths - firsts, counts) + np.arange(int(counts.sum()))
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    hashes = np.zeros(len(starts), dtype=np.uint64)
+    for k in range(ngram):
+        hashes = hashes * np.uint64(_FNV_PRIME) + codes[starts + k]
+    return (hashes * np.uint64(_GOLDEN)) >> np.uint64(32), firsts
+
+
+def optimal_bands(threshold, num_perm):
+    """选择 (bands, rows)，bands × rows ≤ num_perm，使误报和漏报的面积之和最小"""
+    xs = np.linspace(0.0, 1.0, 501)
+    below = xs < threshold
+    best, best_error = (1, num_perm), float('inf')
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            # 相似度为 x 的两条样本至少有一段相同的概率
+            p = 1.0 - (1.0 - xs ** rows) ** bands
+            error = (p[below].sum() + (1.0 - p[~below]).sum()) / len(xs)
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """向量化 MinHash：一批文本的所有 n-gram 一起做 num_perm 次哈希置换，再按样本取最小值"""
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, ngram=DEFAULT_NGRAM, seed=DEFAULT_SEED):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.ngram = ngram
+        # multiply-shift 哈希: (a * x + b) mod 2^64 的高 32 位，a 为奇数，不需要取模
+        self.a = rng.integers(0, 1 << 64, size=num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 64, size=num_perm, dtype=np.uint64, endpoint=False)
+
+    def signatures(self, texts):
+        """返回 (len(texts), num_perm) 的 uint32 签名（只由文本和 seed 决定，与进程无关、可复现）"""
+        hashes, firsts = ngram_hashes(texts, self.ngram)
+        permuted = (hashes[:, None] * self.a + self.b) >> np.uint64(32)
+        return np.minimum.reduceat(permuted, firsts, axis=0).astype(np.uint32)
+
+
+class NearDeduper:
+    """
+    流式近似去重：add_batch(items) 返回每条样本是否保留
+
+    只保存保留下来的样本的签名和 LSH 桶；被去掉的样本只计入所属簇的大小
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_per_cluster=DEFAULT_MAX_PER_CLUSTER,
+                 num_perm=DEFAULT_NUM_PERM, ngram=DEFAULT_NGRAM, seed=DEFAULT_SEED):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"相似度阈值应在 (0, 1] 之间: {threshold}")
+        if max_per_cluster is not None and max_per_cluster < 1:
+            raise ValueError(f"每簇保留数至少为 1: {max_per_cluster}")
+        self.threshold = threshold
+        self.max_per_cluster = max_per_cluster  # None 为只聚类不删除
+        self.hasher = MinHasher(num_perm, ngram, seed)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+
+        self._buckets = {}  # hash((回复, 段号, 段内容)) -> 保留样本的序号
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self._cluster_of = array('q')  # 保留样本的序号 -> 簇号
+        self.cluster_kept = array('q')
+        self.cluster_sizes = array('q')  # 含被去掉的样本
+        self.examples = {}  # 簇号 -> 前几条样本的提问（只记录出现重复的簇）
+        self.seen = 0
+        self.kept = 0
+
+    def add_batch(self, items):
+        signatures = self.hasher.signatures([prompt_text(item) for item in items])
+        # LSH 桶键: 每段签名折叠成 64 位，再混入段号和回复的哈希（桶只在本进程内使用）
+        answers = np.array([hash((item.get('output') or '').strip()) for item in items], dtype=np.int64)
+        bands = signatures[:, :self.bands * self.rows].reshape(len(items), self.bands, self.rows)
+        keys = np.zeros((len(items), self.bands), dtype=np.uint64)
+        for row in range(self.rows):
+            keys = keys * np.uint64(_FNV_PRIME) + bands[:, :, row]
+        keys = (keys + np.arange(self.bands, dtype=np.uint64)) * np.uint64(_GOLDEN) ^ answers.view(np.uint64)[:, None]
+        return [self._add(item, signature, band_keys)
+                for item, signature, band_keys in zip(items, signatures, keys.tolist())]
+
+    def add(self, item):
+        return self.add_batch([item])[0]
+
+    def _add(self, item, signature, keys):
+        self.seen += 1
+        candidates = {self._buckets[key] for key in keys if key in self._buckets}
+
+        cluster = None
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            matches = (self._signatures[candidates] == signature).sum(axis=1)
+            best = int(np.argmax(matches))
+            if matches[best] >= self.threshold * self.hasher.num_perm:
+                cluster = self._cluster_of[int(candidates[best])]
+        if cluster is None:
+            cluster = len(self.cluster_sizes)
+            self.cluster_sizes.append(0)
+            self.cluster_kept.append(0)
+
+        self.cluster_sizes[cluster] += 1
+        if self.cluster_sizes[cluster] > 1:
+            examples = self.examples.setdefault(cluster, [])
+            if len(examples) < NUM_EXAMPLES_PER_CLUSTER:
+                examples.append(prompt_text(item))
+        if self.max_per_cluster is not None and self.cluster_kept[cluster] >= self.max_per_cluster:
+            return False
+
+        index = self.kept
+        if index >= len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.zeros_like(self._signatures)])
+        self._signatures[index] = signature
+        self._cluster_of.append(cluster)
+        self.cluster_kept[cluster] += 1
+        self.kept += 1
+        for key in keys:
+            self._buckets.setdefault(key, index)
+        return True
+
+    def report(self, batch_size=2, grad_accum=4, epochs=3):
+        sizes = np.frombuffer(self.cluster_sizes, dtype=np.int64)
+        largest = np.argsort(-sizes, kind='stable')[:NUM_EXAMPLE_CLUSTERS]
+        steps_before = training_steps(self.seen, batch_size, grad_accum, epochs)
+        steps_after = training_steps(self.kept, batch_size, grad_accum, epochs)
+        return {
+            'threshold': self.threshold,
+            'max_per_cluster': self.max_per_cluster,
+            'num_perm': self.hasher.num_perm,
+            'ngram': self.hasher.ngram,
+            'bands': self.bands,
+            'rows': self.rows,
+            'samples': self.seen,
+            'kept': self.kept,
+            'removed': self.seen - self.kept,
+            'clusters': int(len(sizes)),
+            'duplicate_clusters': int((sizes > 1).sum()),
+            'samples_in_duplicate_clusters': int(sizes[sizes > 1].sum()),
+            'largest_clusters': [{'size': int(sizes[i]), 'examples': self.examples.get(int(i), [])}
+                                 for i in largest if sizes[i] > 1],
+            'training': {
+                'batch_size': batch_size,
+                'gradient_accumulation_steps': grad_accum,
+                'epochs': epochs,
+                'steps_before': steps_before,
+                'steps_after': steps_after,
+                'steps_saved': steps_before - steps_after,
+            },
+        }
+
+
+def training_steps(num_samples, batch_size, grad_accum, epochs):
+    """与 transformers Trainer 相同的优化步数：每个 epoch len(dataloader) // 梯度累积（至少 1 步）× epoch 数"""
+    if not num_samples:
+        return 0
+    return math.ceil(max(math.ceil(num_samples / batch_size) // grad_accum, 1) * epochs)
+
+
+def iter_near_unique(samples, deduper, batch_size=SIGNATURE_BATCH_SIZE):
+    """按输入顺序产出保留的样本（每 batch_size 条一起计算签名）"""
+    batch = []
+    for item in samples:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from (item for item, keep in zip(batch, deduper.add_batch(batch)) if keep)
+            batch = []
+    if batch:
+        yield from (item for item, keep in zip(batch, deduper.add_batch(batch)) if keep)
+
+
+def print_report(report):
+    training = report['training']
+    print(f"🔍 近似去重: 阈值 {report['threshold']}，{report['num_perm']} 维签名 = "
+          f"{report['bands']} 段 × {report['rows']} 行，{report['ngram']}-gram")
+    print(f"  样本 {report['samples']} 条 → {report['clusters']} 簇，"
+          f"其中 {report['duplicate_clusters']} 簇有近似重复（共 {report['samples_in_duplicate_clusters']} 条）")
+    if report['max_per_cluster'] is not None:
+        print(f"  每簇最多保留 {report['max_per_cluster']} 条: 保留 {report['kept']} 条，去掉 {report['removed']} 条"
+              f"（{report['removed'] / max(report['samples'], 1) * 100:.1f}%）")
+    print(f"  训练步数（batch {training['batch_size']} × 累积 {training['gradient_accumulation_steps']}，"
+          f"{training['epochs']} 个 epoch）: {training['steps_before']} → {training['steps_after']}，"
+          f"节省 {training['steps_saved']} 步")
+    for cluster in report['largest_clusters']:
+        examples = ' / '.join(repr(text[:30]) for text in cluster['examples'])
+        print(f"  簇大小 {cluster['size']}: {examples} ...")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MinHash + LSH 近似去重")
+    parser.add_argument('input', help='训练数据（.json / .jsonl / 分片目录）')
+    parser.add_argument('output', nargs='?', default=None, help='输出（.jsonl 为 JSONL，否则为 JSON 数组）；省略时只打印报告')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Jaccard 相似度阈值')
+    parser.add_argument('--max-per-cluster', type=int, default=DEFAULT_MAX_PER_CLUSTER, help='每簇保留的样本数')
+    parser.add_argument('--num-perm', type=int, default=DEFAULT_NUM_PERM, help='MinHash 签名维数')
+    parser.add_argument('--ngram', type=int, default=DEFAULT_NGRAM, help='字符 n-gram 长度')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--batch-size', type=int, default=2, help='估算训练步数用：每个设备的 batch 大小')
+    parser.add_argument('--grad-accum', type=int, default=4, help='估算训练步数用：梯度累积步数')
+    parser.add_argument('--epochs', type=float, default=3, help='估算训练步数用：训练轮数')
+    parser.add_argument('--json', default=None, metavar='PATH', help='写出 JSON 报告')
+    args = parser.parse_args(argv)
+
+    from data_engine import write_jsonl
+    from dataset_store import iter_samples, write_json
+
+    deduper = NearDeduper(args.threshold, args.max_per_cluster, args.num_perm, args.ngram, args.seed)
+    start = time.perf_counter()
+    kept = iter_near_unique(iter_samples(args.input, with_tags=args.output is not None), deduper)
+    if args.output is None:
+        for _ in kept:
+            pass
+    elif args.output.endswith('.jsonl'):
+        write_jsonl(kept, args.output)
+    else:
+        write_json(kept, args.output)
+    seconds = time.perf_counter() - start
+
+    report = deduper.report(args.batch_size, args.grad_accum, args.epochs)
+    print_report(report)
+    print(f"⏱️  耗时: {seconds:.2f}s")
+    if args.output:
+        print(f"✅ 已写出 {report['kept']} 条 -> {args.output}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(report, source=args.input, seconds=seconds), f, ensure_ascii=False, indent=2)
+        print(f"✓ JSON 报告已写入 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+负样本生成器：问题库 × 提问模板的组合空间，按下标惰性生成
+
+负样本由 "提问模板" 套上 "问题库" 中的问题得到（如 "请问{}" × "Docker容器"）。组合数随问题库和
+模板数相乘，模板里有多个槽位时（"{lang}里{topic}怎么做"）还会再乘一次，不能先展开成列表:
+  - NegativeSpace: 每个模板的组合数和起始下标，第 i 条样本按混合进制直接算出，内存只有问题库和模板本身
+  - IndexPermutation: [0, N) 上的伪随机置换（Feistel 网络 + cycle walking），只由 seed 决定，O(1) 内存
+  - NegativeSampler: 可重复迭代的负样本流；抽 count 条时取置换的前 count 个下标，
+    不重复、不需要记录已抽过的下标
+  - 问题库和模板可替换：--bank NAME=PATH / --templates PATH（.txt 每行一条，或 .json 字符串数组），
+    模板中的 {} 对应名为 question 的问题库，{NAME} 对应同名问题库
+
+生成的样本带 type=negative / template=negative.<模板序号> 元数据。process_data.iter_static_samples
+把它和手写负样本、系统对话、组合样本串成一个流，data_engine.py 与正样本一起直接写进 dataset_store 分片
+（--negatives N 抽样到 N 条，--negative-bank / --negative-templates 替换问题库和模板）。
+
+用法:
+  python negative_gen.py                                          # 默认问题库 × 模板的组合数
+  python negative_gen.py --count 2000 --seed 42 --output negatives.jsonl
+  python negative_gen.py --bank topic=banks/topics.txt --bank action=banks/actions.txt \\
+      --templates banks/templates.txt --count 1000000 --output negatives_shards --shard-format arrow
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+import string
+import sys
+import time
+
+from process_data import BASE_QUESTIONS, NEGATIVE_OUTPUT, NEGATIVE_TEMPLATES
+
+DEFAULT_SLOT = 'question'  # 模板中 {} 对应的问题库
+FEISTEL_ROUNDS = 4
+NUM_EXAMPLES = 5  # 不写文件时打印的示例数
+_MASK64 = (1 << 64) - 1
+
+
+# ========== 1. 问题库 / 模板 ==========
+def load_bank(path):
+    """读取问题库或模板：.json 为字符串数组，其他为每行一条（跳过空行和 # 开头的行）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            items = json.load(f)
+        else:
+            items = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    if not items or not all(isinstance(item, str) for item in items):
+        raise ValueError(f"{path} 应为非空的字符串列表")
+    return items
+
+
+def parse_banks(specs):
+    """['topic=banks/topics.txt', ...] -> {'topic': [...]}"""
+    banks = {}
+    for spec in specs or ():
+        name, sep, path = spec.partition('=')
+        if not sep:
+            name, path = DEFAULT_SLOT, spec
+        banks[name] = load_bank(path)
+    return banks
+
+
+def split_template(template):
+    """
+    把模板切成 (字面量列表, 槽位名列表)，字面量比槽位多一段；{} 记为 question，{{ }} 为花括号本身
+    """
+    literals, slots = [''], []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        literals[-1] += literal
+        if field is not None:
+            slots.append(field or DEFAULT_SLOT)
+            literals.append('')
+    return literals, slots
+
+
+# ========== 2. 组合空间 ==========
+class NegativeSpace:
+    """
+    问题库 × 模板的组合空间，支持 len() 和按下标取样本，不展开
+
+    参数:
+        banks: {槽位名: 问题列表}，None 为 {question: process_data.BASE_QUESTIONS}
+        templates: 提问模板列表，None 为 process_data.NEGATIVE_TEMPLATES；数量不设上限，
+            每个模板对应一个 template=negative.<序号> 类别，元数据下标宽度由 TagWriter 按类别数决定
+        output: 拒答回复
+    """
+
+    def __init__(self, banks=None, templates=None, output=NEGATIVE_OUTPUT):
+        self.banks = {DEFAULT_SLOT: BASE_QUESTIONS} if banks is None else dict(banks)
+        self.templates = list(NEGATIVE_TEMPLATES if templates is None else templates)
+        self.output = output
+        if not self.templates:
+            raise ValueError("负样本模板列表为空")
+        self.slots = []
+        self.literals = []  # 每个模板按槽位切开的字面量（比槽位多一段）
+        self.starts = []
+        total = 0
+        for template in self.templates:
+            literals, slots = split_template(template)
+            self.literals.append(literals)
+            missing = [slot for slot in slots if slot not in self.banks]
+            if missing:
+                raise ValueError(f"模板 {template!r} 的槽位没有对应的问题库: {', '.join(missing)}")
+            if any(not self.banks[slot] for slot in slots):
+                raise ValueError(f"模板 {template!r} 用到的问题库为空")
+            self.slots.append(slots)
+            self.starts.append(total)
+            size = 1
+            for slot in slots:
+                size *= len(self.banks[slot])
+            total += size
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.total
+        if not 0 <= i < self.total:
+            raise IndexError(i)
+        t = bisect.bisect_right(self.starts, i) - 1
+        rest = i - self.starts[t]
+        values = []
+        # 混合进制：最后一个槽位变化最快
+        for slot in reversed(self.slots[t]):
+            bank = self.banks[slot]
+            rest, j = divmod(rest, len(bank))
+            values.append(bank[j])
+        values.reverse()
+        literals = self.literals[t]
+        instruction = literals[0] + ''.join(value + literal for value, literal in zip(values, literals[1:]))
+        return {
+            "instruction": instruction,
+            "input": "",
+            "output": self.output,
+            "type": "negative",
+            "class_name": None,
+            "template": f"negative.{t}"
+        }
+
+    def __iter__(self):
+        for i in range(self.total):
+            yield self[i]
+
+
+class IndexPermutation:
+    """
+    [0, n) 上的伪随机置换：偶数位宽的 Feistel 网络，结果超出 n 时继续加密（cycle walking）
+
+    置换只由 seed 决定，permutation[i] 可单独计算，不需要生成整个排列
+    """
+
+    def __init__(self, n, seed):
+        self.n = n
+        bits = max((n - 1).bit_length(), 2)
+        bits += bits % 2
+        self.half_bits = bits // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(f"negative-permutation:{seed}")
+        self.keys = [rng.getrandbits(64) for _ in range(FEISTEL_ROUNDS)]
+
+    def _round(self, value, key):
+        value = ((value ^ key) * 0xBF58476D1CE4E5B9) & _MASK64
+        value ^= value >> 31
+        return value & self.half_mask
+
+    def _encrypt(self, x):
+        left, right = x >> self.half_bits, x & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        x = self._encrypt(i)
+        while x >= self.n:
+            x = self._encrypt(x)
+        return x
+
+
+class NegativeSampler:
+    """
+    组合空间的负样本流，可重复迭代（每次产出相同的样本和顺序）
+
+    参数:
+        space: NegativeSpace，None 为默认问题库 × 模板
+        count: 目标条数；None 或不小于组合数时按下标顺序产出全部
+        seed: 抽样种子，相同的 (space, count, seed) 总是得到相同的样本；None 为随机（创建时固定）
+    """
+
+    def __init__(self, space=None, count=None, seed=None):
+        self.space = space if space is not None else NegativeSpace()
+        self.count = count
+        self.seed = random.getrandbits(64) if seed is None else seed
+
+    def __len__(self):
+        if self.count is None:
+            return len(self.space)
+        return min(self.count, len(self.space))
+
+    def __iter__(self):
+        if len(self) == len(self.space):
+            yield from self.space
+            return
+        permutation = IndexPermutation(len(self.space), self.seed)
+        for i in range(len(self)):
+            yield self.space[permutation[i]]
+
+
+def build_sampler(count=None, seed=None, bank_specs=(), templates_path=None):
+    """
+    按命令行参数创建 NegativeSampler
+
+    bank_specs: ['NAME=PATH', ...]；只替换模板用到的问题库，未指定的 question 仍为 BASE_QUESTIONS
+    templates_path: 模板文件，None 为 NEGATIVE_TEMPLATES
+    """
+    banks = {DEFAULT_SLOT: BASE_QUESTIONS}
+    banks.update(parse_banks(bank_specs))
+    templates = load_bank(templates_path) if templates_path else None
+    return NegativeSampler(NegativeSpace(banks, templates), count, seed)
+
+
+# ========== 3. 命令行 ==========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="问题库 × 提问模板的负样本生成器（惰性组合，可抽样）")
+    parser.add_argument('--bank', action='append', default=[], metavar='NAME=PATH',
+                        help='问题库（可重复）；不写 NAME= 时替换默认的 question 库（BASE_QUESTIONS）')
+    parser.add_argument('--templates', default=None, help='提问模板文件（默认 process_data.NEGATIVE_TEMPLATES）')
+    parser.add_argument('--count', type=int, default=None, help='目标条数（默认全部组合）')
+    parser.add_argument('--seed', type=int, default=42, help='抽样种子（--count 小于组合数时生效）')
+    parser.add_argument('--output', default=None, help='输出 .jsonl / .json 或分片目录；不写时只打印组合数和示例')
+    parser.add_argument('--shard-format', choices=['arrow', 'jsonl'], default=None, help='写成 dataset_store 分片目录')
+    parser.add_argument('--shard-size', type=int, default=None, help='每个分片的样本数')
+    args = parser.parse_args(argv)
+
+    sampler = build_sampler(args.count, args.seed, args.bank, args.templates)
+    space = sampler.space
+    sizes = '，'.join(f"{name} {len(bank)}" for name, bank in space.banks.items())
+    print(f"📊 问题库: {sizes}；模板 {len(space.templates)} 个；组合数 {len(space):,}，输出 {len(sampler):,} 条")
+
+    if args.output is None:
+        for sample in itertools.islice(sampler, NUM_EXAMPLES):
+            print(f"  {sample['instruction']}")
+        return 0
+
+    from data_engine import write_jsonl
+    from dataset_store import DEFAULT_SHARD_SIZE, write_json, write_shards
+
+    start = time.perf_counter()
+    if args.shard_format:
+        written = write_shards(sampler, args.output, args.shard_format, args.shard_size or DEFAULT_SHARD_SIZE)['num_samples']
+    elif args.output.endswith('.jsonl'):
+        written = write_jsonl(sampler, args.output)
+    else:
+        written = write_json(sampler, args.output)
+    print(f"✅ 已写出 {written:,} 条负样本 -> {args.output}（{time.perf_counter() - start:.2f}s）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,153 +1,249 @@
+import argparse
+import hashlib
 import json
+import os
 import re
 import random
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+# ========== 描述解析 ==========
+# 描述的结构: 【分类标签】人类可读说明属性详情如下:.选择器 { 属性列表 }
+# 除分类标签和属性详情外都是可选的，例如 "设置样式width: 20px;"
+DETAIL_MARKER = '属性详情如下:'
+_CSS_BLOCK_RE = re.compile(r'\s*([^{]*?)\s*\{([^}]*)\}')
+_PROPERTY_RE = re.compile(r'([\w-]+):\s*([^;]+);')
+_BG_COLOR_END_RE = re.compile(r',|属性')
+
+RECORD_CACHE_SIZE = 8192  # 解析结果缓存条数（按 className 缓存）
+
+CssRecord = namedtuple('CssRecord', [
+    'class_name',  # 类名
+    'category',    # 分类标签，如 "集合属性"，没有则为 None
+    'summary',     # 去掉 CSS 代码后的描述（含分类标签）
+    'selector',    # CSS 选择器，如 ".at-center::after"
+    'properties',  # ((属性, 值), ...)
+    'css_code',    # 完整 CSS 代码块
+    'setting',     # "设置" 之后的内容，用于问答样本
+    'bg_color',    # "背景色为" 之后的颜色描述
+])
+
+
+@lru_cache(maxsize=RECORD_CACHE_SIZE)
+def parse_description(class_name, description):
+    """把描述一次拆成分类标签、说明、选择器和属性列表（按 className 缓存）"""
+    summary, _, detail = description.partition(DETAIL_MARKER)
+    summary = summary.strip()
+
+    category = None
+    if summary.startswith('【'):
+        end = summary.find('】')
+        if end > 0:
+            category = summary[1:end]
+
+    selector = None
+    properties = ()
+    css_code = None
+    block = _CSS_BLOCK_RE.match(detail) if detail else None
+    if block:
+        selector = block.group(1)
+        properties = tuple(_PROPERTY_RE.findall(block.group(2)))
+        css_code = detail[block.start(1):block.end()]
+
+    setting = None
+    index = summary.find('设置')
+    if index >= 0 and index + 2 < len(summary):
+        setting = summary[index + 2:].strip()
+
+    bg_color = None
+    index = summary.find('背景色为')
+    if index >= 0 and index + 4 < len(summary):
+        start = index + 4
+        end = _BG_COLOR_END_RE.search(summary, start + 1)
+        bg_color = summary[start:end.start() if end else len(summary)].strip()
+
+    return CssRecord(class_name, category, summary, selector, properties, css_code, setting, bg_color)
+
+
+# ========== 数据增强函数 ==========
+# 样本类型 -> 报告中的名称；每条样本带 type（样本类型）、class_name（来源类名）、template（模板 ID），
+# 写出时存为 dataset_store 的元数据列，报告、采样（sample_mix.py）和评估直接按类型过滤
+SAMPLE_TYPES = {
+    'description': '描述转类名',
+    'qa': '问答形式',
+    'css_code': 'CSS代码转类名',
+    'explanation': '类名解释',
+    'keyword': '关键词搜索',
+    'code_gen': '代码生成',
+    'short': '简短提问',
+    'system': '系统对话',
+    'negative': '负样本',
+    'combination': '多类名组合',
+}
 
-# ========== 1. 读取原始数据 ==========
-with open('css_classes.json', 'r', encoding='utf-8') as f:
-    raw_data = json.load(f)
-
-print(f"📊 原始数据条数: {len(raw_data)}")
 
-# ========== 2. 数据增强函数 ==========
 def extract_css_code(description):
     """从描述中提取CSS代码"""
-    match = re.search(r'\.[\w-]+.*?\{[^}]+\}', description, re.DOTALL)
-    return match.group(0) if match else None
+    return parse_description(None, description).css_code
+
+def generate_training_samples(item, rng=random):
+    """
+    为每个CSS类生成多样化的训练样本
 
-def generate_training_samples(item):
-    """为每个CSS类生成多样化的训练样本"""
+    参数:
+        item: {"className": ..., "description": ...}
+        rng: 随机数生成器，传入 class_rng(...) 可让输出可复现
+    """
     className = item['className']
     description = item['description']
-    css_code = extract_css_code(description)
+    record = parse_description(className, description)
+    # 清理后的描述（去除CSS代码部分），为空时回退到原始描述
+    clean_desc = record.summary
+    explanation = clean_desc if clean_desc else description
     
     samples = []
     
     # ===== 样本类型1: 描述 -> 类名 =====
-    # 清理描述（去除CSS代码部分）
-    clean_desc = re.sub(r'属性详情如下:.*', '', description).strip()
-    clean_desc = re.sub(r'\.[\w-]+.*?\{[^}]+\}', '', clean_desc, flags=re.DOTALL).strip()
-    
     if clean_desc:
         samples.append({
             "instruction": clean_desc,
             "input": "",
-            "output": className
+            "output": className,
+            "type": "description",
+            "class_name": className,
+            "template": "description"
         })
     
     # ===== 样本类型2: 问答形式 =====
-    if '设置' in description:
-        # 提取设置的内容
-        setting_match = re.search(r'设置(.+?)(?:属性详情|$)', description)
-        if setting_match:
-            setting = setting_match.group(1).strip()
-            samples.append({
-                "instruction": f"如何{setting}？",
-                "input": "",
-                "output": f"使用类名: {className}"
-            })
-            
-            samples.append({
-                "instruction": f"我想{setting}",
-                "input": "",
-                "output": className
-            })
+    if record.setting is not None:
+        setting = record.setting
+        samples.append({
+            "instruction": f"如何{setting}？",
+            "input": "",
+            "output": f"使用类名: {className}",
+            "type": "qa",
+            "class_name": className,
+            "template": "qa.how"
+        })
+        
+        samples.append({
+            "instruction": f"我想{setting}",
+            "input": "",
+            "output": className,
+            "type": "qa",
+            "class_name": className,
+            "template": "qa.want"
+        })
     
     # ===== 样本类型3: CSS代码 -> 类名 =====
-    if css_code:
+    if record.css_code:
         samples.append({
-            "instruction": f"这段CSS代码对应的类名是什么？\n```css\n{css_code}\n```",
+            "instruction": f"这段CSS代码对应的类名是什么？\n```css\n{record.css_code}\n```",
             "input": "",
-            "output": className
+            "output": className,
+            "type": "css_code",
+            "class_name": className,
+            "template": "css_code.block"
         })
         
-        # 提取CSS属性
-        css_properties = re.findall(r'([\w-]+):\s*([^;]+);', css_code)
-        if css_properties:
-            prop_desc = ', '.join([f"{prop}: {value}" for prop, value in css_properties])
+        if record.properties:
+            prop_desc = ', '.join([f"{prop}: {value}" for prop, value in record.properties])
             samples.append({
                 "instruction": f"生成一个包含 {prop_desc} 样式的类名",
                 "input": "",
-                "output": className
+                "output": className,
+                "type": "css_code",
+                "class_name": className,
+                "template": "css_code.properties"
             })
     
     # ===== 样本类型4: 类名 -> 解释 =====
     samples.append({
         "instruction": f"类名 {className} 的作用是什么？",
         "input": "",
-        "output": clean_desc if clean_desc else description
+        "output": explanation,
+        "type": "explanation",
+        "class_name": className,
+        "template": "explanation.role"
     })
     
     samples.append({
         "instruction": f"解释一下 {className} 这个类",
         "input": "",
-        "output": clean_desc if clean_desc else description
+        "output": explanation,
+        "type": "explanation",
+        "class_name": className,
+        "template": "explanation.explain"
     })
     
     # ===== 样本类型5: 关键词搜索 =====
     # 提取关键词
     keywords = []
-    if 'bg-' in className or '背景' in description:
+    if 'bg-' in className or '背景' in clean_desc:
         keywords.append('background')
-    if 'radius' in className or '圆角' in description:
+    if 'radius' in className or '圆角' in clean_desc:
         keywords.append('border-radius')
     if 'before' in className or 'after' in className:
         keywords.append('伪元素')
-    if 'transparent' in className or '透明' in description:
+    if 'transparent' in className or '透明' in clean_desc:
         keywords.append('transparent')
     
     for keyword in keywords:
         samples.append({
             "instruction": f"有没有关于{keyword}的类名？",
             "input": "",
-            "output": f"可以使用 {className}"
+            "output": f"可以使用 {className}",
+            "type": "keyword",
+            "class_name": className,
+            "template": f"keyword.{keyword}"
         })
     
     # ===== 样本类型6: 代码生成场景 =====
-    # 增加问题多样性
-    code_questions = [
-        "生成一个React组件的className",
-        "创建一个带样式的div",
-        "写一个React元素",
-        "生成组件代码",
-        "帮我写个div标签"
-    ]
+    question = rng.choice(CODE_QUESTIONS)
     samples.append({
-        "instruction": random.choice(code_questions),
-        "input": clean_desc if clean_desc else description,
-        "output": f'<div className="{className}">内容</div>'
+        "instruction": question,
+        "input": explanation,
+        "output": f'<div className="{className}">内容</div>',
+        "type": "code_gen",
+        "class_name": className,
+        "template": f"code_gen.{CODE_QUESTIONS.index(question)}"
     })
     
     # ===== 样本类型7: 简短提问 =====
-    if '背景色' in description:
-        color_match = re.search(r'背景色为(.+?)(?:,|$|属性)', description)
-        if color_match:
-            color = color_match.group(1).strip()
-            samples.append({
-                "instruction": f"{color}背景",
-                "input": "",
-                "output": className
-            })
+    if record.bg_color is not None:
+        samples.append({
+            "instruction": f"{record.bg_color}背景",
+            "input": "",
+            "output": className,
+            "type": "short",
+            "class_name": className,
+            "template": "short.bg_color"
+        })
     
-    if '圆角' in description:
+    if '圆角' in clean_desc:
         samples.append({
             "instruction": "圆角",
             "input": "",
-            "output": className
+            "output": className,
+            "type": "short",
+            "class_name": className,
+            "template": "short.radius"
         })
     
     return samples
 
-# ========== 3. 生成训练数据 ==========
-training_data = []
 
-for item in raw_data:
-    samples = generate_training_samples(item)
-    training_data.extend(samples)
-
-print(f"✅ 生成基础训练样本: {len(training_data)} 条")
+# 代码生成场景的问题（增加问题多样性）
+CODE_QUESTIONS = [
+    "生成一个React组件的className",
+    "创建一个带样式的div",
+    "写一个React元素",
+    "生成组件代码",
+    "帮我写个div标签"
+]
 
-# ========== 4. 添加系统级样本 ==========
-system_samples = [
+# ========== 系统级样本 ==========
+SYSTEM_SAMPLES = [
     {
         "instruction": "你是谁？",
         "input": "",
@@ -165,10 +261,8 @@ system_samples = [
     }
 ]
 
-training_data.extend(system_samples)
-
-# ========== 5. 添加负样本（防止模型回答无关问题）==========
-negative_samples = [
+# ========== 负样本（防止模型回答无关问题）==========
+NEGATIVE_SAMPLES = [
     # === 天气类 ===
     {
         "instruction": "今天天气怎么样？",
@@ -422,12 +516,9 @@ negative_samples = [
     },
 ]
 
-# 复制负样本以达到目标数量（约500条）
+# 基础问题库 × 提问模板组合出负样本（negative_gen.NegativeSpace 按下标惰性生成，可抽样到目标条数）
 # 通过变换问法增加多样性
-additional_negatives = []
-
-# 扩展基础问题库
-base_questions = [
+BASE_QUESTIONS = [
     # 编程语言
     "如何学习编程", "Python基础教程", "Java入门指南", "C++怎么学",
     "Go语言特点", "Rust编程", "PHP开发", "Ruby on Rails",
@@ -469,8 +560,8 @@ base_questions = [
     "Android开发", "跨平台方案", "移动端适配", "App性能优化",
 ]
 
-# 多种提问模板
-templates = [
+# 多种提问模板（{} 为基础问题）
+NEGATIVE_TEMPLATES = [
     "{}",
     "请问{}",
     "能告诉我{}吗？",
@@ -483,25 +574,30 @@ templates = [
     "学习{}",
 ]
 
-# 生成多样化的负样本
-for question in base_questions:
-    for template in templates:  # 使用所有模板（10种）
-        additional_negatives.append({
-            "instruction": template.format(question),
-            "input": "",
-            "output": "我是CSS类名助手，只能回答CSS相关的问题。请问有什么CSS样式需求吗？"
-        })
+NEGATIVE_OUTPUT = "我是CSS类名助手，只能回答CSS相关的问题。请问有什么CSS样式需求吗？"
+
 
-negative_samples.extend(additional_negatives)
+def tag_samples(samples, sample_type, template):
+    """给固定样本加上元数据（返回副本，不修改模块级常量）；template 中的 {i} 为样本序号"""
+    return [dict(item, type=sample_type, class_name=None, template=template.format(i=i))
+            for i, item in enumerate(samples)]
 
-print(f"📊 负样本总数: {len(negative_samples)}")
 
+def iter_negative_samples(negatives=None):
+    """
+    手写负样本 + 基础问题 × 提问模板组合出的负样本（惰性生成，不展开整个组合）
 
-training_data.extend(negative_samples)
+    negatives: negative_gen.NegativeSampler（可替换问题库/模板、抽样到目标条数），None 为全部默认组合
+    """
+    # 延迟导入，避免循环依赖（negative_gen 依赖本模块）
+    from negative_gen import NegativeSampler
 
-# ========== 6. 添加多类名组合样本 ==========
+    yield from tag_samples(NEGATIVE_SAMPLES, 'negative', 'negative.manual')
+    yield from negatives if negatives is not None else NegativeSampler()
+
+# ========== 多类名组合样本 ==========
 # 模拟实际使用场景
-combination_samples = [
+COMBINATION_SAMPLES = [
     {
         "instruction": "我需要一个透明背景的圆角元素",
         "input": "",
@@ -514,75 +610,142 @@ combination_samples = [
     }
 ]
 
-training_data.extend(combination_samples)
-
-# ========== 7. 数据去重 ==========
-seen = set()
-unique_data = []
-
-for item in training_data:
-    # 使用问题和答案的组合作为唯一标识
-    key = (item['instruction'].strip(), item['output'].strip())
-    if key not in seen and item['instruction'] and item['output']:
-        seen.add(key)
-        unique_data.append(item)
-
-print(f"✅ 去重后训练样本: {len(unique_data)} 条")
-
-# ========== 8. 数据打乱 ==========
-random.shuffle(unique_data)
 
-# ========== 9. 保存训练数据 ==========
-with open('training_data.json', 'w', encoding='utf-8') as f:
-    json.dump(unique_data, f, ensure_ascii=False, indent=2)
-
-print(f"✅ 训练数据已保存到 training_data.json")
+def iter_static_samples(negatives=None):
+    """与 css_classes.json 无关的固定样本流：系统对话 + 负样本 + 多类名组合"""
+    yield from tag_samples(SYSTEM_SAMPLES, 'system', 'system.{i}')
+    yield from iter_negative_samples(negatives)
+    yield from tag_samples(COMBINATION_SAMPLES, 'combination', 'combination.{i}')
+
+
+def build_static_samples(negatives=None):
+    """iter_static_samples 的列表形式（增量构建需要对固定样本整体算哈希）"""
+    return list(iter_static_samples(negatives))
+
+
+def dedup_key(item):
+    """使用问题和答案的组合作为唯一标识，空问题/空答案返回 None"""
+    if not item['instruction'] or not item['output']:
+        return None
+    return (item['instruction'].strip(), item['output'].strip())
+
+
+def sample_id(item):
+    """样本 ID：去重键的 8 字节摘要（16 位十六进制），空样本返回 None"""
+    key = dedup_key(item)
+    if key is None:
+        return None
+    return hashlib.blake2b(f"{key[0]}\x00{key[1]}".encode('utf-8'), digest_size=8).hexdigest()
+
+
+def class_rng(class_name, seed):
+    """每个类独立的随机数生成器：只由 seed 和 className 决定，与处理顺序无关"""
+    return random.Random(f"{seed}:{class_name}")
+
+
+def dedup_samples(samples):
+    """按 (instruction, output) 去重，保持首次出现的顺序"""
+    seen = set()
+    unique_data = []
+    for item in samples:
+        key = dedup_key(item)
+        if key is not None and key not in seen:
+            seen.add(key)
+            unique_data.append(item)
+    return unique_data
+
+
+def print_report(unique_data):
+    """打印数据统计报告（按生成时标注的样本类型统计）"""
+    print("\n" + "="*50)
+    print("📊 数据统计报告")
+    print("="*50)
+
+    counts = Counter(item.get('type') for item in unique_data)
+    for sample_type, type_name in SAMPLE_TYPES.items():
+        count = counts.pop(sample_type, 0)
+        percentage = (count / len(unique_data)) * 100
+        print(f"{type_name}: {count} 条 ({percentage:.1f}%)")
+    untagged = sum(counts.values())
+    if untagged:
+        print(f"未标注类型: {untagged} 条 ({untagged / len(unique_data) * 100:.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="由 css_classes.json 生成训练数据")
+    parser.add_argument('--input', default='css_classes.json', help='CSS 类定义')
+    parser.add_argument('--output', default='training_data.json', help='输出路径（分片格式时为目录）')
+    parser.add_argument('--format', choices=['json', 'arrow', 'jsonl'], default='json',
+                        help='json 为单个 JSON 文件；arrow/jsonl 为 dataset_store 分片目录')
+    parser.add_argument('--shard-size', type=int, default=100_000, help='分片格式下每个分片的样本数')
+    parser.add_argument('--manifest', default=None, help='清单路径（默认 <output>.manifest.json）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子（每个类独立派生）')
+    parser.add_argument('--negatives', type=int, default=None,
+                        help='问题库 × 模板组合出的负样本条数（按 --seed 抽样，默认全部组合，见 negative_gen.py）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='只重新生成内容有变化/新增/删除的类，其余样本沿用上次结果')
+    args = parser.parse_args(argv)
+
+    # 延迟导入，避免循环依赖（data_engine 依赖本模块）
+    from data_engine import build_dataset, load_existing_dataset, load_manifest, save_manifest
+    from negative_gen import build_sampler
+    from dataset_store import write_json, write_shards
+
+    manifest_path = args.manifest or f"{os.path.splitext(args.output)[0]}.manifest.json"
+    rng = random.Random(args.seed)
+
+    # ========== 1. 读取原始数据 ==========
+    with open(args.input, 'r', encoding='utf-8') as f:
+        raw_data = json.load(f)
+
+    print(f"📊 原始数据条数: {len(raw_data)}")
+
+    # ========== 2. 读取上次的清单和数据（增量模式）==========
+    manifest = None
+    existing = {}
+    if args.incremental:
+        manifest = load_manifest(manifest_path)
+        if manifest is not None and os.path.exists(args.output):
+            existing = load_existing_dataset(args.output)
+            print(f"♻️  增量模式: 沿用 {manifest_path} 中 {len(manifest['classes'])} 个类的记录")
+        else:
+            manifest = None
+            print(f"⚠️  未找到 {manifest_path} 或 {args.output}，执行全量生成")
+
+    # ========== 3. 生成 / 拼接训练数据（按样本 ID 排序，已去重）==========
+    negatives = build_sampler(args.negatives, args.seed)
+    unique_data, new_manifest, stats = build_dataset(raw_data, args.seed, manifest, existing, negatives)
+
+    print(f"✅ 复用 {stats['reused']} 个类，重新生成 {stats['changed']} 个，"
+          f"新增 {stats['added']} 个，删除 {stats['removed']} 个")
+    print(f"📊 负样本总数: {stats['negatives']}")
+    print(f"✅ 去重后训练样本: {len(unique_data)} 条")
+
+    # ========== 4. 保存训练数据和清单 ==========
+    if args.format == 'json':
+        write_json(unique_data, args.output)
+    else:
+        write_shards(unique_data, args.output, args.format, args.shard_size)
+    save_manifest(new_manifest, manifest_path)
 
-# ========== 10. 生成数据统计报告 ==========
-print("\n" + "="*50)
-print("📊 数据统计报告")
-print("="*50)
+    print(f"✅ 训练数据已保存到 {args.output}")
+    print(f"✅ 清单已保存到 {manifest_path}")
 
-# 统计不同类型的样本
-instruction_types = {
-    '描述转类名': 0,
-    '问答形式': 0,
-    'CSS代码转类名': 0,
-    '类名解释': 0,
-    '代码生成': 0,
-    '系统对话': 0,
-    '负样本': 0
-}
+    # ========== 5. 生成数据统计报告 ==========
+    print_report(unique_data)
 
-for item in unique_data:
-    inst = item['instruction']
-    if '你是谁' in inst or '你能做什么' in inst:
-        instruction_types['系统对话'] += 1
-    elif '今天天气' in inst or 'Python' in inst or '机器学习' in inst:
-        instruction_types['负样本'] += 1
-    elif 'className' in item['output'] or '<div' in item['output']:
-        instruction_types['代码生成'] += 1
-    elif '作用是什么' in inst or '解释' in inst:
-        instruction_types['类名解释'] += 1
-    elif '```css' in inst:
-        instruction_types['CSS代码转类名'] += 1
-    elif '如何' in inst or '我想' in inst:
-        instruction_types['问答形式'] += 1
-    else:
-        instruction_types['描述转类名'] += 1
+    # ========== 6. 展示样本示例 ==========
+    print("\n" + "="*50)
+    print("📝 样本示例")
+    print("="*50)
 
-for type_name, count in instruction_types.items():
-    percentage = (count / len(unique_data)) * 100
-    print(f"{type_name}: {count} 条 ({percentage:.1f}%)")
+    for i, sample in enumerate(rng.sample(unique_data, min(5, len(unique_data))), 1):
+        print(f"\n--- 样本 {i} ---")
+        print(f"问题: {sample['instruction']}")
+        print(f"回答: {sample['output']}")
 
-# ========== 11. 展示样本示例 ==========
-print("\n" + "="*50)
-print("📝 样本示例")
-print("="*50)
+    print("\n✅ 数据处理完成！可以开始微调了。")
 
-for i, sample in enumerate(random.sample(unique_data, min(5, len(unique_data))), 1):
-    print(f"\n--- 样本 {i} ---")
-    print(f"问题: {sample['instruction']}")
-    print(f"回答: {sample['output']}")
 
-print("\n✅ 数据处理完成！可以开始微调了。")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
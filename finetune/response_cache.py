@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+生成结果缓存：同一个问题（"圆角"、"透明背景"、"居中"……）只做一次生成
+
+  - 键 = 归一化后的提示 + 生成参数 + 模型指纹（模型/LoRA 目录和权重文件的大小、修改时间）
+    归一化: NFKC（全角 → 半角）、去掉首尾空白和结尾标点、连续空白合并、英文小写
+  - LRU 淘汰（--cache-size 条）+ TTL 过期（--cache-ttl 秒）
+  - 贪心解码（temperature=0）结果确定，直接缓存；采样解码按策略处理:
+      skip   不缓存（默认）
+      reuse  与贪心相同，第一次采样结果一直复用
+      pool   每个键最多存 POOL_SIZE 个不同的采样结果，存满后随机返回其中一个
+  - 可选持久化到 JSON 文件（退出时写入，启动时读回未过期的条目）
+  - stats(): 命中率、条目数、占用内存（估算）、命中节省的生成时间
+
+用法:
+  python serve.py --cache-file response_cache.json     # GET /cache 查看统计
+  python response_cache.py response_cache.json         # 查看持久化文件的统计
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 24 * 3600  # 秒，0 为不过期
+SAMPLED_POLICIES = ('skip', 'reuse', 'pool')
+POOL_SIZE = 4  # pool 策略下每个键保存的采样结果数
+WEIGHT_FILES = ('adapter_model.safetensors', 'adapter_model.bin', 'model.safetensors', 'model_int8.safetensors',
+                'model.safetensors.index.json', 'pytorch_model.bin', 'export_info.json')
+
+_SPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT = '?？!！。.,，;；~～ '
+
+
+def normalize_prompt(text):
+    """只做不改变含义的归一化：全角/半角、空白、英文大小写、结尾标点"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = _SPACE_RE.sub(' ', text).strip().rstrip(_TRAILING_PUNCT)
+    return text.lower()
+
+
+def model_fingerprint(model_path, adapter_path=None):
+    """模型指纹：路径 + 权重文件的大小和修改时间（重新训练 / 导出后缓存自动失效，不读取权重内容）"""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in (model_path, adapter_path):
+        if not path:
+            continue
+        digest.update(os.path.abspath(path).encode('utf-8') if os.path.exists(path) else path.encode('utf-8'))
+        for name in WEIGHT_FILES:
+            file_path = os.path.join(path, name)
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ('texts', 'expires_at', 'seconds')
+
+    def __init__(self, texts, expires_at, seconds):
+        self.texts = texts  # 回复列表（pool 策略下可能有多个）
+        self.expires_at = expires_at  # time.time()，0 为不过期
+        self.seconds = seconds  # 生成耗时，命中时计入节省的时间
+
+
+class ResponseCache:
+    """线程安全的 LRU + TTL 生成结果缓存"""
+
+    def __init__(self, model_id='', max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, path=None,
+                 sampled_policy='skip'):
+        if sampled_policy not in SAMPLED_POLICIES:
+            raise ValueError(f"未知的采样缓存策略: {sampled_policy}（可选 {', '.join(SAMPLED_POLICIES)}）")
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.sampled_policy = sampled_policy
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, prompt, input_text='', max_new_tokens=None, temperature=0.0, top_p=1.0, constrained=False,
+            model_id=None):
+        parts = [normalize_prompt(prompt), normalize_prompt(input_text), max_new_tokens,
+                 round(float(temperature), 4), round(float(top_p), 4), bool(constrained),
+                 self.model_id if model_id is None else model_id]
+        payload = json.dumps(parts, ensure_ascii=False).encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def cacheable(self, temperature):
+        return temperature <= 0 or self.sampled_policy != 'skip'
+
+    def get(self, key, temperature=0.0):
+        """命中返回回复文本，否则返回 None"""
+        if not self.cacheable(temperature):
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at and entry.expires_at < time.time():
+                del self._entries[key]
+                entry = None
+            # pool 策略下采样结果没存满时继续生成
+            if entry is None or (temperature > 0 and self.sampled_policy == 'pool'
+                                 and len(entry.texts) < POOL_SIZE):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry.seconds
+            return random.choice(entry.texts) if len(entry.texts) > 1 else entry.texts[0]
+
+    def put(self, key, text, seconds=0.0, temperature=0.0):
+        if not self.cacheable(temperature):
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and temperature > 0 and self.sampled_policy == 'pool':
+                if text not in entry.texts:
+                    entry.texts.append(text)
+            else:
+                expires_at = time.time() + self.ttl if self.ttl else 0
+                self._entries[key] = CacheEntry([text], expires_at, seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def memory_bytes(self):
+        """估算占用：键 + 回复文本（UTF-8）+ 每条固定开销"""
+        with self._lock:
+            return sum(len(key) + sum(len(t.encode('utf-8')) for t in entry.texts) + 200
+                       for key, entry in self._entries.items())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'memory_bytes': self.memory_bytes(),
+            'saved_seconds': self.saved_seconds,
+            'ttl': self.ttl,
+            'sampled_policy': self.sampled_policy,
+        }
+
+    # ========== 持久化 ==========
+    def save(self, path=None):
+        """写入 JSON 文件（先写临时文件再替换，写到一半中断不会留下损坏的文件）"""
+        path = path or self.path
+        now = time.time()
+        with self._lock:
+            entries = [[key, entry.texts, entry.expires_at, entry.seconds] for key, entry in self._entries.items()
+                       if not entry.expires_at or entry.expires_at >= now]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model_id': self.model_id, 'entries': entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(entries)
+
+    def load(self, path):
+        """读回未过期的条目（按 LRU 顺序保存，最近使用的在后面）"""
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        if self.model_id and payload.get('model_id') != self.model_id:
+            return 0  # 模型已变化，旧结果全部作废
+        now = time.time()
+        with self._lock:
+            for key, texts, expires_at, seconds in payload['entries'][-self.max_entries:]:
+                if not expires_at or expires_at >= now:
+                    self._entries[key] = CacheEntry(texts, expires_at, seconds)
+        return len(self._entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看生成结果缓存文件")
+    parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    cache = ResponseCache(path=args.path, ttl=0)
+    with open(args.path, 'r', encoding='utf-8') as f:
+        model_id = json.load(f).get('model_id', '')
+    print(f"✓ {args.path}: {len(cache)} 条未过期，模型指纹 {model_id}，约 {cache.memory_bytes() / 1024:.1f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+训练样本混合：按样本类型和 className 的目标比例组 epoch
+
+生成的数据里各类型的占比由模板数量决定，而不是由训练需要决定：负样本比例只在
+check_data_quality.py 里提示，"圆角" 这类简短提问每个带圆角的类都生成一条、答案各不相同，
+代码生成样本只是从几句固定问法里随机挑一句。这里给每条样本算一个采样权重:
+
+  - 样本类型: 读生成器标注的元数据列（dataset_store tags，只读类别下标，不扫描文本），
+    旧版本生成的数据没有元数据时按生成模板推断（classify_sample）
+  - 类型比例: type_ratios 中列出的类型在每个 epoch 中占固定比例（如负样本 8%），
+    其余类型按原有数量分剩下的比例
+  - className 均衡: 同一类型内，每条样本的权重 ∝ 所属类的样本总数 ^ -class_balance
+    （0 为不调整，1 为每个类的总权重相同）
+
+权重交给 batching.MixtureSampler：每个 epoch 流式产出下标，不复制样本、不展开整个 epoch。
+
+用法:
+  python sample_mix.py training_data.json                                   # 各类型的原始占比
+  python sample_mix.py training_data.json --ratio negative=0.08 short=0.02 --class-balance 0.5
+"""
+
+import argparse
+import itertools
+import re
+import sys
+
+import numpy as np
+
+import process_data
+
+SAMPLE_TYPES = tuple(process_data.SAMPLE_TYPES)  # 类型编码即在此元组中的下标
+NO_CLASS = -1  # 不属于任何 className（系统对话、负样本等）
+
+_DIV_RE = re.compile(r'^<div className="([^"]+)">内容</div>$')
+_EXPLAIN_RE = re.compile(r'^(?:类名 (\S+) 的作用是什么？|解释一下 (\S+) 这个类)$')
+_KEYWORD_RE = re.compile(r'^有没有关于.+的类名？$')
+_ANSWER_PREFIXES = ('使用类名: ', '可以使用 ')
+
+
+def _fixed_samples():
+    return {
+        'system': {item['instruction'] for item in process_data.SYSTEM_SAMPLES},
+        'combination': {item['instruction'] for item in process_data.COMBINATION_SAMPLES},
+        'negative': {item['output'] for item in process_data.NEGATIVE_SAMPLES} | {process_data.NEGATIVE_OUTPUT},
+    }
+
+
+def classify_sample(item, fixed=None):
+    """
+    按生成模板推断 (样本类型, className)，没有元数据的旧数据使用
+
+    fixed: _fixed_samples() 的结果，批量调用时传入避免重复构建
+    """
+    fixed = fixed or _fixed_samples()
+    instruction = item.get('instruction') or ''
+    output = (item.get('output') or '').strip()
+    if instruction in fixed['system']:
+        return 'system', None
+    if instruction in fixed['combination']:
+        return 'combination', None
+    if output in fixed['negative']:
+        return 'negative', None
+
+    match = _DIV_RE.match(output)
+    if match:
+        return 'code_gen', match.group(1)
+    match = _EXPLAIN_RE.match(instruction)
+    if match:
+        return 'explanation', match.group(1) or match.group(2)
+    class_name = output
+    for prefix in _ANSWER_PREFIXES:
+        if output.startswith(prefix):
+            class_name = output[len(prefix):]
+    if _KEYWORD_RE.match(instruction):
+        return 'keyword', class_name
+    if instruction.startswith('这段CSS代码对应的类名是什么') or instruction.startswith('生成一个包含 '):
+        return 'css_code', class_name
+    if (instruction.startswith('如何') and output.startswith('使用类名: ')) or instruction.startswith('我想'):
+        return 'qa', class_name
+    if instruction == '圆角' or instruction.endswith('背景') and len(instruction) <= 12:
+        return 'short', class_name
+    return 'description', class_name
+
+
+def classify_samples(samples):
+    """逐条推断样本类型，返回值同 load_tags"""
+    fixed = _fixed_samples()
+    class_index = {}
+    types, classes = [], []
+    for item in samples:
+        sample_type, class_name = classify_sample(item, fixed)
+        types.append(SAMPLE_TYPES.index(sample_type))
+        classes.append(NO_CLASS if class_name is None else class_index.setdefault(class_name, len(class_index)))
+    return np.asarray(types, dtype=np.uint8), np.asarray(classes, dtype=np.int32), list(class_index)
+
+
+def load_tags(data_path, limit=None):
+    """
+    读出每条样本的类型和 className 编码（与训练数据同序）
+
+    参数:
+        data_path: 训练数据（.json / .jsonl / 分片目录）
+        limit: 只取前 limit 条（对应 max_samples）
+
+    返回 (types: uint8 数组，SAMPLE_TYPES 下标, classes: int32 数组，NO_CLASS 为无, class_names 列表)
+    """
+    from dataset_store import iter_samples, read_tags
+
+    tags = read_tags(data_path)
+    if tags is not None:
+        type_codes, type_names = tags['type']
+        class_codes, class_names = tags['class_name']
+        stored = np.frombuffer(type_codes, dtype=type_codes.typecode)[:limit]
+        unknown = set(type_names) - set(SAMPLE_TYPES)
+        if unknown:
+            raise ValueError(f"{data_path} 的元数据中有未知的样本类型: {', '.join(sorted(unknown))}")
+        if not (stored < 0).any():
+            lookup = np.array([SAMPLE_TYPES.index(name) for name in type_names], dtype=np.uint8)
+            classes = np.frombuffer(class_codes, dtype=class_codes.typecode)[:limit].astype(np.int32)
+            return lookup[stored], classes, list(class_names)
+
+    print(f"⚠️  {data_path} 没有完整的样本类型元数据（旧版本生成），按生成模板推断，"
+          f"重新运行 process_data.py 后可直接读取")
+    return classify_samples(itertools.islice(iter_samples(data_path), limit))
+
+
+def parse_ratios(specs):
+    """['negative=0.08', ...] -> {'negative': 0.08}"""
+    ratios = {}
+    for spec in specs or ():
+        name, _, value = spec.partition('=')
+        ratios[name] = float(value)
+    return ratios
+
+
+def mixture_weights(types, classes, type_ratios=None, class_balance=0.0):
+    """
+    每条样本的采样概率（和为 1）
+
+    参数:
+        types / classes: load_tags 返回的编码
+        type_ratios: {类型名: 占 epoch 的比例}，未列出的类型按原有数量分剩下的比例
+        class_balance: className 均衡强度，0 ~ 1
+    """
+    type_ratios = dict(type_ratios or {})
+    unknown = set(type_ratios) - set(SAMPLE_TYPES)
+    if unknown:
+        raise ValueError(f"未知的样本类型: {', '.join(sorted(unknown))}（可选: {', '.join(SAMPLE_TYPES)}）")
+    if sum(type_ratios.values()) > 1.0 + 1e-9 or any(r < 0 for r in type_ratios.values()):
+        raise ValueError(f"类型比例之和应在 0 ~ 1 之间: {type_ratios}")
+    if not 0.0 <= class_balance <= 1.0:
+        raise ValueError(f"class_balance 应在 0 ~ 1 之间: {class_balance}")
+
+    types = np.asarray(types)
+    classes = np.asarray(classes)
+    type_counts = np.bincount(types, minlength=len(SAMPLE_TYPES)).astype(np.float64)
+
+    # 每种类型占 epoch 的比例
+    shares = np.zeros(len(SAMPLE_TYPES))
+    fixed = np.zeros(len(SAMPLE_TYPES), dtype=bool)
+    for name, ratio in type_ratios.items():
+        i = SAMPLE_TYPES.index(name)
+        if type_counts[i]:  # 数据里没有的类型不占比例
+            shares[i], fixed[i] = ratio, True
+    free = ~fixed & (type_counts > 0)
+    if free.any():
+        shares[free] = (1.0 - shares[fixed].sum()) * type_counts[free] / type_counts[free].sum()
+    elif shares.sum() > 0:
+        shares /= shares.sum()  # 所有类型都指定了比例，按比例归一化
+
+    # 类型内按 className 均衡
+    weights = np.ones(len(types))
+    if class_balance > 0:
+        has_class = classes != NO_CLASS
+        class_counts = np.bincount(classes[has_class])
+        weights[has_class] = class_counts[classes[has_class]].astype(np.float64) ** -class_balance
+    type_totals = np.bincount(types, weights=weights, minlength=len(SAMPLE_TYPES))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(type_totals > 0, shares / type_totals, 0.0)
+    probabilities = weights * scale[types]
+    return probabilities / probabilities.sum()
+
+
+def mix_report(types, classes, probabilities):
+    """各类型的原始占比 / 混合后占比，以及 className 占比的分布"""
+    types = np.asarray(types)
+    classes = np.asarray(classes)
+    counts = np.bincount(types, minlength=len(SAMPLE_TYPES))
+    mixed = np.bincount(types, weights=probabilities, minlength=len(SAMPLE_TYPES))
+    rows = [{'type': name, 'count': int(counts[i]), 'natural': counts[i] / len(types), 'mixed': float(mixed[i])}
+            for i, name in enumerate(SAMPLE_TYPES) if counts[i]]
+    has_class = classes != NO_CLASS
+    class_share = np.bincount(classes[has_class], weights=probabilities[has_class])
+    class_natural = np.bincount(classes[has_class]) / len(types)
+    return {
+        'types': rows,
+        'classes': {
+            'count': int(len(class_share)),
+            'natural_max_over_min': float(class_natural.max() / class_natural.min()) if len(class_natural) else 0.0,
+            'mixed_max_over_min': float(class_share.max() / class_share.min()) if len(class_share) else 0.0,
+        },
+    }
+
+
+def print_mix(report):
+    print(f"  {'类型':<12} {'样本数':>7} {'原始占比':>8} {'混合后':>8}")
+    for row in report['types']:
+        print(f"  {row['type']:<12} {row['count']:>7} {row['natural']:>8.1%} {row['mixed']:>8.1%}")
+    classes = report['classes']
+    if classes['count']:
+        print(f"  className: {classes['count']} 个，最多/最少的类占比之比 "
+              f"{classes['natural_max_over_min']:.1f} → {classes['mixed_max_over_min']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看样本类型占比和混合后的占比")
+    parser.add_argument('data', nargs='?', default='training_data.json', help='训练数据（.json / .jsonl / 分片目录）')
+    parser.add_argument('--ratio', nargs='*', default=[], metavar='TYPE=RATIO', help='类型目标比例，如 negative=0.08')
+    parser.add_argument('--class-balance', type=float, default=0.0, help='className 均衡强度（0 ~ 1）')
+    args = parser.parse_args(argv)
+
+    types, classes, _ = load_tags(args.data)
+    probabilities = mixture_weights(types, classes, parse_ratios(args.ratio), args.class_balance)
+    print(f"📊 {args.data}: {len(types)} 条样本")
+    print_mix(mix_report(types, classes, probabilities))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
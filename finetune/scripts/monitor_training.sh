@@ -15,6 +15,11 @@ if ps aux | grep "simple_train.py" | grep -v grep > /dev/null; then
     ps aux | grep "simple_train.py" | grep -v grep | awk '{printf "  PID: %s\n  CPU: %s%%\n  内存: %s%%\n  运行时间: %s\n", $2, $3, $4, $10}'
     echo ""
     
+    # 训练指标：状态接口（simple_train.py 的 METRICS_PORT），不可用时读 JSONL 的最后一条
+    echo "训练指标:"
+    python training_metrics.py --port "${METRICS_PORT:-8790}" --file css_assistant_model/training_metrics.jsonl | sed 's/^/  /'
+    echo ""
+
     # 检查输出目录
     if [ -d "css_assistant_model" ]; then
         echo "模型输出目录:"
@@ -39,6 +44,12 @@ else
         echo ""
         echo "模型文件:"
         ls -lh css_assistant_model/
+        echo ""
+    fi
+
+    if [ -f "css_assistant_model/training_metrics.jsonl" ]; then
+        echo "最后一次训练指标:"
+        python training_metrics.py --port "${METRICS_PORT:-8790}" --file css_assistant_model/training_metrics.jsonl | sed 's/^/  /'
     fi
 fi
 
@@ -32,12 +32,15 @@ fi
 echo ""
 echo "正在暂停训练..."
 
-# 发送 SIGINT 信号（相当于 Ctrl+C）
+# 发送 SIGINT 信号（相当于 Ctrl+C），simple_train.py 会在当前步结束后保存 checkpoint 再退出
 kill -INT $PID
 
-# 等待进程结束
-echo "等待进程安全退出..."
-sleep 3
+# 等待进程结束（保存 checkpoint 需要一些时间，最多等 120 秒）
+echo "等待当前步结束并保存 checkpoint..."
+for i in $(seq 1 120); do
+    ps -p $PID > /dev/null 2>&1 || break
+    sleep 1
+done
 
 # 检查进程是否已结束
 if ps -p $PID > /dev/null 2>&1; then
@@ -69,10 +72,10 @@ if [ -d "css_assistant_model" ]; then
     ls -lh css_assistant_model/ | grep -v "^d" | grep -v "^total"
 else
     echo "⚠️  未找到保存的模型文件"
-    echo "   训练可能还未到第一个保存点（500步）"
+    echo "   训练可能还未到第一个保存点"
 fi
 
 echo ""
 echo "======================================"
-echo "如需恢复训练，请查看 TRAINING_STATUS.md"
+echo "恢复训练: ./scripts/resume_training.sh"
 echo "======================================"
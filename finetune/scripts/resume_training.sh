@@ -21,16 +21,11 @@ fi
 
 if [ -n "$LATEST_CHECKPOINT" ]; then
     echo "✓ 找到最新的 Checkpoint: $LATEST_CHECKPOINT"
-    echo ""
-    echo "⚠️  注意: 当前 simple_train.py 不支持从 checkpoint 恢复"
-    echo "   需要修改脚本添加 resume_from_checkpoint 参数"
-    echo ""
-    read -p "是否从头开始重新训练？(y/n): " confirm
-    
-    if [ "$confirm" != "y" ] && [ "$confirm" != "Y" ]; then
-        echo "取消操作"
-        exit 0
-    fi
+    echo "  将从该 checkpoint 继续训练（LoRA 权重、优化器、调度器、随机数状态和数据顺序都会恢复）"
+    RESUME_ARG="--resume $LATEST_CHECKPOINT"
+else
+    echo "⚠️  未找到 checkpoint，将从头开始训练"
+    RESUME_ARG="--resume none"
 fi
 
 echo ""
@@ -40,7 +35,7 @@ echo ""
 
 # 激活虚拟环境并运行训练
 source train_env/bin/activate
-nohup python simple_train.py > training.log 2>&1 &
+nohup python simple_train.py $RESUME_ARG >> training.log 2>&1 &
 
 # 获取进程 ID
 TRAIN_PID=$!
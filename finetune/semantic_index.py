@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+CSS 类名语义检索：把每个类的描述编码成向量，按余弦相似度找最接近的类
+
+  - 编码器: 默认为语言模型最后一层 hidden state 的平均池化（DEFAULT_ENCODER 即基座模型，也可以是
+            合并模型目录）；hash（字符 n-gram 哈希，不需要模型）为显式兜底，只能匹配字面相近的描述，
+            "文字太长显示省略号" 这类换了说法的查询基本找不到
+  - 向量保存在磁盘上（vectors.npy，内存映射加载），编码只在类数据或编码器变化时做一次
+  - 检索: 类数少时 NumPy 暴力内积；超过 IVF_MIN_ITEMS 时用 IVF（球面 k-means 分桶，只查最近的 nprobe 个桶）
+
+缓存目录 <cache_root>/<key>/:
+  vectors.npy                float32 [类数, 维度]，已归一化
+  ivf_centroids.npy          （IVF）桶中心
+  ivf_lists.npy / ivf_offsets.npy  （IVF）按桶排序的类编号，第 i 个桶为 lists[offsets[i]:offsets[i+1]]
+  meta.json                  缓存键的组成、类名列表、索引类型
+
+用法:
+  python semantic_index.py "文字太长显示省略号"                  # 默认编码器（基座模型）
+  python semantic_index.py --encoder ./css_assistant_merged "按钮圆角" -k 10
+  python semantic_index.py --encoder hash "按钮圆角"             # 没有模型时的兜底
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from process_data import parse_description
+from token_cache import cache_key, hash_data
+
+DEFAULT_CLASSES_FILE = "css_classes.json"
+DEFAULT_CACHE_ROOT = ".semantic_index"
+DEFAULT_ENCODER = "Qwen/Qwen2.5-1.5B-Instruct"  # 同 inference.DEFAULT_BASE_MODEL（这里不导入 torch）
+FALLBACK_ENCODER = "hash"
+INDEX_VERSION = 1
+INDEX_TYPES = ('auto', 'flat', 'ivf')
+
+HASH_DIM = 2048  # hash 编码器的维度
+HASH_NGRAM_SIZES = (1, 2, 3)
+ENCODE_BATCH_SIZE = 32
+ENCODE_MAX_LENGTH = 128
+IVF_MIN_ITEMS = 20_000  # auto 模式下超过该数量才建 IVF
+IVF_ITERATIONS = 10
+IVF_TRAIN_SAMPLES = 50_000  # k-means 最多用这么多向量训练
+DEFAULT_NPROBE = 8
+SEARCH_CHUNK = 16_384  # 分块计算内积，避免 [查询数, 类数] 的大矩阵
+
+SearchResult = namedtuple('SearchResult', ['class_name', 'description', 'score'])
+
+
+# ========== 1. 编码器 ==========
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class HashingEncoder:
+    """字符 n-gram 哈希到固定维度，log(1 + tf) 加权（不需要模型，作为基线和兜底；只匹配字面相近的文本）"""
+
+    def __init__(self, dim=HASH_DIM):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = ' '.join(text.lower().split())
+            for n in HASH_NGRAM_SIZES:
+                for i in range(len(text) - n + 1):
+                    # crc32 在进程间稳定（内置 hash() 每次启动都不同）
+                    vectors[row, zlib.crc32(text[i:i + n].encode('utf-8')) % self.dim] += 1
+        return normalize_rows(np.log1p(vectors))
+
+
+class TransformerEncoder:
+    """
+    语言模型最后一层 hidden state 的平均池化（padding 位置不计入），默认编码器
+
+    可以直接传入已加载的模型（serve.py 复用推理模型），name 参与索引缓存键。
+    encode 持有 lock 执行（tokenizer 不能多线程同时调用）；模型与生成共用时传入生成方的锁，
+    编码前向和生成前向互斥
+    """
+
+    def __init__(self, model, tokenizer, name, batch_size=ENCODE_BATCH_SIZE, max_length=ENCODE_MAX_LENGTH,
+                 lock=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.name = name
+        self.lock = lock or threading.Lock()
+        self.batch_size = batch_size
+        self.max_length = max_length
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+    @classmethod
+    def from_pretrained(cls, path, **kwargs):
+        from inference import load_model
+
+        model, tokenizer = load_model(path)
+        return cls(model, tokenizer, name=path, **kwargs)
+
+    def encode(self, texts):
+        import torch
+
+        chunks = []
+        with self.lock, torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                batch = self.tokenizer(
+                    list(texts[start:start + self.batch_size]), padding=True, truncation=True,
+                    max_length=self.max_length, return_tensors='pt',
+                )
+                mask = batch['attention_mask'].to(self.model.device)
+                outputs = self.model(input_ids=batch['input_ids'].to(self.model.device), attention_mask=mask,
+                                     output_hidden_states=True)
+                hidden = outputs.hidden_states[-1].float()
+                pooled = (hidden * mask[..., None]).sum(1) / mask.sum(1, keepdim=True).clamp(min=1)
+                chunks.append(pooled.cpu().numpy())
+        return normalize_rows(np.concatenate(chunks)) if chunks else np.zeros((0, 0), dtype=np.float32)
+
+
+def load_encoder(spec=DEFAULT_ENCODER):
+    """模型名称或路径（默认基座模型）；'hash' / 'hash-<维度>' 为哈希编码器（兜底）"""
+    if spec == FALLBACK_ENCODER:
+        return HashingEncoder()
+    if spec.startswith(f"{FALLBACK_ENCODER}-"):
+        return HashingEncoder(int(spec[len(FALLBACK_ENCODER) + 1:]))
+    return TransformerEncoder.from_pretrained(spec)
+
+
+# ========== 2. 向量索引 ==========
+def top_k(scores, k):
+    """每行分数最高的 k 个，返回 (分数, 下标)，按分数从高到低"""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+def train_ivf(vectors, nlist, iterations=IVF_ITERATIONS, seed=0):
+    """球面 k-means，返回 (centroids, lists, offsets)"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = vectors[rng.choice(n, min(n, IVF_TRAIN_SAMPLES), replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_ivf(sample, centroids)
+        # 按桶排序后分段求和（比 np.add.at 快一个数量级），空桶保留原中心
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)])[filled]
+        centroids[filled] = normalize_rows(np.add.reduceat(sample[order], starts, axis=0))
+    assign = assign_ivf(vectors, centroids)
+    lists = np.argsort(assign, kind='stable').astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+    return centroids, lists, offsets
+
+
+def assign_ivf(vectors, centroids):
+    return np.concatenate([
+        (vectors[i:i + SEARCH_CHUNK] @ centroids.T).argmax(1)
+        for i in range(0, len(vectors), SEARCH_CHUNK)
+    ])
+
+
+class VectorIndex:
+    """归一化向量的内积检索：flat 为暴力计算，ivf 只查最近的 nprobe 个桶"""
+
+    def __init__(self, vectors, centroids=None, lists=None, offsets=None, nprobe=DEFAULT_NPROBE):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.lists = lists
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @property
+    def kind(self):
+        return 'ivf' if self.centroids is not None else 'flat'
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k=5):
+        """queries: [查询数, 维度]，返回 (分数, 下标)，形状都是 [查询数, k]"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.centroids is not None:
+            return self._search_ivf(queries, k)
+        best_scores, best_ids = None, None
+        for start in range(0, len(self.vectors), SEARCH_CHUNK):
+            scores, ids = top_k(queries @ np.asarray(self.vectors[start:start + SEARCH_CHUNK]).T, k)
+            ids += start
+            if best_scores is not None:
+                scores, order = top_k(np.concatenate([best_scores, scores], axis=1), k)
+                ids = np.take_along_axis(np.concatenate([best_ids, ids], axis=1), order, axis=1)
+            best_scores, best_ids = scores, ids
+        return best_scores, best_ids
+
+    def _search_ivf(self, queries, k):
+        nprobe = min(self.nprobe, len(self.centroids))
+        _, probes = top_k(queries @ self.centroids.T, nprobe)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            # 排序后再取向量，内存映射时按顺序读
+            candidates = np.sort(np.concatenate([self.lists[self.offsets[c]:self.offsets[c + 1]] for c in probes[row]]))
+            if not len(candidates):
+                continue
+            scores, idx = top_k((self.vectors[candidates] @ query)[None], k)
+            count = scores.shape[1]
+            all_scores[row, :count] = scores[0]
+            all_ids[row, :count] = candidates[idx[0]]
+        return all_scores, all_ids
+
+
+# ========== 3. 类名语义索引（构建 + 缓存） ==========
+def class_text(record):
+    """参与编码的文本：类名 + 描述（没有写进描述的 CSS 属性也带上）"""
+    parts = [record.class_name, record.summary]
+    if record.properties and record.css_code:
+        parts.append(' '.join(f"{name}: {value};" for name, value in record.properties))
+    return ' '.join(part for part in parts if part)
+
+
+def index_key_fields(classes_path, encoder, index_type):
+    return {
+        'version': INDEX_VERSION,
+        'encoder': encoder.name,
+        'index_type': index_type,
+        'data_hash': hash_data(classes_path),
+    }
+
+
+def build_index(items, encoder, cache_dir, fields, index_type='auto'):
+    """编码所有类并写入缓存目录（先写临时目录，完成后替换）"""
+    records = {}
+    for item in items:
+        record = parse_description(item['className'], item['description'])
+        records.setdefault(record.class_name, record)
+    names = list(records)
+    vectors = encoder.encode([class_text(records[name]) for name in names])
+
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'vectors.npy'), vectors)
+    use_ivf = index_type == 'ivf' or (index_type == 'auto' and len(names) >= IVF_MIN_ITEMS)
+    if use_ivf:
+        nlist = max(1, min(len(names), int(4 * np.sqrt(len(names)))))
+        centroids, lists, offsets = train_ivf(vectors, nlist)
+        np.save(os.path.join(tmp_dir, 'ivf_centroids.npy'), centroids)
+        np.save(os.path.join(tmp_dir, 'ivf_lists.npy'), lists)
+        np.save(os.path.join(tmp_dir, 'ivf_offsets.npy'), offsets)
+    meta = dict(
+        fields,
+        kind='ivf' if use_ivf else 'flat',
+        dim=int(vectors.shape[1]),
+        class_names=names,
+        descriptions=[records[name].summary for name in names],
+        created=time.time(),
+    )
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+class SemanticIndex:
+    """
+    从缓存目录加载的类名语义索引
+
+    用法:
+        index = load_or_build("css_classes.json", load_encoder())  # 默认编码器，没有模型时 load_encoder("hash")
+        index.search("文字太长显示省略号", k=5)  # [SearchResult(class_name, description, score), ...]
+    """
+
+    def __init__(self, cache_dir, encoder, nprobe=DEFAULT_NPROBE):
+        self.cache_dir = cache_dir
+        self.encoder = encoder
+        with open(os.path.join(cache_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.class_names = self.meta['class_names']
+        self.descriptions = self.meta['descriptions']
+        vectors = np.load(os.path.join(cache_dir, 'vectors.npy'), mmap_mode='r')
+        if self.meta['kind'] == 'ivf':
+            self.vectors = VectorIndex(
+                vectors,
+                np.load(os.path.join(cache_dir, 'ivf_centroids.npy')),
+                np.load(os.path.join(cache_dir, 'ivf_lists.npy')),
+                np.load(os.path.join(cache_dir, 'ivf_offsets.npy')),
+                nprobe=nprobe,
+            )
+        else:
+            self.vectors = VectorIndex(vectors)
+
+    def __len__(self):
+        return len(self.class_names)
+
+    def search_batch(self, queries, k=5):
+        scores, ids = self.vectors.search(self.encoder.encode(list(queries)), k)
+        return [
+            [SearchResult(self.class_names[i], self.descriptions[i], float(s)) for s, i in zip(row_s, row_i) if i >= 0]
+            for row_s, row_i in zip(scores, ids)
+        ]
+
+    def search(self, query, k=5):
+        return self.search_batch([query], k)[0]
+
+
+def load_or_build(classes_path=DEFAULT_CLASSES_FILE, encoder=None, cache_root=DEFAULT_CACHE_ROOT,
+                  index_type='auto', nprobe=DEFAULT_NPROBE):
+    """
+    返回 SemanticIndex：缓存命中时直接内存映射，否则编码所有类后写入缓存
+
+    参数:
+        classes_path: css_classes.json
+        encoder: load_encoder() 返回的编码器，默认 DEFAULT_ENCODER（模型 hidden state 平均池化）
+        index_type: auto（按类数选择）/ flat / ivf
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"未知索引类型: {index_type}（可选: {', '.join(INDEX_TYPES)}）")
+    encoder = encoder or load_encoder()
+    fields = index_key_fields(classes_path, encoder, index_type)
+    cache_dir = os.path.join(cache_root, cache_key(fields))
+
+    if not os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        start = time.perf_counter()
+        os.makedirs(cache_root, exist_ok=True)
+        with open(classes_path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        build_index(items, encoder, cache_dir, fields, index_type)
+        print(f"✓ 语义索引构建完成: {len(items)} 个类，{time.perf_counter() - start:.1f}s -> {cache_dir}")
+    return SemanticIndex(cache_dir, encoder, nprobe)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSS 类名语义检索")
+    parser.add_argument('queries', nargs='+', help='查询文本')
+    parser.add_argument('--classes', default=DEFAULT_CLASSES_FILE)
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help=f"模型名称或路径（默认 {DEFAULT_ENCODER}）；hash / hash-<维度> 为不需要模型的兜底")
+    parser.add_argument('--index', choices=INDEX_TYPES, default='auto')
+    parser.add_argument('--cache-root', default=DEFAULT_CACHE_ROOT)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    index = load_or_build(args.classes, load_encoder(args.encoder), args.cache_root, args.index)
+    print(f"✓ {len(index)} 个类，编码器 {index.encoder.name}，索引 {index.vectors.kind}")
+    for query in args.queries:
+        start = time.perf_counter()
+        results = index.search(query, args.k)
+        print(f"\n🔎 {query}（{(time.perf_counter() - start) * 1000:.2f}ms）")
+        for result in results:
+            print(f"  {result.score:.3f}  {result.class_name:<28} {result.description[:40]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+CSS 助手推理服务（本地 HTTP API，常驻进程）
+
+接口:
+  POST /generate  {"prompt": "圆角", "input": "", "max_new_tokens": 128, "temperature": 0, "top_p": 1.0}
+                  -> {"text": "...", "latency_ms": 12.3, "batch_size": 4, "source": "model"}
+                  "constrained": true 时约束解码，只能生成 css_classes.json 中的类名（"描述 → 类名" 类问题）
+                  "adapter": "r16" 指定 LoRA（--adapters 加载的名称，"base" 为只用基座），不指定用默认 LoRA
+  GET  /adapters  -> {"default": "default", "adapters": {"default": {"path": "...", "size_mb": 4.2}, ...}}
+  POST /adapters  {"name": "r16", "path": "./output_model"}  运行时加载 / 替换一个 LoRA（基座不重新加载）
+  POST /search    {"query": "文字太长显示省略号", "k": 5}（默认复用推理模型做语义编码，--semantic-encoder 切换）
+                  -> {"results": [{"className": "...", "description": "...", "score": 0.83}], "latency_ms": 0.8}
+  GET  /health    -> {"status": "ok", "requests": ..., "batches": ..., "avg_batch_size": ..., "index_hits": ..., "adapters": [...]}
+  GET  /cache     -> 生成结果缓存统计 {"hits": ..., "hit_rate": ..., "memory_bytes": ..., "saved_seconds": ...}
+
+  - 查表类问题（类名解释、描述/CSS 代码 → 类名等）先查 css_index，命中直接返回（source: index），
+    置信度不足才交给模型（--no-index 关闭）
+  - 生成结果缓存（response_cache.py）：归一化后的提示 + 生成参数 + 模型指纹相同的请求直接返回（source: cache）；
+    默认只缓存贪心解码（--cache-sampled 设置采样解码的策略），--cache-file 持久化，--cache-size 0 关闭
+
+  - 动态组 batch：后台线程收到第一个请求后最多再等 --max-wait-ms，最多凑 --max-batch-size 条一起解码，
+    生成参数相同的请求才合并
+  - 系统提示前缀的 KV cache 只计算一次，所有请求复用（--no-prefix-cache 关闭，用于对比）
+  - 只解码新生成的 token，遇到 <|im_end|> 即停止
+  - 存在 export_model.py 导出的合并模型（--merged）时直接加载它，否则加载基座 + LoRA
+  - 多 LoRA（--adapters name=path ...）：基座只加载一次，每个 LoRA 只多占自身权重的内存；
+    不同 LoRA 的请求在同一批里解码（peft adapter_names），前缀 KV cache 按 LoRA 分别复用
+
+用法:
+  python serve.py --adapter ./css_assistant_model --port 8000
+  python serve.py --merged ./css_assistant_merged-int8     # CPU 上用 int8 合并模型
+  python serve.py --cache-file response_cache.json          # 生成结果缓存在重启后保留
+  python serve.py --adapters r5=./css_assistant_model r16=./css_assistant_model_v2 r8=./output_model
+  curl -s localhost:8000/generate -d '{"prompt": "圆角"}'
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constrained import ClassNameConstraint
+from css_index import DEFAULT_CLASSES_FILE, CssIndex
+from inference import (BASE_ADAPTER, DEFAULT_ADAPTER_PATH, DEFAULT_BASE_MODEL, DEFAULT_MAX_NEW_TOKENS,
+                       DEFAULT_MERGED_PATH, load_adapters, search_css)
+from response_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, SAMPLED_POLICIES, ResponseCache, model_fingerprint
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+MAX_BATCH_SIZE = 8  # 每批最多合并的请求数
+MAX_WAIT_MS = 10  # 收到第一个请求后等待更多请求的最长时间
+REQUEST_TIMEOUT = 300  # 单个请求最长等待时间（秒）
+DEFAULT_ADAPTER_NAME = "default"  # --adapter 加载的 LoRA 在多 LoRA 模式下的名称
+SEMANTIC_MODEL_ENCODER = "model"  # /search 默认：已加载的推理模型 hidden state 平均池化，不再加载一份模型
+
+
+class PendingRequest:
+    __slots__ = ('prompt', 'params', 'adapter', 'done', 'text', 'error', 'batch_size')
+
+    def __init__(self, prompt, params, adapter=None):
+        self.prompt = prompt
+        self.params = params
+        self.adapter = adapter
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+        self.batch_size = 0
+
+
+class BatchScheduler:
+    """后台线程：从队列中取请求，按生成参数分组后批量生成（不同 LoRA 的请求可以在同一批）"""
+
+    def __init__(self, generator, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, constraint=None,
+                 adapters=None):
+        self.generator = generator
+        self.constraint = constraint
+        # 名称 -> LoRA 目录；None 表示不能再加载 LoRA（合并模型）
+        self.adapters = dict(adapters) if adapters is not None else None
+        self.default_adapter = next(iter(self.adapters), BASE_ADAPTER) if self.adapters is not None else None
+        self.adapter_sizes = {name: self._adapter_size(name) for name in self.adapters or {}}
+        # 共享模型 / tokenizer 的锁：生成、加载 LoRA、/search 的模型编码器（TransformerEncoder(lock=...)）
+        # 都必须持有它。逐行 adapter_names 的混合批次在前向期间给 LoraLayer 挂 pre-hook，
+        # 同时进行的其他前向会被套上这一批的 adapter_names（peft 报 "Length of `adapter_names`"），
+        # 加载 LoRA 会改动模型结构；新增用到 generator.model / tokenizer 的接口也要在锁内执行
+        self.lock = threading.Lock()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.num_requests = 0
+        self.num_batches = 0
+        self._thread = threading.Thread(target=self._loop, name='batch-scheduler', daemon=True)
+        self._thread.start()
+
+    def _adapter_size(self, name):
+        """LoRA 权重占用的字节数（遍历模型参数，调用方持有 self.lock 或后台线程尚未开始生成）"""
+        return sum(p.numel() * p.element_size() for n, p in self.generator.model.named_parameters()
+                   if f".{name}." in n)
+
+    def resolve_adapter(self, name):
+        """请求中的 LoRA 名称 -> 生成用的名称（None 为默认）"""
+        if name is None:
+            return None
+        if self.adapters is None:
+            raise ValueError("合并模型不支持指定 LoRA")
+        if name in ('base', BASE_ADAPTER):
+            return BASE_ADAPTER
+        if name not in self.adapters:
+            raise ValueError(f"未加载的 LoRA: {name}（已加载: {', '.join(self.adapters) or '无'}）")
+        return name
+
+    def load_adapter(self, name, path):
+        """运行时加载（或替换）一个 LoRA，正在进行的批次结束后生效"""
+        if self.adapters is None:
+            raise ValueError("合并模型不能再加载 LoRA")
+        if name in ('base', BASE_ADAPTER):
+            raise ValueError(f"保留名称: {name}")
+        if name == self.default_adapter:
+            raise ValueError(f"默认 LoRA {name} 不能替换（重启服务）")
+        with self.lock:
+            model = self.generator.model
+            if name in self.adapters:
+                model.delete_adapter(name)
+                self.generator.forget_adapter(name)
+            self.generator.model = load_adapters(model, {name: path})
+            self.adapters[name] = path
+            self.adapter_sizes[name] = self._adapter_size(name)
+
+    def _adapter_names(self, requests):
+        """这一批每条请求的 LoRA；都用默认 LoRA（当前激活的）时返回 None，走普通前向"""
+        if not self.adapters:
+            return None
+        names = [r.adapter or self.default_adapter for r in requests]
+        if self.default_adapter != BASE_ADAPTER and all(name == self.default_adapter for name in names):
+            return None
+        return names
+
+    def submit(self, prompt, max_new_tokens, temperature, top_p, constrained=False, adapter=None):
+        if constrained:
+            # 类名生成完整即停止，长度上限取最长类名
+            max_new_tokens = self.constraint.max_length + 1
+        request = PendingRequest(prompt, (max_new_tokens, temperature, top_p, constrained), adapter)
+        self.queue.put(request)
+        if not request.done.wait(REQUEST_TIMEOUT):
+            raise TimeoutError("生成超时")
+        if request.error:
+            raise request.error
+        return request
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            groups = defaultdict(list)
+            for request in self._collect():
+                groups[request.params].append(request)
+            for (max_new_tokens, temperature, top_p, constrained), requests in groups.items():
+                try:
+                    with self.lock:
+                        texts = self.generator.generate(
+                            [r.prompt for r in requests],
+                            max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+                            allowed_tokens=self.constraint if constrained else None,
+                            adapters=self._adapter_names(requests),
+                        )
+                except Exception as e:  # 出错时让这一批的请求都返回错误，服务继续运行
+                    for r in requests:
+                        r.error = e
+                        r.done.set()
+                    continue
+                self.num_requests += len(requests)
+                self.num_batches += 1
+                for r, text in zip(requests, texts):
+                    r.text = text
+                    r.batch_size = len(requests)
+                    r.done.set()
+
+    def stats(self):
+        return {
+            'requests': self.num_requests,
+            'batches': self.num_batches,
+            'avg_batch_size': self.num_requests / self.num_batches if self.num_batches else 0.0,
+            'queued': self.queue.qsize(),
+            'adapters': list(self.adapters or []),
+        }
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 默认 listen backlog 只有 5，并发连接多时会触发 1s 的 SYN 重传
+
+
+def make_handler(scheduler, default_max_new_tokens, index=None, semantic_index=None, cache=None, model_path=None):
+    index_hits = [0]
+
+    def adapter_label(adapter):
+        adapter = adapter or scheduler.default_adapter
+        return 'base' if adapter == BASE_ADAPTER else adapter
+
+    def cache_model_id(adapter):
+        """缓存键里的模型指纹：默认 LoRA 用缓存自己的，其余按 LoRA 目录计算"""
+        if adapter is None:
+            return cache.model_id
+        return model_fingerprint(model_path, scheduler.adapters.get(adapter))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, dict(status='ok', index_hits=index_hits[0], **scheduler.stats()))
+            elif self.path == '/cache':
+                if cache is None:
+                    self._send_json(404, {'error': '未启用生成结果缓存'})
+                else:
+                    self._send_json(200, cache.stats())
+            elif self.path == '/adapters':
+                self._send_json(200, {
+                    'default': adapter_label(None),
+                    'adapters': {name: {'path': path, 'size_mb': scheduler.adapter_sizes[name] / 2 ** 20}
+                                 for name, path in (scheduler.adapters or {}).items()},
+                })
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def _search(self):
+            if semantic_index is None:
+                self._send_json(404, {'error': '语义检索已关闭（--semantic-encoder none）'})
+                return
+            try:
+                payload = self._read_json()
+                query, k = payload['query'], int(payload.get('k', 5))
+                if not isinstance(query, str) or not query.strip() or k < 1:
+                    raise ValueError("query 应为非空字符串，k 应为正整数")
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {'error': f"请求格式错误: {e}"})
+                return
+            try:
+                results, seconds = search_css(semantic_index, query, k)
+            except Exception as e:  # 编码 / 检索出错是服务端问题，不是请求格式
+                self._send_json(500, {'error': f"语义检索失败: {e}"})
+                return
+            self._send_json(200, {
+                'results': [{'className': r.class_name, 'description': r.description, 'score': r.score}
+                            for r in results],
+                'latency_ms': seconds * 1000,
+            })
+
+        def _load_adapter(self):
+            start = time.perf_counter()
+            try:
+                payload = self._read_json()
+                scheduler.load_adapter(payload['name'], payload['path'])
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {'error': f"加载 LoRA 失败: {e}"})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': f"加载 LoRA 失败: {e}"})
+                return
+            self._send_json(200, {
+                'name': payload['name'],
+                'path': payload['path'],
+                'size_mb': scheduler.adapter_sizes[payload['name']] / 2 ** 20,
+                'seconds': time.perf_counter() - start,
+            })
+
+        def do_POST(self):
+            if self.path == '/search':
+                self._search()
+                return
+            if self.path == '/adapters':
+                self._load_adapter()
+                return
+            if self.path != '/generate':
+                self._send_json(404, {'error': 'not found'})
+                return
+            start = time.perf_counter()
+            try:
+                payload = self._read_json()
+                prompt = payload['prompt']
+                input_text = payload.get('input', '')
+                constrained = bool(payload.get('constrained', False))
+                adapter = scheduler.resolve_adapter(payload.get('adapter'))
+                match = index.lookup(prompt, input_text) if index is not None else None
+                if match is not None and constrained and len(match.class_names) != 1:
+                    match = None  # 多个候选时交给约束解码选一个
+                if match is not None:
+                    index_hits[0] += 1
+                    self._send_json(200, {
+                        'text': match.class_names[0] if constrained else match.answer,
+                        'latency_ms': (time.perf_counter() - start) * 1000,
+                        'batch_size': 0,
+                        'source': 'index',
+                    })
+                    return
+                max_new_tokens = int(payload.get('max_new_tokens', default_max_new_tokens))
+                temperature = float(payload.get('temperature', 0.0))
+                top_p = float(payload.get('top_p', 1.0))
+                key = None
+                if cache is not None:
+                    key = cache.key(prompt, input_text, max_new_tokens, temperature, top_p, constrained,
+                                    cache_model_id(adapter))
+                    text = cache.get(key, temperature)
+                    if text is not None:
+                        self._send_json(200, {
+                            'text': text,
+                            'latency_ms': (time.perf_counter() - start) * 1000,
+                            'batch_size': 0,
+                            'source': 'cache',
+                            'adapter': adapter_label(adapter),
+                        })
+                        return
+                request = scheduler.submit(
+                    (prompt, input_text) if input_text else prompt,
+                    max_new_tokens, temperature, top_p, constrained, adapter,
+                )
+                if cache is not None:
+                    cache.put(key, request.text, time.perf_counter() - start, temperature)
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {'error': f"请求格式错误: {e}"})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {
+                'text': request.text,
+                'latency_ms': (time.perf_counter() - start) * 1000,
+                'batch_size': request.batch_size,
+                'source': 'model',
+                'adapter': adapter_label(adapter),
+            })
+
+        def log_message(self, format, *args):
+            pass  # 不逐条打印访问日志
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSS 助手推理服务")
+    parser.add_argument('--base-model', default=DEFAULT_BASE_MODEL)
+    parser.add_argument('--adapter', default=DEFAULT_ADAPTER_PATH, help="LoRA 权重目录（'none' 为只用基座模型）")
+    parser.add_argument('--merged', default=DEFAULT_MERGED_PATH,
+                        help="export_model.py 导出的合并模型目录，存在时优先使用（'none' 为不使用）")
+    parser.add_argument('--adapters', nargs='+', metavar='NAME=PATH',
+                        help='再加载多个 LoRA（共用一个基座），请求中用 "adapter": NAME 选择；--adapter 的名称为 default')
+    parser.add_argument('--template', default='simple')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    parser.add_argument('--max-new-tokens', type=int, default=DEFAULT_MAX_NEW_TOKENS, help='请求未指定时的默认值')
+    parser.add_argument('--no-prefix-cache', action='store_true', help='不复用系统提示前缀的 KV cache')
+    parser.add_argument('--classes', default=DEFAULT_CLASSES_FILE, help='类名检索索引的数据（css_classes.json）')
+    parser.add_argument('--no-index', action='store_true', help='不使用类名检索索引，所有请求都交给模型')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_ENTRIES, help='生成结果缓存条数（0 关闭）')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL, help='缓存过期时间（秒，0 为不过期）')
+    parser.add_argument('--cache-sampled', choices=SAMPLED_POLICIES, default='skip',
+                        help='采样解码（temperature > 0）的缓存策略')
+    parser.add_argument('--cache-file', help='缓存持久化文件（启动时读取，退出时写入）')
+    parser.add_argument('--semantic-encoder', default=SEMANTIC_MODEL_ENCODER,
+                        help="/search 语义检索的编码器：model（默认，复用推理模型）/ hash（不需要模型的兜底，只匹配字面）"
+                             " / 其他编码模型名称或路径 / none 关闭（见 semantic_index.py）")
+    args = parser.parse_args(argv)
+
+    from inference import Generator, load_model, read_export_info, resolve_model
+
+    extra_adapters = {}
+    for spec in args.adapters or []:
+        name, sep, path = spec.partition('=')
+        if not sep or not name or not path:
+            parser.error(f"--adapters 格式为 NAME=PATH: {spec}")
+        extra_adapters[name] = path
+    # 多 LoRA 模式不使用合并模型（合并后不能再加 LoRA）
+    model_path, adapter = resolve_model(args.base_model, args.adapter, 'none' if extra_adapters else args.merged)
+    start = time.perf_counter()
+    model, tokenizer = load_model(model_path)
+    adapters = None  # 合并模型不能再加载 LoRA
+    if not (os.path.isdir(model_path) and read_export_info(model_path)):
+        adapters = dict({DEFAULT_ADAPTER_NAME: adapter} if adapter else {}, **extra_adapters)
+        if adapters:
+            model = load_adapters(model, adapters)
+    generator = Generator(model, tokenizer, template=args.template, prefix_cache=not args.no_prefix_cache)
+    constraint = ClassNameConstraint.from_file(tokenizer, args.classes)
+    scheduler = BatchScheduler(generator, args.max_batch_size, args.max_wait_ms, constraint, adapters)
+    print(f"✓ 模型加载完成（{time.perf_counter() - start:.1f}s）: {model_path}"
+          f"{' + ' + adapter if adapter else ''}，前缀 {len(generator.prefix_ids)} token"
+          f"{'（KV cache 复用）' if generator.prefix_cache is not None else ''}")
+    if extra_adapters:
+        print(f"✓ LoRA: {', '.join(f'{name}（{size / 2 ** 20:.1f}MB）' for name, size in scheduler.adapter_sizes.items())}"
+              f"，默认 {scheduler.default_adapter}")
+
+    index = None
+    if not args.no_index:
+        index = CssIndex.from_file(args.classes)
+        print(f"✓ 类名检索索引: {len(index)} 个类")
+
+    semantic_index = None
+    if args.semantic_encoder != 'none':
+        from semantic_index import TransformerEncoder, load_encoder, load_or_build
+
+        if args.semantic_encoder == SEMANTIC_MODEL_ENCODER:
+            # 编码器名称带模型指纹，重新训练 / 导出后索引自动重建；与生成共用模型和 tokenizer，持有 scheduler.lock
+            encoder = TransformerEncoder(model, tokenizer, name=f"model-{model_fingerprint(model_path, adapter)}",
+                                         lock=scheduler.lock)
+        else:
+            encoder = load_encoder(args.semantic_encoder)
+        semantic_index = load_or_build(args.classes, encoder)
+        print(f"✓ 语义检索: {len(semantic_index)} 个类（{semantic_index.encoder.name}，{semantic_index.vectors.kind}）")
+
+    cache = None
+    if args.cache_size > 0:
+        cache = ResponseCache(model_fingerprint(model_path, adapter), args.cache_size, args.cache_ttl,
+                              args.cache_file, args.cache_sampled)
+        print(f"✓ 生成结果缓存: ≤ {args.cache_size} 条，TTL {args.cache_ttl:.0f}s，采样解码 {args.cache_sampled}"
+              f"{f'，从 {args.cache_file} 读回 {len(cache)} 条' if args.cache_file else ''}")
+
+    server = InferenceServer((args.host, args.port),
+                             make_handler(scheduler, args.max_new_tokens, index, semantic_index, cache, model_path))
+    print(f"🚀 服务已启动: http://{args.host}:{args.port}（batch ≤ {args.max_batch_size}，等待 ≤ {args.max_wait_ms}ms）",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n再见！")
+    finally:
+        server.server_close()
+        if cache is not None and args.cache_file:
+            print(f"✓ 缓存已保存: {cache.save()} 条 → {args.cache_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
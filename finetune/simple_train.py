@@ -3,25 +3,50 @@
 简化的 CSS 助手模型微调脚本 - Mac 优化版本
 使用 Transformers + PEFT (LoRA) 直接训练
 针对 Mac 性能优化，使用轻量化配置
+
+用法:
+  python simple_train.py                    # 有 checkpoint 时自动从最新的继续（--resume auto）
+  python simple_train.py --resume none      # 忽略已有 checkpoint，从头训练
+  python simple_train.py --resume css_assistant_model/checkpoint-300
 """
 
-import json
+import argparse
+import time
+
+START_TIME = time.perf_counter()  # 用于统计启动到第一个优化步的耗时
+
 import torch
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     TrainingArguments,
-    Trainer
 )
 from peft import LoraConfig, get_peft_model
-from datasets import load_dataset
+from batching import (
+    DynamicPaddingCollator,
+    LengthGroupedTrainer,
+    PackedDataset,
+    PackingCollator,
+    report_packing,
+    report_padding,
+)
+from sample_mix import load_tags, mix_report, mixture_weights, print_mix
+from token_cache import load_or_build
+from train_callbacks import ResumeCallback, resolve_checkpoint
+from training_metrics import METRICS_FILE_NAME, TrainingMetricsCallback
 import os
 
 # 配置
 MODEL_NAME = "Qwen/Qwen2.5-1.5B-Instruct"  # 基座模型（更小的 1.5B 模型）
-DATA_FILE = "training_data.json"  # 训练数据
+DATA_FILE = "training_data.json"  # 训练数据（.json / .jsonl / dataset_store 分片目录）
 OUTPUT_DIR = "./css_assistant_model"  # 输出目录
 MAX_LENGTH = 512  # 最大序列长度
+CACHE_DIR = ".token_cache"  # 预分词缓存目录（分词器/模板/MAX_LENGTH/数据不变时直接复用）
+LABEL_MODE = "assistant"  # 只在 assistant 回复上计算 loss；"all" 为整段对话（含 system/user）
+GROUP_BY_LENGTH = True  # 按长度分桶组 batch，减少 padding
+PACKING = False  # 序列打包：多条样本拼进一个 MAX_LENGTH 窗口，注意力不跨样本（开启后不再分桶）
+MIX_RATIOS = {"negative": 0.08}  # 样本类型占每个 epoch 的比例（见 sample_mix.py），{} 为保持原有占比；打包时不生效
+CLASS_BALANCE = 0.0  # 同一类型内按 className 均衡的强度（0 ~ 1），0 为不调整
 
 # LoRA 配置（轻量化，适合 Mac）
 LORA_R = 5  # LoRA 秩（从8降到5，减少可训练参数）
@@ -33,6 +58,16 @@ BATCH_SIZE = 2  # 批次大小（从4降到2，节省内存）
 GRADIENT_ACCUMULATION_STEPS = 4  # 梯度累积
 LEARNING_RATE = 2e-4  # 学习率
 NUM_EPOCHS = 3  # 训练轮数
+SAVE_STEPS = 100  # 每隔多少个优化步保存一次 checkpoint（含优化器/调度器/随机数状态）
+SAVE_TOTAL_LIMIT = 3  # 最多保留的 checkpoint 数
+METRICS_PORT = 8790  # 训练状态接口（curl localhost:8790/status），None 为不启动；指标写入 OUTPUT_DIR/training_metrics.jsonl
+
+parser = argparse.ArgumentParser(description="CSS 助手模型微调")
+parser.add_argument("--resume", default="auto",
+                    help="auto: 从 OUTPUT_DIR 下最新的 checkpoint 继续；none: 从头训练；或指定 checkpoint 路径")
+cli_args = parser.parse_args()
+
+resume_checkpoint = resolve_checkpoint(cli_args.resume, OUTPUT_DIR)
 
 print("=" * 60)
 print("CSS 助手模型微调 (Mac 优化版 - 1.5B 小模型)")
@@ -44,38 +79,34 @@ tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, trust_remote_code=True)
 tokenizer.pad_token = tokenizer.eos_token
 print(f"✓ 分词器加载完成")
 
-# 2. 加载训练数据
+# 2. 加载训练数据（套用 Qwen 对话模板 + 分词，结果缓存到磁盘）
 print("\n[2/5] 加载训练数据...")
-dataset = load_dataset("json", data_files=DATA_FILE)["train"]
-print(f"✓ 加载了 {len(dataset)} 条训练数据")
+tokenized_dataset = load_or_build(
+    DATA_FILE, tokenizer, template="simple", max_length=MAX_LENGTH, cache_root=CACHE_DIR, label_mode=LABEL_MODE
+)
+print(f"✓ 加载了 {len(tokenized_dataset)} 条训练数据")
 
 # 3. 数据预处理
 print("\n[3/5] 数据预处理...")
-def preprocess_function(examples):
-    """预处理函数 - 简化版"""
-    instruction = examples['instruction']
-    input_text = examples.get('input', '')
-    output = examples['output']
-    
-    # 格式化为 Qwen 格式
-    if input_text:
-        text = f"<|im_start|>system\n你是一个专业的 CSS 助手。<|im_end|>\n<|im_start|>user\n{instruction}\n{input_text}<|im_end|>\n<|im_start|>assistant\n{output}<|im_end|>"
-    else:
-        text = f"<|im_start|>system\n你是一个专业的 CSS 助手。<|im_end|>\n<|im_start|>user\n{instruction}<|im_end|>\n<|im_start|>assistant\n{output}<|im_end|>"
-    
-    # 编码输入
-    inputs = tokenizer(
-        text,
-        truncation=True,
-        max_length=MAX_LENGTH,
-        padding="max_length",
-        return_tensors=None  # 必须为 None
-    )
-    inputs["labels"] = inputs["input_ids"].copy()
-    return inputs
-
-tokenized_dataset = dataset.map(preprocess_function, remove_columns=dataset.column_names)
-print(f"✓ 数据集预处理完成")
+if PACKING:
+    # 打包窗口的 collator 需要模型的注意力实现和精度，加载模型后再创建
+    train_dataset = PackedDataset(tokenized_dataset, MAX_LENGTH)
+    print(f"✓ 数据集预处理完成")
+    report_packing(tokenized_dataset.lengths, train_dataset, BATCH_SIZE, GRADIENT_ACCUMULATION_STEPS)
+else:
+    # 缓存中的样本未做 padding，组 batch 时只补齐到 batch 内最长样本
+    train_dataset = tokenized_dataset
+    data_collator = DynamicPaddingCollator(tokenizer.pad_token_id, max_length=MAX_LENGTH)
+    print(f"✓ 数据集预处理完成")
+    report_padding(tokenized_dataset.lengths, BATCH_SIZE, MAX_LENGTH)
+
+sample_weights = None
+if (MIX_RATIOS or CLASS_BALANCE) and not PACKING:
+    # 读出样本类型元数据（与分词缓存同序），按目标比例算采样权重，每个 epoch 由 MixtureSampler 流式抽样
+    sample_types, sample_classes, _ = load_tags(DATA_FILE)
+    sample_weights = mixture_weights(sample_types, sample_classes, MIX_RATIOS, CLASS_BALANCE)
+    print(f"  训练样本混合（className 均衡 {CLASS_BALANCE}）:")
+    print_mix(mix_report(sample_types, sample_classes, sample_weights))
 
 # 4. LoRA 配置
 print("\n[4/5] 配置 LoRA...")
@@ -98,6 +129,8 @@ model = AutoModelForCausalLM.from_pretrained(
 
 model = get_peft_model(model, lora_config)
 model.print_trainable_parameters()  # 打印可训练参数
+if PACKING:
+    data_collator = PackingCollator(tokenizer.pad_token_id, model.config._attn_implementation, model.dtype)
 print(f"✓ LoRA 配置完成")
 
 # 5. 训练配置
@@ -110,7 +143,9 @@ training_args = TrainingArguments(
     learning_rate=LEARNING_RATE,
     logging_dir="./logs",
     logging_steps=10,
-    save_strategy="epoch"  # 每个 epoch 保存一次
+    save_strategy="steps",  # 按步保存，暂停后最多损失 SAVE_STEPS 步
+    save_steps=SAVE_STEPS,
+    save_total_limit=SAVE_TOTAL_LIMIT,
 )
 
 print(f"✓ 训练参数配置完成")
@@ -120,18 +155,38 @@ print(f"  有效批次: {BATCH_SIZE * GRADIENT_ACCUMULATION_STEPS}")
 print(f"  学习率: {LEARNING_RATE}")
 print(f"  训练轮数: {NUM_EPOCHS}")
 print(f"  LoRA 秩: {LORA_R} (轻量化配置)")
+print(f"  保存间隔: 每 {SAVE_STEPS} 步")
 
 # 开始训练
-print("\n开始训练...")
+if resume_checkpoint:
+    print(f"\n从 checkpoint 恢复训练: {resume_checkpoint}")
+    print("  （恢复 LoRA 权重、优化器、学习率调度器、随机数状态和数据顺序）")
+else:
+    print("\n开始训练...")
 print("=" * 60)
 
-trainer = Trainer(
+resume_callback = ResumeCallback(START_TIME)
+metrics_callback = TrainingMetricsCallback(os.path.join(OUTPUT_DIR, METRICS_FILE_NAME), METRICS_PORT, data_collator)
+
+trainer = LengthGroupedTrainer(
     model=model,
     args=training_args,
-    train_dataset=tokenized_dataset
+    train_dataset=train_dataset,
+    data_collator=data_collator,
+    lengths=tokenized_dataset.lengths if GROUP_BY_LENGTH and not PACKING else None,
+    sample_weights=sample_weights,
+    callbacks=[resume_callback, metrics_callback],
 )
 
-trainer.train()
+train_result = trainer.train(resume_from_checkpoint=resume_checkpoint)
+runtime = train_result.metrics["train_runtime"]
+print(f"  优化步数: {trainer.state.global_step}，实际 padding 效率: {data_collator.efficiency:.1%}，"
+      f"有效吞吐: {data_collator.real_tokens / runtime:.0f} tokens/s")
+
+if resume_callback.interrupted:
+    print(f"\n⏸️  训练已暂停，checkpoint 保存在: {OUTPUT_DIR}/checkpoint-{trainer.state.global_step}")
+    print("  恢复训练: python simple_train.py（或 ./scripts/resume_training.sh）")
+    raise SystemExit(0)
 
 # 保存模型
 print("\n保存模型...")
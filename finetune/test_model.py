@@ -1,75 +1,55 @@
 #!/usr/bin/env python3
 """
 CSS 助手模型测试脚本
-使用训练好的 LoRA 模型生成 CSS 代码
+使用训练好的 LoRA 模型生成 CSS 代码（生成逻辑见 inference.py，与 serve.py 共用）
+存在 export_model.py 导出的合并模型时直接加载它，不再每次启动时套 LoRA
+COMPARE_ADAPTERS 非空时对比多个 LoRA：基座只加载一次，每个测试用例在所有 LoRA 上一起生成
 """
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
-import torch
+import time
+
+from css_index import CssIndex
+from inference import Generator, generate_css, load_adapters, load_model, resolve_model, stream_css
 
 # 配置
 BASE_MODEL = "Qwen/Qwen2.5-1.5B-Instruct"
 ADAPTER_PATH = "./css_assistant_model"
+MERGED_PATH = "./css_assistant_merged"  # python export_model.py 导出；CPU 上可改为 ./css_assistant_merged-int8
+MAX_NEW_TOKENS = 256  # 最多生成的 token 数（遇到 <|im_end|> 提前停止）
+STREAM = True  # 交互模式逐 token 输出，并显示首 token 延迟和 tokens/s
+USE_INDEX = True  # 交互模式先查类名检索索引（css_classes.json），置信度不足才调用模型
+# 对比多个 LoRA（名称: 目录），例如 {"r5": "./css_assistant_model", "r16": "./css_assistant_model_v2"}；
+# 交互模式使用第一个
+COMPARE_ADAPTERS = {}
 
 print("=" * 60)
 print("CSS 助手模型测试")
 print("=" * 60)
 print("\n[1/2] 加载模型中...")
 
-# 加载基座模型
-base_model = AutoModelForCausalLM.from_pretrained(
-    BASE_MODEL,
-    device_map="auto",
-    torch_dtype=torch.float16,
-    trust_remote_code=True
-)
-
-# 加载分词器
-tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL, trust_remote_code=True)
+# 优先加载合并模型，否则基座模型 + LoRA 权重
+start = time.perf_counter()
+if COMPARE_ADAPTERS:
+    model_path, adapter_path = BASE_MODEL, None
+    model, tokenizer = load_model(BASE_MODEL)
+    model = load_adapters(model, COMPARE_ADAPTERS)
+else:
+    model_path, adapter_path = resolve_model(BASE_MODEL, ADAPTER_PATH, MERGED_PATH)
+    model, tokenizer = load_model(model_path, adapter_path)
+# 系统提示前缀的 KV cache 只计算一次，之后每次生成直接复用
+generator = Generator(model, tokenizer, template="simple")
 
-# 加载 LoRA 权重
-model = PeftModel.from_pretrained(base_model, ADAPTER_PATH)
-model.eval()
-
-print("✓ 模型加载完成")
-print(f"  基座模型: {BASE_MODEL}")
-print(f"  LoRA 权重: {ADAPTER_PATH}")
-
-def generate_css(prompt, max_length=512, temperature=0.7, top_p=0.9):
-    """
-    生成 CSS 代码
-    
-    参数:
-        prompt: 用户提示词
-        max_length: 最大生成长度
-        temperature: 温度参数 (0.1-1.0, 越低越确定)
-        top_p: nucleus sampling 参数
-    """
-    # 格式化为 Qwen 对话格式
-    text = f"<|im_start|>system\n你是一个专业的 CSS 助手。<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
-    
-    # 分词
-    inputs = tokenizer(text, return_tensors="pt").to(model.device)
-    
-    # 生成
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_length=max_length,
-            temperature=temperature,
-            top_p=top_p,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id
-        )
-    
-    # 解码
-    result = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # 提取 assistant 回复部分
-    if "<|im_start|>assistant\n" in result:
-        return result.split("<|im_start|>assistant\n")[-1].strip()
-    return result
+print(f"✓ 模型加载完成（{time.perf_counter() - start:.1f}s）")
+if COMPARE_ADAPTERS:
+    print(f"  基座模型: {BASE_MODEL}")
+    for name, path in COMPARE_ADAPTERS.items():
+        print(f"  LoRA {name}: {path}")
+elif adapter_path:
+    print(f"  基座模型: {BASE_MODEL}")
+    print(f"  LoRA 权重: {adapter_path}")
+    print("  💡 python export_model.py 导出合并模型后启动更快")
+else:
+    print(f"  模型: {model_path}")
 
 print("\n[2/2] 运行测试用例...")
 print("=" * 60)
@@ -86,8 +66,19 @@ for i, prompt in enumerate(test_prompts, 1):
     print("-" * 60)
     
     try:
-        result = generate_css(prompt, temperature=0.7)
-        print(result)
+        if COMPARE_ADAPTERS:
+            # 所有 LoRA 在同一批里生成
+            start = time.perf_counter()
+            names = list(COMPARE_ADAPTERS)
+            results = generator.generate([prompt] * len(names), max_new_tokens=MAX_NEW_TOKENS, temperature=0.7,
+                                         top_p=0.9, adapters=names)
+            for name, result in zip(names, results):
+                print(f"[{name}] {result}")
+            print(f"（耗时 {time.perf_counter() - start:.2f}s）")
+        else:
+            result, seconds = generate_css(generator, prompt, max_new_tokens=MAX_NEW_TOKENS, temperature=0.7)
+            print(result)
+            print(f"（耗时 {seconds:.2f}s）")
     except Exception as e:
         print(f"❌ 生成失败: {e}")
     
@@ -98,10 +89,11 @@ print("✓ 测试完成")
 print("\n💡 使用提示:")
 print("  - 修改 test_prompts 列表添加自己的测试用例")
 print("  - 调整 temperature (0.1-1.0) 控制生成随机性")
-print("  - 调整 max_length 控制生成长度")
+print("  - 调整 MAX_NEW_TOKENS 控制生成长度，STREAM = False 关闭交互模式的流式输出")
 print("=" * 60)
 
 # 交互模式
+index = CssIndex.from_file() if USE_INDEX else None
 print("\n进入交互模式（输入 'quit' 退出）:")
 print("-" * 60)
 
@@ -116,10 +108,30 @@ while True:
         if not user_input:
             continue
         
+        if index is not None:
+            start = time.perf_counter()
+            match = index.lookup(user_input)
+            if match is not None:
+                print("-" * 60)
+                print(match.answer)
+                print(f"（索引命中: {match.kind}，{(time.perf_counter() - start) * 1e6:.0f}µs）")
+                print("-" * 60)
+                continue
+
+        if STREAM:
+            print("-" * 60)
+            result, stats = stream_css(generator, user_input, max_new_tokens=MAX_NEW_TOKENS, temperature=0.7)
+            first = f"{stats['first_token_s']:.2f}s" if stats['first_token_s'] is not None else "-"
+            print(f"\n（首 token {first}，{stats['tokens']} tokens，{stats['tokens_per_s']:.1f} tokens/s，"
+                  f"耗时 {stats['seconds']:.2f}s）")
+            print("-" * 60)
+            continue
+
         print("\n生成中...")
-        result = generate_css(user_input, temperature=0.7)
+        result, seconds = generate_css(generator, user_input, max_new_tokens=MAX_NEW_TOKENS, temperature=0.7)
         print("-" * 60)
         print(result)
+        print(f"（耗时 {seconds:.2f}s）")
         print("-" * 60)
         
     except KeyboardInterrupt:
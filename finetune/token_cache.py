@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+预分词缓存：套用对话模板 + 分词只做一次，结果以内存映射文件保存在磁盘上
+
+缓存目录 <cache_root>/<key>/:
+  input_ids.bin    int32，所有样本的 token 拼接在一起（不做 padding）
+  label_mask.bin   uint8，1 表示该位置计入 loss（assistant 模式下只有 assistant 回复计入）
+  offsets.bin      int64，第 i 条样本为 [offsets[i], offsets[i+1])
+  meta.json        缓存键的组成、样本数、token 数
+  hf_dataset-<N>/  （按需）前 N 条样本导出的 datasets 格式，供 LLaMA-Factory 的 tokenized_path 直接加载
+
+缓存键覆盖：分词器（名称 + 词表内容）、对话模板、MAX_LENGTH、label 模式和训练数据内容哈希，
+任一变化都会生成新的缓存；否则下次启动（包括从 checkpoint 恢复）直接内存映射。
+样本不做 padding，attention mask 全为 1，由 collator 在组 batch 时补齐。
+
+用法:
+  python token_cache.py --data training_data.json --tokenizer Qwen/Qwen2.5-1.5B-Instruct --template simple
+  python token_cache.py --data training_data.json --label-mode all   # system/user 部分也计入 loss
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from chat_format import ASSISTANT_PREFIX, TEMPLATES, format_sample, template_signature
+
+DEFAULT_CACHE_ROOT = ".token_cache"
+CACHE_VERSION = 1
+TOKENIZE_BATCH_SIZE = 1000
+IGNORE_INDEX = -100  # 不计入 loss 的 label
+# label 模式：assistant 只在 assistant 回复（含 <|im_end|>）上计算 loss；all 为整段对话
+LABEL_MODES = ('assistant', 'all')
+
+
+def hash_data(path):
+    """训练数据的内容哈希（文件或分片目录）"""
+    digest = hashlib.blake2b(digest_size=16)
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    else:
+        files = [path]
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_tokenizer(tokenizer):
+    """分词器的内容哈希：词表 + 特殊 token"""
+    digest = hashlib.blake2b(digest_size=16)
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    if backend is not None:
+        digest.update(backend.to_str().encode('utf-8'))
+    else:
+        digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode('utf-8'))
+    digest.update(json.dumps(tokenizer.all_special_tokens).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_key_fields(data_path, tokenizer, template, max_length, label_mode='assistant'):
+    return {
+        'version': CACHE_VERSION,
+        'tokenizer': getattr(tokenizer, 'name_or_path', ''),
+        'tokenizer_hash': hash_tokenizer(tokenizer),
+        'template': template_signature(template),
+        'max_length': max_length,
+        'label_mode': label_mode,
+        'data_hash': hash_data(data_path),
+    }
+
+
+def cache_key(fields):
+    payload = json.dumps(fields, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=12).hexdigest()
+
+
+class TokenizedDataset:
+    """
+    内存映射的预分词数据集，可直接作为 Trainer 的 train_dataset
+
+    __getitem__ 返回未 padding 的 input_ids / attention_mask / labels
+    limit 只使用前 limit 条样本（对应 max_samples）
+    """
+
+    def __init__(self, cache_dir, limit=None):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.offsets = np.fromfile(os.path.join(cache_dir, 'offsets.bin'), dtype=np.int64)
+        if limit is not None:
+            self.offsets = self.offsets[:limit + 1]
+        num_tokens = int(self.offsets[-1])
+        self.input_ids = self._memmap('input_ids.bin', np.int32, num_tokens)
+        self.label_mask = self._memmap('label_mask.bin', np.uint8, num_tokens)
+
+    def _memmap(self, name, dtype, length):
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.cache_dir, name), dtype=dtype, mode='r', shape=(length,))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        """每条样本的 token 数"""
+        return np.diff(self.offsets)
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        input_ids = np.asarray(self.input_ids[start:end], dtype=np.int64)
+        labels = np.where(self.label_mask[start:end] == 1, input_ids, IGNORE_INDEX)
+        return {
+            'input_ids': input_ids.tolist(),
+            'attention_mask': [1] * len(input_ids),
+            'labels': labels.tolist(),
+        }
+
+
+def assistant_label_mask(flat_ids, lengths, prefix_ids):
+    """
+    一批样本（token 拼接在一起）的 assistant label mask，全部用 numpy 向量化计算
+
+    在 token 序列中查找 assistant 起始标记，每条样本从最后一个完整出现的标记之后开始计入 loss；
+    找不到标记（被截断）的样本整条都不计入。
+
+    参数:
+        flat_ids: 所有样本拼接后的 token 数组
+        lengths: 每条样本的 token 数
+        prefix_ids: ASSISTANT_PREFIX 分词后的 token 序列
+    """
+    flat_ids = np.asarray(flat_ids)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    ends = starts + lengths
+    width = len(prefix_ids)
+
+    # 滑动窗口逐位比较，hit[i] 表示 flat_ids[i:i + width] == prefix_ids
+    num_windows = max(len(flat_ids) - width + 1, 0)
+    hit = np.ones(num_windows, dtype=bool)
+    for k, token in enumerate(prefix_ids):
+        hit &= flat_ids[k:k + num_windows] == token
+    match = np.flatnonzero(hit)
+
+    # 标记必须完整落在同一条样本内
+    owner = np.searchsorted(starts, match, side='right') - 1
+    valid = match + width <= ends[owner]
+    label_start = np.full(len(lengths), -1, dtype=np.int64)
+    np.maximum.at(label_start, owner[valid], match[valid] + width)
+    label_start = np.where(label_start >= 0, label_start, ends)
+
+    positions = np.arange(len(flat_ids))
+    return (positions >= np.repeat(label_start, lengths)).astype(np.uint8)
+
+
+def export_hf_dataset(dataset, path=None):
+    """
+    把预分词结果导出为 datasets 格式（save_to_disk，DatasetDict 的 train split），返回导出目录
+
+    列为 input_ids / attention_mask / labels，LLaMA-Factory 设置 tokenized_path 后直接加载，不再重新分词。
+    导出结果放在缓存目录下，缓存键不变时重复调用直接返回。
+    """
+    import pyarrow as pa
+    from datasets import Dataset, DatasetDict
+
+    path = path or os.path.join(dataset.cache_dir, f'hf_dataset-{len(dataset)}')
+    if os.path.exists(os.path.join(path, 'dataset_dict.json')):
+        return path
+
+    num_tokens = int(dataset.offsets[-1])
+    input_ids = np.asarray(dataset.input_ids[:num_tokens], dtype=np.int32)
+    labels = np.where(dataset.label_mask[:num_tokens] == 1, input_ids, IGNORE_INDEX).astype(np.int32)
+    # 直接用偏移构造 list 列，不逐条转换 Python 对象
+    offsets = pa.array(dataset.offsets.astype(np.int32))
+    table = pa.table({
+        'input_ids': pa.ListArray.from_arrays(offsets, pa.array(input_ids)),
+        'attention_mask': pa.ListArray.from_arrays(offsets, pa.array(np.ones(num_tokens, dtype=np.int32))),
+        'labels': pa.ListArray.from_arrays(offsets, pa.array(labels)),
+    })
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    DatasetDict({'train': Dataset(table)}).save_to_disk(tmp_path)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def build_cache(samples, tokenizer, template, max_length, cache_dir, fields):
+    """分批套模板 + 分词，写出缓存目录（先写临时目录再替换）"""
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    label_mode = fields.get('label_mode', 'all')
+    prefix_ids = tokenizer(ASSISTANT_PREFIX, add_special_tokens=False)['input_ids']
+    offsets = [0]
+    num_label_tokens = 0
+    num_unlabeled = 0
+    with open(os.path.join(tmp_dir, 'input_ids.bin'), 'wb') as ids_file, \
+            open(os.path.join(tmp_dir, 'label_mask.bin'), 'wb') as mask_file:
+
+        def flush(batch):
+            nonlocal num_label_tokens, num_unlabeled
+            texts = [format_sample(sample, template) for sample in batch]
+            encoded = tokenizer(texts, truncation=True, max_length=max_length)['input_ids']
+            lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+            flat_ids = np.fromiter(
+                (token for ids in encoded for token in ids), dtype=np.int32, count=int(lengths.sum())
+            )
+            if label_mode == 'assistant':
+                mask = assistant_label_mask(flat_ids, lengths, prefix_ids)
+            else:
+                mask = np.ones(len(flat_ids), dtype=np.uint8)
+            flat_ids.tofile(ids_file)
+            mask.tofile(mask_file)
+            offsets.extend((offsets[-1] + np.cumsum(lengths)).tolist())
+            owner = np.repeat(np.arange(len(lengths)), lengths)
+            per_sample = np.bincount(owner, weights=mask, minlength=len(lengths))
+            num_label_tokens += int(mask.sum())
+            num_unlabeled += int((per_sample == 0).sum())
+
+        batch = []
+        for sample in samples:
+            batch.append(sample)
+            if len(batch) >= TOKENIZE_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    np.asarray(offsets, dtype=np.int64).tofile(os.path.join(tmp_dir, 'offsets.bin'))
+    meta = dict(
+        fields,
+        num_samples=len(offsets) - 1,
+        num_tokens=offsets[-1],
+        num_label_tokens=num_label_tokens,
+        num_unlabeled_samples=num_unlabeled,  # 截断后没有 assistant 回复的样本
+        created=time.time(),
+    )
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+def load_or_build(data_path, tokenizer, template='simple', max_length=512,
+                  cache_root=DEFAULT_CACHE_ROOT, label_mode='assistant', limit=None):
+    """
+    返回 TokenizedDataset：缓存命中时直接内存映射，否则分词后写入缓存
+
+    参数:
+        data_path: 训练数据（.json / .jsonl / dataset_store 分片目录）
+        tokenizer: Hugging Face 分词器
+        template: chat_format.TEMPLATES 中的模板名
+        max_length: 截断长度
+        cache_root: 缓存根目录
+        label_mode: 'assistant' 只在 assistant 回复上计算 loss，'all' 为整段对话
+        limit: 只使用前 limit 条样本（缓存仍包含全部数据）
+    """
+    if template not in TEMPLATES:
+        raise ValueError(f"未知模板: {template}（可选: {', '.join(TEMPLATES)}）")
+    if label_mode not in LABEL_MODES:
+        raise ValueError(f"未知 label 模式: {label_mode}（可选: {', '.join(LABEL_MODES)}）")
+
+    fields = cache_key_fields(data_path, tokenizer, template, max_length, label_mode)
+    cache_dir = os.path.join(cache_root, cache_key(fields))
+
+    if os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        dataset = TokenizedDataset(cache_dir, limit)
+        print(f"✓ 命中预分词缓存: {cache_dir} ({len(dataset)} 条)")
+        return dataset
+
+    from dataset_store import iter_samples
+
+    start = time.perf_counter()
+    os.makedirs(cache_root, exist_ok=True)
+    build_cache(iter_samples(data_path), tokenizer, template, max_length, cache_dir, fields)
+    dataset = TokenizedDataset(cache_dir, limit)
+    print(f"✓ 预分词完成: {len(dataset)} 条，{time.perf_counter() - start:.1f}s -> {cache_dir}")
+    if dataset.meta['num_unlabeled_samples']:
+        print(f"⚠️  {dataset.meta['num_unlabeled_samples']} 条样本截断后没有 assistant 回复，不计入 loss")
+    return dataset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="预分词并写入缓存")
+    parser.add_argument('--data', default='training_data.json', help='训练数据')
+    parser.add_argument('--tokenizer', default='Qwen/Qwen2.5-1.5B-Instruct', help='分词器名称或路径')
+    parser.add_argument('--template', choices=sorted(TEMPLATES), default='simple')
+    parser.add_argument('--max-length', type=int, default=512)
+    parser.add_argument('--cache-root', default=DEFAULT_CACHE_ROOT)
+    parser.add_argument('--label-mode', choices=LABEL_MODES, default='assistant')
+    args = parser.parse_args(argv)
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    dataset = load_or_build(args.data, tokenizer, args.template, args.max_length, args.cache_root,
+                            args.label_mode)
+    lengths = dataset.lengths
+    print(f"  样本数: {len(dataset)}，token 总数: {int(lengths.sum())}，"
+          f"平均长度: {lengths.mean():.1f}，最长: {int(lengths.max())}")
+    print(f"  计入 loss 的 token: {int(dataset.label_mask.sum())}（{dataset.label_mask.mean():.1%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
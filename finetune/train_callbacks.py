@@ -0,0 +1,52 @@
+"""
+训练脚本共用的 checkpoint 恢复 / 暂停逻辑（simple_train.py、finetune.py）
+"""
+
+import os
+import signal
+import time
+
+from transformers import TrainerCallback
+from transformers.trainer_utils import get_last_checkpoint
+
+
+def resolve_checkpoint(resume, output_dir):
+    """
+    解析 --resume 参数
+
+      - auto: output_dir 下最新的 checkpoint-*，没有则返回 None
+      - none: 从头训练
+      - 其他: 视为 checkpoint 路径
+    """
+    if resume == "auto":
+        return get_last_checkpoint(output_dir) if os.path.isdir(output_dir) else None
+    if resume == "none":
+        return None
+    if not os.path.isdir(resume):
+        raise FileNotFoundError(f"checkpoint 不存在: {resume}")
+    return resume
+
+
+class ResumeCallback(TrainerCallback):
+    """记录启动到第一个优化步的耗时；收到 SIGINT（pause_training.sh）时在当前步结束后保存并退出"""
+
+    def __init__(self, start_time=None):
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.first_step_seconds = None
+        self.interrupted = False
+        signal.signal(signal.SIGINT, self._on_sigint)
+
+    def _on_sigint(self, signum, frame):
+        if self.interrupted:
+            raise KeyboardInterrupt
+        self.interrupted = True
+        print("\n⏸️  收到中断信号，当前步结束后保存 checkpoint 并退出（再次 Ctrl+C 立即退出）")
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.first_step_seconds is None:
+            self.first_step_seconds = time.perf_counter() - self.start_time
+            print(f"\n⏱️  启动到第一个优化步: {self.first_step_seconds:.1f}s（global_step={state.global_step}）")
+        if self.interrupted:
+            control.should_save = True
+            control.should_training_stop = True
+        return control
@@ -0,0 +1,323 @@
+"""
+训练过程指标（simple_train.py、finetune.py 共用）：吞吐、padding、各阶段耗时、内存、ETA
+
+TrainingMetricsCallback 每个优化步记录:
+  - 耗时拆分: data（取 batch + 拷到设备）/ forward（含 loss）/ backward（最后一个 micro-batch 含梯度裁剪）/
+              optimizer（optimizer.step + 学习率调度 + 清梯度）
+  - tokens: 真实 token 数和 padding 后的 token 数（优先取 collator 的计数，否则按 attention_mask 统计）
+  - 内存: 进程 RSS（当前 / 峰值），GPU 显存（当前 / 区间峰值）或 MPS 已分配显存
+  - ETA: 剩余步数 × 最近区间的平均步耗时
+
+每次 Trainer 打印 loss（logging_steps）时把这一区间的平均值追加一行到 JSONL，并打印一行摘要；
+可选在本地起一个状态接口:
+  GET /status   -> {"step": ..., "max_steps": ..., "eta_s": ..., "latest": {最近一条记录}}
+  GET /history  -> 最近的记录（?n=100）
+
+用法:
+  callback = TrainingMetricsCallback("css_assistant_model/training_metrics.jsonl", port=8790,
+                                     collator=data_collator)
+  curl -s localhost:8790/status
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import torch
+from transformers import TrainerCallback
+
+METRICS_FILE_NAME = "training_metrics.jsonl"
+DEFAULT_METRICS_PORT = 8790
+HISTORY_SIZE = 1000  # 状态接口保留的记录数
+PHASES = ('data', 'forward', 'backward', 'optimizer')
+
+
+def current_rss_mb():
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # macOS 为字节，Linux 为 KB
+
+
+def device_memory_mb():
+    """(当前已分配, 上次调用以来的峰值)，CPU 上为 (None, None)"""
+    if torch.cuda.is_available():
+        current = torch.cuda.memory_allocated() / 2 ** 20
+        peak = torch.cuda.max_memory_allocated() / 2 ** 20
+        torch.cuda.reset_peak_memory_stats()
+        return current, peak
+    if torch.backends.mps.is_available():
+        return torch.mps.current_allocated_memory() / 2 ** 20, torch.mps.driver_allocated_memory() / 2 ** 20
+    return None, None
+
+
+class TrainingMetricsCallback(TrainerCallback):
+    """
+    训练指标回调
+
+    参数:
+        path: JSONL 文件路径（追加写入，从 checkpoint 恢复时接着写）
+        port: 状态接口端口，None 为不启动；端口被占用时只打印提示，不影响训练
+        collator: 带 real_tokens / padded_tokens 计数的 collator（batching.py），None 时按 attention_mask 统计
+        sync: 计时前同步 GPU/MPS（异步执行时不同步会把耗时算到后面的阶段）
+    """
+
+    def __init__(self, path, port=DEFAULT_METRICS_PORT, collator=None, sync=True):
+        self.path = path
+        self.port = port
+        self.collator = collator
+        self.sync = sync
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.status = {'state': 'starting'}
+        self._lock = threading.Lock()
+        self._hooks = []
+        self._server = None
+        self._window = []  # 上次写入以来每一步的指标
+        self._step = None  # 当前步累计的耗时 / token 数
+        self._mark = None  # 上一个计时点
+        self._forward_start = None
+        self._collator_tokens = (0, 0)
+
+    # ========== 计时 ==========
+    def _now(self):
+        if self.sync:
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            elif torch.backends.mps.is_available():
+                torch.mps.synchronize()
+        return time.perf_counter()
+
+    def _new_step(self):
+        return dict({phase: 0.0 for phase in PHASES}, real_tokens=0, padded_tokens=0)
+
+    def _lap(self, phase):
+        now = self._now()
+        if self._step is not None and self._mark is not None:
+            self._step[phase] += now - self._mark
+        self._mark = now
+        return now
+
+    def _forward_pre_hook(self, module, args, kwargs):
+        if not module.training:
+            return
+        if self._step is None:
+            self._step = self._new_step()
+        self._forward_start = self._lap('data')
+        if self.collator is None:
+            input_ids = kwargs.get('input_ids', args[0] if args else None)
+            mask = kwargs.get('attention_mask')
+            if input_ids is not None:
+                self._step['padded_tokens'] += input_ids.numel()
+                self._step['real_tokens'] += int(mask.sum()) if mask is not None and mask.dim() == 2 \
+                    else input_ids.numel()
+
+    def _forward_hook(self, module, args, kwargs, output):
+        if module.training and self._forward_start is not None:
+            self._lap('forward')
+
+    # ========== Trainer 回调 ==========
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if model is not None:
+            self._hooks = [
+                model.register_forward_pre_hook(self._forward_pre_hook, with_kwargs=True),
+                model.register_forward_hook(self._forward_hook, with_kwargs=True),
+            ]
+        if self.collator is not None:
+            self._collator_tokens = (self.collator.real_tokens, self.collator.padded_tokens)
+        self.train_start = time.time()
+        self.status = {'state': 'training', 'pid': os.getpid(), 'metrics_file': self.path,
+                       'max_steps': state.max_steps, 'started_at': self.train_start}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if self.port is not None:
+            self._start_server()
+        self._mark = self._now()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step = self._new_step()
+        self._step_start = self._mark  # 上一步结束的时间，取 batch 的耗时也算在这一步
+        self._lap('data')
+
+    def on_substep_end(self, args, state, control, **kwargs):
+        self._lap('backward')
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self._lap('backward')
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._step is None:
+            return
+        now = self._lap('optimizer')
+        step = self._step
+        step['seconds'] = now - self._step_start
+        if self.collator is not None:
+            real, padded = self.collator.real_tokens, self.collator.padded_tokens
+            step['real_tokens'] = real - self._collator_tokens[0]
+            step['padded_tokens'] = padded - self._collator_tokens[1]
+            self._collator_tokens = (real, padded)
+        self._window.append(step)
+        self._step = None
+        remaining = max(state.max_steps - state.global_step, 0)
+        recent = self._window[-20:]
+        with self._lock:
+            self.status.update(step=state.global_step, epoch=state.epoch,
+                               eta_s=remaining * sum(s['seconds'] for s in recent) / len(recent))
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        logs = logs or {}
+        if 'loss' in logs and self._window:
+            self._flush(state, logs)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self._window:
+            self._flush(state, {})
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        with self._lock:
+            self.status['state'] = 'finished'
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # ========== 记录 ==========
+    def _flush(self, state, logs):
+        window, self._window = self._window, []
+        seconds = sum(s['seconds'] for s in window)
+        real = sum(s['real_tokens'] for s in window)
+        padded = sum(s['padded_tokens'] for s in window)
+        device_mem, device_peak = device_memory_mb()
+        rss = current_rss_mb()
+        record = {
+            'step': state.global_step,
+            'epoch': state.epoch,
+            'time': time.time(),
+            'elapsed_s': time.time() - self.train_start,
+            'steps': len(window),
+            'step_s': seconds / len(window),
+            **{f"{phase}_s": sum(s[phase] for s in window) / len(window) for phase in PHASES},
+            'tokens_per_s': real / seconds if seconds else 0.0,
+            'padded_tokens_per_s': padded / seconds if seconds else 0.0,
+            'real_tokens_per_step': real / len(window),
+            'padded_tokens_per_step': padded / len(window),
+            'padding_efficiency': real / padded if padded else None,
+            'rss_mb': rss,
+            'peak_rss_mb': max(peak_rss_mb(), rss or 0),
+            'device_mem_mb': device_mem,
+            'device_peak_mb': device_peak,
+            'eta_s': max(state.max_steps - state.global_step, 0) * seconds / len(window),
+            **{key: logs[key] for key in ('loss', 'learning_rate', 'grad_norm') if key in logs},
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        with self._lock:
+            self.history.append(record)
+            self.status.update(latest=record, eta_s=record['eta_s'])
+        print(format_record(record, state.max_steps))
+
+    # ========== 状态接口 ==========
+    def _start_server(self):
+        callback = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                with callback._lock:
+                    if url.path == '/status':
+                        payload, status = dict(callback.status), 200
+                    elif url.path == '/history':
+                        n = int(parse_qs(url.query).get('n', ['100'])[0])
+                        payload, status = list(callback.history)[-n:], 200
+                    else:
+                        payload, status = {'error': 'not found'}, 404
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        except OSError as e:
+            print(f"⚠️  训练状态接口启动失败（端口 {self.port}）: {e}，只写 {self.path}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        print(f"📈 训练状态: http://127.0.0.1:{self.port}/status，指标写入 {self.path}")
+
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def format_record(record, max_steps=None):
+    """一条记录的单行摘要（monitor_training.sh 也用它）"""
+    total = record['step_s'] or 1.0
+    phases = ' '.join(f"{phase} {record[f'{phase}_s'] / total:.0%}" for phase in PHASES)
+    memory = f"RSS {record['peak_rss_mb'] / 1024:.1f}GB"
+    if record.get('device_peak_mb') is not None:
+        memory += f"，显存 {record['device_peak_mb'] / 1024:.1f}GB"
+    padding = f"，padding 效率 {record['padding_efficiency']:.0%}" if record.get('padding_efficiency') else ''
+    return (f"📈 step {record['step']}{f'/{max_steps}' if max_steps else ''} | "
+            f"{record['tokens_per_s']:.0f} tokens/s{padding} | {record['step_s']:.2f}s/步（{phases}）| "
+            f"{memory} | ETA {format_eta(record['eta_s'])}")
+
+
+def main(argv=None):
+    """打印状态接口或 JSONL 文件的最新记录（monitor_training.sh 调用）"""
+    import argparse
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description="查看训练指标")
+    parser.add_argument('--port', type=int, default=DEFAULT_METRICS_PORT)
+    parser.add_argument('--file', help=f'状态接口不可用时读取的 JSONL（例如 css_assistant_model/{METRICS_FILE_NAME}）')
+    args = parser.parse_args(argv)
+
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/status", timeout=1) as response:
+            status = json.loads(response.read())
+        latest = status.get('latest')
+        print(f"状态接口: {status['state']}，step {status.get('step', 0)}/{status['max_steps']}，"
+              f"ETA {format_eta(status.get('eta_s') or 0)}")
+        if latest:
+            print(format_record(latest, status['max_steps']))
+        return 0
+    except OSError:
+        pass
+    if args.file and os.path.exists(args.file):
+        with open(args.file, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        if lines:
+            print(f"{args.file}（最后一条）:")
+            print(format_record(json.loads(lines[-1])))
+            return 0
+    print("暂无训练指标")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())